@@ -0,0 +1,196 @@
+"""
+캐릭터 프롬프트(char_prompts) 중복 제거 / 정리.
+
+캐릭터 수정 때마다 새 프롬프트 행을 추가하면 내용이 같아도 행이 늘어나므로,
+페르소나 필드로 content_hash 를 계산해 같은 캐릭터에 같은 내용의 행이 있으면 그 행을 재사용합니다.
+- save_character_prompt       : 같은 내용이면 기존 행 재사용 (최신이 아니면 created_at 만 갱신해 최신으로), 아니면 새 행 추가
+- compact_character_prompts   : 최신 프롬프트가 아니고 어떤 채팅방(chat_rooms.char_prompt_id)도 참조하지 않는 행 삭제 (주기 실행)
+
+사용법 (app 디렉토리에서 실행):
+    python character_prompts.py migrate   # content_hash 컬럼 추가, 기존 행 해시 계산, 인덱스 생성
+    python character_prompts.py compact   # 정리 한 번 실행
+"""
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import argparse
+import hashlib
+import json
+import os
+
+from database import SessionLocal, engine, CharacterPrompt
+
+# .env 파일 로드
+load_dotenv()
+
+COMPACTION_INTERVAL = float(os.getenv("PROMPT_COMPACTION_INTERVAL", "3600"))  # 초
+COMPACTION_BATCH = 1000  # 한 번에 삭제할 최대 행 수
+
+
+def prompt_content_hash(appearance, personality, background, speech_style, example_dialogues) -> str:
+    """
+    페르소나 필드의 SHA-256. example_dialogues 는 저장 형식(JSON 문자열 목록)을 그대로 사용.
+    """
+    payload = json.dumps(
+        [appearance, personality, background, speech_style, list(example_dialogues or [])],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def latest_prompt_id(db: Session, char_idx: int):
+    return (
+        db.query(CharacterPrompt.char_prompt_id)
+        .filter(CharacterPrompt.char_idx == char_idx)
+        .order_by(CharacterPrompt.created_at.desc(), CharacterPrompt.char_prompt_id.desc())
+        .limit(1)
+        .scalar()
+    )
+
+
+def save_character_prompt(
+    db: Session,
+    char_idx: int,
+    character_appearance: str,
+    character_personality: str,
+    character_background: str,
+    character_speech_style: str,
+    example_dialogues=None,
+) -> CharacterPrompt:
+    """
+    캐릭터의 최신 프롬프트를 저장. 커밋은 호출한 쪽 트랜잭션에서 함께 수행.
+    """
+    content_hash = prompt_content_hash(
+        character_appearance, character_personality, character_background, character_speech_style, example_dialogues
+    )
+    existing = (
+        db.query(CharacterPrompt)
+        .filter(CharacterPrompt.char_idx == char_idx, CharacterPrompt.content_hash == content_hash)
+        .order_by(CharacterPrompt.created_at.desc())
+        .first()
+    )
+    if existing:
+        # 예전 내용으로 되돌린 경우 "최신 프롬프트"(max(created_at)) 조회에 잡히도록 시각만 갱신
+        if latest_prompt_id(db, char_idx) != existing.char_prompt_id:
+            existing.created_at = func.now()
+        return existing
+
+    new_prompt = CharacterPrompt(
+        char_idx=char_idx,
+        character_appearance=character_appearance,
+        character_personality=character_personality,
+        character_background=character_background,
+        character_speech_style=character_speech_style,
+        example_dialogues=example_dialogues,
+        content_hash=content_hash,
+    )
+    db.add(new_prompt)
+    return new_prompt
+
+
+# 최신이 아니고(같은 캐릭터에 더 최근 행이 있음) 채팅방이 참조하지 않는 프롬프트
+SUPERSEDED_SQL = text(
+    """
+    SELECT p.char_prompt_id
+    FROM char_prompts p
+    WHERE EXISTS (
+        SELECT 1 FROM char_prompts newer
+        WHERE newer.char_idx = p.char_idx
+          AND (newer.created_at, newer.char_prompt_id) > (p.created_at, p.char_prompt_id)
+    )
+    AND NOT EXISTS (SELECT 1 FROM chat_rooms r WHERE r.char_prompt_id = p.char_prompt_id)
+    ORDER BY p.char_prompt_id
+    LIMIT :limit
+    """
+)
+
+# 조회 이후 생성된 채팅방이 참조하게 되었거나, 되돌리기로 다시 최신이 된 행은 삭제하지 않도록 다시 확인
+DELETE_SQL = text(
+    """
+    DELETE FROM char_prompts p
+    WHERE p.char_prompt_id = ANY(:ids)
+      AND EXISTS (
+          SELECT 1 FROM char_prompts newer
+          WHERE newer.char_idx = p.char_idx
+            AND (newer.created_at, newer.char_prompt_id) > (p.created_at, p.char_prompt_id)
+      )
+      AND NOT EXISTS (SELECT 1 FROM chat_rooms r WHERE r.char_prompt_id = p.char_prompt_id)
+    """
+)
+
+
+def compact_character_prompts(db: Session = None) -> int:
+    """
+    더 이상 쓰이지 않는 프롬프트 행을 배치 단위로 삭제. 삭제한 행 수를 반환.
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    deleted = 0
+    try:
+        while True:
+            ids = [row[0] for row in db.execute(SUPERSEDED_SQL, {"limit": COMPACTION_BATCH})]
+            if not ids:
+                break
+            result = db.execute(DELETE_SQL, {"ids": ids}).rowcount
+            db.commit()
+            deleted += result
+            if len(ids) < COMPACTION_BATCH or result == 0:
+                break
+        if deleted:
+            print(f"프롬프트 정리: {deleted}개 삭제")
+        return deleted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+# ====== 마이그레이션 ======
+
+def migrate(batch_size: int = 500):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE char_prompts ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_char_prompts_char_idx_content_hash ON char_prompts (char_idx, content_hash)"
+        ))
+
+    db = SessionLocal()
+    try:
+        updated = 0
+        while True:
+            prompts = (
+                db.query(CharacterPrompt)
+                .filter(CharacterPrompt.content_hash.is_(None))
+                .order_by(CharacterPrompt.char_prompt_id)
+                .limit(batch_size)
+                .all()
+            )
+            if not prompts:
+                break
+            for prompt in prompts:
+                prompt.content_hash = prompt_content_hash(
+                    prompt.character_appearance,
+                    prompt.character_personality,
+                    prompt.character_background,
+                    prompt.character_speech_style,
+                    prompt.example_dialogues,
+                )
+            db.commit()
+            updated += len(prompts)
+        print(f"content_hash 계산: {updated}개")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="캐릭터 프롬프트 중복 제거 / 정리")
+    parser.add_argument("command", choices=["migrate", "compact"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    else:
+        compact_character_prompts()
@@ -0,0 +1,98 @@
+"""
+chat_logs.log_body 압축 포맷.
+
+첫 바이트는 포맷 버전입니다.
+- FORMAT_ZSTD      (1): [1][zstd 프레임]
+- FORMAT_ZSTD_DICT (2): [2][dict_id: 4바이트 big-endian][사전으로 압축한 zstd 프레임]
+
+사전(dictionary)은 log_compression_dicts 테이블에 저장되며, 프로세스마다 한 번만 읽어 캐싱합니다.
+이 모듈은 database.py 에서 import 하므로 database 를 import 하지 않습니다.
+"""
+from sqlalchemy import text
+import struct
+import os
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard 미설치 시 압축 포맷 사용 불가 (원문 log 컬럼은 그대로 동작)
+    zstd = None
+
+FORMAT_ZSTD = 1
+FORMAT_ZSTD_DICT = 2
+
+ZSTD_LEVEL = int(os.getenv("CHAT_LOG_ZSTD_LEVEL", "9"))
+
+_DICT_HEADER = struct.Struct(">BI")
+
+# dict_id -> zstd.ZstdCompressionDict
+# (Compressor/Decompressor 객체는 스레드 간 공유할 수 없어 호출마다 생성하고, 사전만 공유)
+_dictionaries = {}
+
+
+def _require_zstd():
+    if zstd is None:
+        raise RuntimeError("압축된 채팅 로그를 처리하려면 zstandard 패키지가 필요합니다.")
+
+
+def load_dictionary(executor, dict_id: int):
+    """
+    압축 사전을 캐시에서 찾고, 없으면 DB 에서 읽어 캐싱.
+    executor 는 Session 또는 Connection (execute 를 지원하는 객체).
+    """
+    _require_zstd()
+    dictionary = _dictionaries.get(dict_id)
+    if dictionary is None:
+        if executor is None:
+            raise RuntimeError(f"압축 사전 {dict_id} 를 읽을 DB 세션이 없습니다.")
+        dict_data = executor.execute(
+            text("SELECT dict_data FROM log_compression_dicts WHERE dict_id = :dict_id"),
+            {"dict_id": dict_id}
+        ).scalar()
+        if dict_data is None:
+            raise ValueError(f"압축 사전 {dict_id} 를 찾을 수 없습니다.")
+        dictionary = zstd.ZstdCompressionDict(bytes(dict_data))
+        dictionary.precompute_compress(level=ZSTD_LEVEL)
+        _dictionaries[dict_id] = dictionary
+    return dictionary
+
+
+def encode_log(log: str, dict_id: int = None, executor=None) -> bytes:
+    """
+    채팅 로그 원문을 압축 포맷으로 변환. dict_id 가 주어지면 해당 사전을 사용.
+    """
+    _require_zstd()
+    raw = log.encode("utf-8")
+    if dict_id is None:
+        return bytes([FORMAT_ZSTD]) + zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+
+    dictionary = load_dictionary(executor, dict_id)
+    compressor = zstd.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary)
+    return _DICT_HEADER.pack(FORMAT_ZSTD_DICT, dict_id) + compressor.compress(raw)
+
+
+def decode_log_body(body: bytes, executor=None) -> str:
+    """
+    압축 포맷을 원문 문자열로 복원.
+    """
+    _require_zstd()
+    body = bytes(body)
+    version = body[0]
+
+    if version == FORMAT_ZSTD:
+        return zstd.ZstdDecompressor().decompress(body[1:]).decode("utf-8")
+
+    if version == FORMAT_ZSTD_DICT:
+        _, dict_id = _DICT_HEADER.unpack_from(body)
+        dictionary = load_dictionary(executor, dict_id)
+        return zstd.ZstdDecompressor(dict_data=dictionary).decompress(body[_DICT_HEADER.size:]).decode("utf-8")
+
+    raise ValueError(f"알 수 없는 채팅 로그 압축 포맷입니다: {version}")
+
+
+def read_log(raw_log, log_body, executor=None) -> str:
+    """
+    log 컬럼(원문)과 log_body 컬럼(압축본)을 직접 조회했을 때 원문을 돌려주는 헬퍼.
+    """
+    if log_body is not None:
+        return decode_log_body(log_body, executor)
+    return raw_log
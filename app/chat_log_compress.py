@@ -0,0 +1,145 @@
+"""
+채팅 로그 압축 저장 관리 명령.
+
+- migrate : chat_logs.log_body 컬럼 추가, log 컬럼 NOT NULL 해제
+- train   : 기존 로그 샘플로 zstd 사전을 학습해 log_compression_dicts 에 저장
+- convert : 아직 압축되지 않은 로그를 최신 사전으로 압축 (배치 단위, 반복 실행 가능)
+- bench   : 샘플 로그로 원문/zstd/zstd+사전 크기와 압축 해제 지연 시간 측정
+
+사용법 (app 디렉토리에서 실행):
+    python chat_log_compress.py migrate
+    python chat_log_compress.py train --samples 5000
+    python chat_log_compress.py convert --batch-size 500
+    python chat_log_compress.py bench --samples 2000
+"""
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import argparse
+import time
+
+from database import engine, SessionLocal, ChatLog, LogCompressionDict
+from chat_log_codec import zstd, encode_log, decode_log_body, ZSTD_LEVEL
+
+DICT_SIZE = 112 * 1024  # 학습 사전 크기 (zstd 권장 기본값)
+
+
+def migrate():
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE chat_logs ADD COLUMN IF NOT EXISTS log_body BYTEA"))
+        conn.execute(text("ALTER TABLE chat_logs ALTER COLUMN log DROP NOT NULL"))
+    LogCompressionDict.__table__.create(bind=engine, checkfirst=True)
+    print("chat_logs 압축 컬럼 마이그레이션 완료")
+
+
+def sample_logs(db, limit: int) -> list:
+    rows = (
+        db.query(ChatLog)
+        .order_by(ChatLog.end_time.desc())
+        .limit(limit)
+        .all()
+    )
+    return [row.log for row in rows if row.log]
+
+
+def latest_dict_id(db):
+    return db.query(LogCompressionDict.dict_id).order_by(LogCompressionDict.dict_id.desc()).limit(1).scalar()
+
+
+def train(samples: int):
+    if zstd is None:
+        raise RuntimeError("사전 학습에는 zstandard 패키지가 필요합니다.")
+    db = SessionLocal()
+    try:
+        logs = sample_logs(db, samples)
+        if not logs:
+            print("학습할 로그가 없습니다.")
+            return None
+        dictionary = zstd.train_dictionary(DICT_SIZE, [log.encode("utf-8") for log in logs])
+        new_dict = LogCompressionDict(dict_data=dictionary.as_bytes(), sample_count=len(logs))
+        db.add(new_dict)
+        db.commit()
+        print(f"압축 사전 {new_dict.dict_id} 학습 완료 (샘플 {len(logs)}건, {len(dictionary.as_bytes())} bytes)")
+        return new_dict.dict_id
+    finally:
+        db.close()
+
+
+def convert(batch_size: int, min_age_minutes: int = 10) -> int:
+    """
+    압축되지 않은 로그를 배치 단위로 압축. 진행 중인 세션을 피하기 위해
+    end_time 이 min_age_minutes 이전인 로그만 변환합니다.
+    """
+    db = SessionLocal()
+    converted = 0
+    try:
+        dict_id = latest_dict_id(db)
+        cutoff = datetime.utcnow() - timedelta(minutes=min_age_minutes)
+        while True:
+            rows = (
+                db.query(ChatLog.session_id, ChatLog.log)
+                .filter(ChatLog.log_body.is_(None), ChatLog.log.isnot(None), ChatLog.end_time < cutoff)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for session_id, log in rows:
+                db.query(ChatLog).filter(ChatLog.session_id == session_id).update(
+                    {ChatLog.log_body: encode_log(log, dict_id, db), ChatLog._log: None},
+                    synchronize_session=False
+                )
+            db.commit()
+            converted += len(rows)
+            print(f"{converted}건 압축 완료")
+        return converted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def bench(samples: int):
+    db = SessionLocal()
+    try:
+        logs = sample_logs(db, samples)
+        if not logs:
+            print("측정할 로그가 없습니다.")
+            return
+        dict_id = latest_dict_id(db)
+        raw_size = sum(len(log.encode("utf-8")) for log in logs)
+
+        results = [("zstd", [encode_log(log) for log in logs])]
+        if dict_id is not None:
+            results.append((f"zstd+dict({dict_id})", [encode_log(log, dict_id, db) for log in logs]))
+
+        print(f"샘플 {len(logs)}건, 원문 {raw_size:,} bytes, zstd level {ZSTD_LEVEL}")
+        for name, bodies in results:
+            size = sum(len(body) for body in bodies)
+            started = time.perf_counter()
+            for body in bodies:
+                decode_log_body(body, db)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:>16}: {size:,} bytes ({size / raw_size:.1%}), "
+                f"압축 해제 {elapsed / len(bodies) * 1e6:.1f} us/건"
+            )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="채팅 로그 압축 저장 관리")
+    parser.add_argument("command", choices=["migrate", "train", "convert", "bench"])
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    elif args.command == "train":
+        train(args.samples)
+    elif args.command == "convert":
+        convert(args.batch_size)
+    else:
+        bench(args.samples)
@@ -0,0 +1,293 @@
+"""
+chat_logs 파티션 관리 및 콜드 아카이브.
+
+chat_logs 를 start_time 기준 월 단위 RANGE 파티션으로 운영합니다.
+- convert  : 기존 단일 chat_logs 테이블을 파티션 테이블로 변환 (최초 1회)
+- maintain : 앞으로 사용할 월 파티션을 미리 만들고, 보존 기간이 지난 파티션을
+             압축해 chat_logs_archive 로 옮긴 뒤 분리/삭제
+
+사용법 (app 디렉토리에서 실행, cron 등으로 주기 실행):
+    python chat_log_partition.py convert
+    python chat_log_partition.py maintain --months-ahead 3 --retention-months 12
+"""
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session
+from datetime import datetime
+from dotenv import load_dotenv
+import argparse
+import zlib
+import re
+import os
+
+from database import engine, ArchivedChatLog
+from chat_log_codec import read_log
+from job_watermark import db_now
+
+# .env 파일 로드
+load_dotenv()
+
+# 최근 몇 개월을 핫 파티션으로 볼지 (대화 내역 조회 시 이 범위만 조회)
+HOT_MONTHS = int(os.getenv("CHAT_LOG_HOT_MONTHS", "3"))
+# 몇 개월이 지난 파티션을 아카이브할지
+RETENTION_MONTHS = int(os.getenv("CHAT_LOG_RETENTION_MONTHS", "12"))
+# 미리 만들어 둘 미래 파티션 개수
+MONTHS_AHEAD = int(os.getenv("CHAT_LOG_MONTHS_AHEAD", "3"))
+
+PARENT_TABLE = "chat_logs"
+DEFAULT_PARTITION = "chat_logs_default"
+PARTITION_NAME_RE = re.compile(r"^chat_logs_(\d{4})(\d{2})$")
+
+CHAT_LOG_COLUMNS = "session_id, chat_id, log, log_body, start_time, end_time"
+
+
+def month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    month_index = dt.year * 12 + (dt.month - 1) + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"chat_logs_{month.year:04d}{month.month:02d}"
+
+
+def hot_window_start(now: datetime = None):
+    """
+    핫 파티션 조회 시작 시각. start_time 이 이 값 이상인 로그만 조회하면
+    PostgreSQL 파티션 프루닝으로 최근 파티션만 스캔합니다.
+    now 가 없으면 DB 시각(LOCALTIMESTAMP) 기준 SQL 식을 반환 (실행 시점 프루닝으로 동일하게 동작).
+    """
+    if now is not None:
+        return add_months(month_start(now), -HOT_MONTHS)
+    return func.date_trunc("month", func.localtimestamp()) - text(f"interval '{HOT_MONTHS} months'")
+
+
+def is_partitioned(conn) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :name AND relkind IN ('r', 'p')"),
+        {"name": PARENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_month_partitions(conn) -> list:
+    """
+    chat_logs 에 붙어있는 월 파티션 (이름, 시작 월) 목록을 반환.
+    """
+    rows = conn.execute(text(
+        """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :parent
+        """
+    ), {"parent": PARENT_TABLE}).scalars().all()
+
+    partitions = []
+    for name in rows:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions.append((name, datetime(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_month_partition(conn, month: datetime, parent: str = PARENT_TABLE):
+    """
+    월 파티션을 생성. 기본 파티션에 해당 월 데이터가 있으면 새 파티션으로 옮긴 뒤 붙입니다.
+    """
+    name = partition_name(month)
+    exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+    if exists:
+        return False
+
+    start, end = month, add_months(month, 1)
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE start_time >= :start AND start_time < :end
+            RETURNING {CHAT_LOG_COLUMNS}
+        )
+        INSERT INTO {name} ({CHAT_LOG_COLUMNS}) SELECT {CHAT_LOG_COLUMNS} FROM moved
+        """
+    ), {"start": start, "end": end})
+    conn.execute(text(
+        f"ALTER TABLE {parent} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+    return True
+
+
+def convert_to_partitioned(months_ahead: int = MONTHS_AHEAD):
+    """
+    기존 단일 chat_logs 테이블을 start_time 월 단위 파티션 테이블로 변환.
+    파티션 테이블의 PK 는 파티션 키를 포함해야 하므로 (session_id, start_time) 으로 바뀌고,
+    session_id 만으로는 참조할 수 없게 되는 secret_diary 의 FK 는 제거됩니다.
+    """
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            print("chat_logs 는 이미 파티션 테이블입니다.")
+            return
+
+        # 압축 컬럼(log_body)이 아직 없는 테이블도 그대로 옮길 수 있도록 맞춰둠
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ADD COLUMN IF NOT EXISTS log_body BYTEA"))
+
+        conn.execute(text(
+            f"""
+            CREATE TABLE chat_logs_partitioned (
+                session_id VARCHAR(50) NOT NULL,
+                chat_id VARCHAR(50) NOT NULL,
+                log TEXT,
+                log_body BYTEA,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT chat_logs_part_pkey PRIMARY KEY (session_id, start_time),
+                CONSTRAINT chat_logs_part_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chat_rooms (chat_id)
+            ) PARTITION BY RANGE (start_time)
+            """
+        ))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF chat_logs_partitioned DEFAULT"))
+
+        # 기존 데이터 범위 + 미래 파티션 생성
+        oldest = conn.execute(text(f"SELECT min(start_time) FROM {PARENT_TABLE}")).scalar()
+        current = month_start(db_now(conn))
+        month = month_start(oldest) if oldest else current
+        while month <= add_months(current, months_ahead):
+            create_month_partition(conn, month, parent="chat_logs_partitioned")
+            month = add_months(month, 1)
+
+        conn.execute(text(
+            f"INSERT INTO chat_logs_partitioned ({CHAT_LOG_COLUMNS}) "
+            f"SELECT {CHAT_LOG_COLUMNS} FROM {PARENT_TABLE}"
+        ))
+        # CASCADE 로 secret_diary.session 의 FK 도 함께 제거됨
+        conn.execute(text(f"DROP TABLE {PARENT_TABLE} CASCADE"))
+        conn.execute(text(f"ALTER TABLE chat_logs_partitioned RENAME TO {PARENT_TABLE}"))
+
+    print("chat_logs 파티션 변환 완료")
+
+
+def ensure_future_partitions(conn, months_ahead: int = MONTHS_AHEAD) -> list:
+    """
+    이번 달부터 months_ahead 개월 뒤까지의 파티션을 생성.
+    """
+    created = []
+    current = month_start(db_now(conn))
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_month_partition(conn, month):
+            created.append(partition_name(month))
+    return created
+
+
+def archive_partition(conn, name: str, batch_size: int = 1000) -> int:
+    """
+    파티션을 chat_logs 에서 분리하고, 로그를 압축해 chat_logs_archive 로 옮긴 뒤 삭제.
+    """
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+
+    result = conn.execution_options(stream_results=True).execute(
+        text(f"SELECT {CHAT_LOG_COLUMNS} FROM {name}")
+    )
+    archived = 0
+    while True:
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        conn.execute(
+            text(
+                """
+                INSERT INTO chat_logs_archive (session_id, chat_id, log_compressed, start_time, end_time)
+                VALUES (:session_id, :chat_id, :log_compressed, :start_time, :end_time)
+                ON CONFLICT (session_id) DO NOTHING
+                """
+            ),
+            [
+                {
+                    "session_id": row.session_id,
+                    "chat_id": row.chat_id,
+                    "log_compressed": compress_log(read_log(row.log, row.log_body, conn)),
+                    "start_time": row.start_time,
+                    "end_time": row.end_time,
+                }
+                for row in rows
+            ]
+        )
+        archived += len(rows)
+
+    conn.execute(text(f"DROP TABLE {name}"))
+    return archived
+
+
+def archive_old_partitions(retention_months: int = RETENTION_MONTHS) -> dict:
+    """
+    보존 기간이 지난 월 파티션을 모두 아카이브. 파티션 하나당 트랜잭션 하나.
+    """
+    with engine.connect() as conn:
+        cutoff = add_months(month_start(db_now(conn)), -retention_months)
+        partitions = [name for name, month in list_month_partitions(conn) if add_months(month, 1) <= cutoff]
+
+    archived = {}
+    for name in partitions:
+        with engine.begin() as conn:
+            archived[name] = archive_partition(conn, name)
+        print(f"{name} 아카이브 완료: {archived[name]}건")
+    return archived
+
+
+def maintain(months_ahead: int = MONTHS_AHEAD, retention_months: int = RETENTION_MONTHS):
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            raise RuntimeError("chat_logs 가 파티션 테이블이 아닙니다. 먼저 convert 를 실행하세요.")
+        created = ensure_future_partitions(conn, months_ahead)
+    if created:
+        print(f"파티션 생성: {', '.join(created)}")
+    archive_old_partitions(retention_months)
+
+
+# ====== 아카이브 조회 ======
+
+def compress_log(log: str) -> bytes:
+    return zlib.compress(log.encode("utf-8"))
+
+
+def decompress_log(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+def load_archived_logs(db: Session, chat_id: str) -> list:
+    """
+    아카이브된 채팅 로그를 시간순으로 반환 (핫 테이블에 없는 오래된 로그 조회용).
+    """
+    rows = (
+        db.query(ArchivedChatLog)
+        .filter(ArchivedChatLog.chat_id == chat_id)
+        .order_by(ArchivedChatLog.start_time)
+        .all()
+    )
+    return [
+        {
+            "session_id": row.session_id,
+            "log": decompress_log(row.log_compressed),
+            "start_time": row.start_time,
+            "end_time": row.end_time,
+        }
+        for row in rows
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="chat_logs 파티션 관리")
+    parser.add_argument("command", choices=["convert", "maintain"])
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_to_partitioned(args.months_ahead)
+    else:
+        maintain(args.months_ahead, args.retention_months)
@@ -0,0 +1,344 @@
+"""
+응답 압축 미들웨어 (zstd / Brotli / gzip).
+
+- Accept-Encoding 의 q 값을 보고 서버 선호 순서(zstd > br > gzip)대로 사용 가능한 인코딩을 선택
+- MINIMUM_SIZE 보다 작은 응답, 이미 Content-Encoding 이 있는 응답, 이미지/오디오 등 압축된 미디어,
+  /static /images 경로는 그대로 전달
+- 경로 접두어별로 인코딩 레벨을 지정할 수 있음 (레벨 0 이면 해당 인코딩 사용 안 함)
+- 스트리밍 응답(more_body)은 청크마다 flush 하며 압축해 지연 없이 전달
+- 압축한 응답의 강한 ETag 는 약한 ETag(W/)로 바꿈 (표현이 달라지므로, etag.etag_matches 는 W/ 를 무시하고 비교)
+
+brotli / zstandard 패키지가 없으면 해당 인코딩은 건너뜁니다.
+
+벤치마크 (app 디렉토리에서 실행):
+    python compression.py --rows 1000
+    python compression.py --file catalog.json   # curl 로 저장한 실제 응답
+"""
+from dotenv import load_dotenv
+import zlib
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli 미설치 시 br 인코딩 사용 안 함
+    brotli = None
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard 미설치 시 zstd 인코딩 사용 안 함
+    zstd = None
+
+# .env 파일 로드
+load_dotenv()
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+ENCODING_PREFERENCE = ("zstd", "br", "gzip")
+
+EXCLUDED_PATHS = ("/static", "/images", "/temp_audio")
+EXCLUDED_CONTENT_TYPES = (
+    "image/", "audio/", "video/", "font/woff",
+    "application/zip", "application/gzip", "application/zstd", "application/octet-stream",
+)
+
+
+# ====== 인코더 ======
+
+class _GzipStream:
+    def __init__(self, level: int):
+        # wbits 16+MAX_WBITS: gzip 헤더/트레일러 포함
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level, mode=brotli.MODE_TEXT)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstd.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstd.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def compress_bytes(encoding: str, data: bytes, level: int) -> bytes:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "br":
+        return brotli.compress(data, quality=level, mode=brotli.MODE_TEXT)
+    if encoding == "zstd":
+        return zstd.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"지원하지 않는 인코딩입니다: {encoding}")
+
+
+STREAMS = {"gzip": _GzipStream, "br": _BrotliStream, "zstd": _ZstdStream}
+
+
+def available_encodings() -> tuple:
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstd is not None}
+    return tuple(encoding for encoding in ENCODING_PREFERENCE if installed[encoding])
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    "gzip, br;q=0.8, *;q=0" -> {"gzip": 1.0, "br": 0.8, "*": 0.0}
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+# ====== 미들웨어 ======
+
+class CompressionMiddleware:
+    """
+        app.add_middleware(
+            CompressionMiddleware,
+            route_levels={"/api/characters/": {"br": 6}, "/ws/": {"gzip": 0, "br": 0, "zstd": 0}},
+        )
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = MINIMUM_SIZE,
+        levels: dict = None,
+        route_levels: dict = None,
+        excluded_paths: tuple = EXCLUDED_PATHS,
+        excluded_content_types: tuple = EXCLUDED_CONTENT_TYPES,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {**DEFAULT_LEVELS, **(levels or {})}
+        # 긴 접두어가 먼저 매칭되도록 정렬
+        self.route_levels = sorted((route_levels or {}).items(), key=lambda item: -len(item[0]))
+        self.excluded_paths = excluded_paths
+        self.excluded_content_types = excluded_content_types
+        self.encodings = available_encodings()
+
+    def levels_for(self, path: str) -> dict:
+        for prefix, levels in self.route_levels:
+            if path.startswith(prefix):
+                return {**self.levels, **levels}
+        return self.levels
+
+    def choose_encoding(self, accept_encoding: str, levels: dict):
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            if levels.get(encoding, 0) <= 0:
+                continue
+            quality = accepted.get(encoding, wildcard)
+            # 같은 q 값이면 서버 선호 순서 유지
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict((key.lower(), value) for key, value in scope.get("headers", []))
+        levels = self.levels_for(scope["path"])
+        encoding = self.choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), levels)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, send, encoding, levels[encoding])
+        await self.app(scope, receive, responder)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str, level: int):
+        self.middleware = middleware
+        self.send = send
+        self.encoding = encoding
+        self.level = level
+        self.start_message = None
+        self.stream = None
+        self.passthrough = False
+
+    def compressible(self, status: int, headers: list) -> bool:
+        if status < 200 or status in (204, 206, 304):
+            return False
+        for key, value in headers:
+            key = key.lower()
+            if key == b"content-encoding":
+                return False
+            if key == b"content-type":
+                content_type = value.decode("latin-1").lower()
+                if content_type.startswith(self.middleware.excluded_content_types):
+                    return False
+        return True
+
+    def compressed_headers(self, headers: list, length: int = None) -> list:
+        result = []
+        vary = None
+        for key, value in headers:
+            lowered = key.lower()
+            if lowered == b"content-length":
+                continue
+            if lowered == b"vary":
+                vary = value
+                continue
+            if lowered == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            result.append((key, value))
+        result.append((b"content-encoding", self.encoding.encode("latin-1")))
+        result.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        if length is not None:
+            result.append((b"content-length", str(length).encode("latin-1")))
+        return result
+
+    async def __call__(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # 첫 body 를 보고 압축 여부를 결정하기 위해 보류
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = list(start.get("headers", []))
+
+            if not self.compressible(start["status"], headers) or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+
+            if not more_body:
+                # 단일 body: 한 번에 압축하고 Content-Length 지정
+                compressed = compress_bytes(self.encoding, body, self.level)
+                await self.send({**start, "headers": self.compressed_headers(headers, len(compressed))})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            # 스트리밍 body: Content-Length 없이 청크 단위 압축
+            self.stream = STREAMS[self.encoding](self.level)
+            await self.send({**start, "headers": self.compressed_headers(headers)})
+
+        if self.stream is None:
+            await self.send(message)
+            return
+
+        chunk = self.stream.compress(body) if body else b""
+        if not more_body:
+            chunk += self.stream.finish()
+            self.stream = None
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+
+# ====== 벤치마크 ======
+
+def _bench_payload(rows: int) -> bytes:
+    from fast_json import dumps
+    from datetime import datetime
+
+    now = datetime.utcnow()
+    persona = (
+        "밝고 다정한 성격으로 처음 만난 사람에게도 먼저 말을 건다. 어린 시절 바닷가 마을에서 자라 "
+        "바다 이야기를 좋아하며, 말끝에 '~거든요'를 자주 붙인다. "
+    )
+    return dumps([
+        {
+            "char_idx": i,
+            "char_name": f"캐릭터 {i}",
+            "char_description": f"{i}번째 캐릭터 소개입니다. " * 3,
+            "created_at": now,
+            "nicknames": {"30": "손님", "70": "친구", "100": "단짝"},
+            "character_appearance": persona * 2,
+            "character_personality": persona * 3,
+            "character_background": persona * 4,
+            "character_speech_style": persona,
+            "example_dialogues": [{"user": "안녕?", "character": f"안녕하세요, 저는 캐릭터 {i}예요!"}],
+            "tags": [{"tag_name": f"태그{i % 50}", "tag_description": "태그 설명"}],
+            "character_image": f"http://localhost:8000/static/{i}_image.png",
+            "field_idx": i % 12,
+            "follower_count": i * 7 % 1000,
+        }
+        for i in range(rows)
+    ])
+
+
+def bench(payload: bytes, repeat: int):
+    import time
+
+    print(f"원본 {len(payload):,} bytes, 사용 가능: {', '.join(available_encodings())}")
+    candidates = [("gzip", level) for level in (1, 6, 9)]
+    if brotli is not None:
+        candidates += [("br", level) for level in (1, 4, 6, 9, 11)]
+    if zstd is not None:
+        candidates += [("zstd", level) for level in (1, 3, 9, 19)]
+
+    for encoding, level in candidates:
+        compress_bytes(encoding, payload, level)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            compressed = compress_bytes(encoding, payload, level)
+        elapsed = (time.perf_counter() - started) / repeat
+        saved = len(payload) - len(compressed)
+        print(
+            f"{encoding:>5} {level:>2}: {len(compressed):>10,} bytes ({len(compressed) / len(payload):6.1%}), "
+            f"{elapsed * 1000:7.2f} ms, 절약 {saved / max(elapsed * 1000, 1e-9) / 1024:8.1f} KB/ms"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="응답 압축 CPU 비용 / 절약 바이트 벤치마크")
+    parser.add_argument("--rows", type=int, default=1000, help="가상 캐릭터 목록 행 수")
+    parser.add_argument("--file", help="실제 응답을 저장한 JSON 파일 (지정 시 --rows 무시)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = _bench_payload(args.rows)
+    bench(data, args.repeat)
@@ -0,0 +1,274 @@
+"""
+제작자 대시보드 집계.
+
+creator_dashboards 에 제작자(user_idx)별로 캐릭터별 대화 세션/메시지 수, 필드 분포, 태그 분포를 저장합니다.
+- 캐릭터/태그 변경: 해당 제작자의 캐릭터 목록 기준으로 필드/태그 분포를 다시 계산 (refresh_creator_catalog)
+- 대화 로그: 마지막 처리 시각 이후 종료된 세션만 읽어 누적 (refresh_creator_dashboards, 주기 실행)
+  여러 워커에서 동시에 실행되면 advisory lock 을 얻은 하나만 반영
+/api/users/{user_idx}/dashboard 와 top3 API 는 PK 조회 한 번으로 응답합니다.
+배포 시(또는 갱신 작업을 끈 경우) 첫 주기 전에도 값이 있도록 migrate 로 전체를 한 번 계산해 둡니다.
+
+사용법 (app 디렉토리에서 실행):
+    python creator_dashboard.py migrate   # 전체 대시보드를 처음부터 다시 계산
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import argparse
+import os
+
+from database import (
+    SessionLocal, CreatorDashboard, Character, CharacterPrompt, ChatRoom, ChatLog,
+    Field as DBField, Tag, Image, ImageMapping
+)
+from job_watermark import db_now, get_watermark, set_watermark, try_lock_job
+from chat_log_codec import read_log
+from storage import media_url
+
+# .env 파일 로드
+load_dotenv()
+
+REFRESH_INTERVAL = float(os.getenv("CREATOR_DASHBOARD_REFRESH_INTERVAL", "300"))  # 초
+INGEST_LAG = timedelta(seconds=60)
+JOB_NAME = "creator_dashboard"
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def count_messages(log_text: str) -> int:
+    """
+    세션 로그의 메시지 수 (user:/chatbot: 로 시작하는 줄, get_chat_history 와 같은 기준).
+    """
+    if not log_text:
+        return 0
+    return sum(1 for line in log_text.split('\n') if 'user:' in line or 'chatbot:' in line)
+
+
+def get_or_create_dashboard(db: Session, user_idx: int) -> CreatorDashboard:
+    # 같은 제작자의 첫 생성이 동시에 일어나도 충돌하지 않도록 ON CONFLICT DO NOTHING 후 잠금 조회
+    db.execute(
+        insert(CreatorDashboard)
+        .values(user_idx=user_idx, character_stats={}, field_stats={}, tag_stats={})
+        .on_conflict_do_nothing(index_elements=["user_idx"])
+    )
+    return (
+        db.query(CreatorDashboard)
+        .filter(CreatorDashboard.user_idx == user_idx)
+        .with_for_update()
+        .populate_existing()
+        .one()
+    )
+
+
+def refresh_creator_catalog(db: Session, user_idx: int):
+    """
+    제작자의 활성 캐릭터 목록으로 캐릭터 정보, 필드 분포, 태그 분포를 다시 계산.
+    캐릭터 생성/수정/삭제 트랜잭션 안에서 호출하며 커밋은 호출한 쪽에서 수행.
+    """
+    if user_idx is None:
+        return
+    dashboard = get_or_create_dashboard(db, user_idx)
+
+    characters = (
+        db.query(Character.char_idx, Character.char_name, Character.field_idx, DBField.field_category, Image.file_path)
+        .join(DBField, DBField.field_idx == Character.field_idx)
+        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        .filter(Character.character_owner == user_idx, Character.is_active == True)
+        .all()
+    )
+
+    old_stats = dashboard.character_stats or {}
+    character_stats = {}
+    field_stats = {}
+    for char_idx, char_name, field_idx, field_category, image_path in characters:
+        previous = old_stats.get(str(char_idx), {})
+        character_stats[str(char_idx)] = {
+            "char_name": char_name,
+            "character_image": image_path,
+            "session_count": previous.get("session_count", 0),
+            "message_count": previous.get("message_count", 0),
+        }
+        field = field_stats.setdefault(str(field_idx), {"field_category": field_category, "char_count": 0})
+        field["char_count"] += 1
+
+    tag_stats = defaultdict(int)
+    if character_stats:
+        tags = (
+            db.query(Tag.tag_name)
+            .filter(Tag.char_idx.in_([int(char_idx) for char_idx in character_stats]), Tag.is_deleted == False)
+            .all()
+        )
+        for (tag_name,) in tags:
+            tag_stats[tag_name] += 1
+
+    # JSON 컬럼은 새 객체를 대입해야 변경이 감지됨
+    dashboard.character_stats = character_stats
+    dashboard.field_stats = field_stats
+    dashboard.tag_stats = dict(tag_stats)
+    dashboard.updated_at = datetime.utcnow()
+    return dashboard
+
+
+def add_log_counts(db: Session, log_filter, owners: list = None):
+    """
+    log_filter 조건의 세션을 스트리밍으로 읽어 제작자/캐릭터별 세션·메시지 수를 대시보드에 누적.
+    """
+    counts = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    query = (
+        # 로그 원문 / 압축본 컬럼만 읽음 (엔티티 전체를 만들지 않음)
+        db.query(Character.character_owner, CharacterPrompt.char_idx, ChatLog.log, ChatLog.log_body)
+        .join(ChatRoom, ChatRoom.chat_id == ChatLog.chat_id)
+        .join(CharacterPrompt, CharacterPrompt.char_prompt_id == ChatRoom.char_prompt_id)
+        .join(Character, Character.char_idx == CharacterPrompt.char_idx)
+        .filter(Character.character_owner.isnot(None), *log_filter)
+    )
+    if owners is not None:
+        query = query.filter(Character.character_owner.in_(owners))
+
+    for owner, char_idx, log, log_body in query.yield_per(500):
+        entry = counts[owner][str(char_idx)]
+        entry[0] += 1
+        entry[1] += count_messages(read_log(log, log_body, db))
+
+    for owner, per_char in counts.items():
+        dashboard = get_or_create_dashboard(db, owner)
+        if not dashboard.character_stats:
+            refresh_creator_catalog(db, owner)
+        character_stats = {key: dict(value) for key, value in dashboard.character_stats.items()}
+        for char_idx, (sessions, messages) in per_char.items():
+            # 삭제된 캐릭터는 목록에 없으므로 건너뜀
+            if char_idx not in character_stats:
+                continue
+            character_stats[char_idx]["session_count"] += sessions
+            character_stats[char_idx]["message_count"] += messages
+        dashboard.character_stats = character_stats
+        dashboard.updated_at = datetime.utcnow()
+
+
+def rebuild_creator_dashboard(db: Session, user_idx: int, logs_until: datetime = None):
+    """
+    한 제작자의 대시보드를 처음부터 다시 계산. logs_until 이 없으면 로그 집계는 생략.
+    """
+    dashboard = refresh_creator_catalog(db, user_idx)
+    dashboard.character_stats = {
+        key: {**value, "session_count": 0, "message_count": 0}
+        for key, value in dashboard.character_stats.items()
+    }
+    if logs_until is not None:
+        add_log_counts(db, [ChatLog.end_time <= logs_until], owners=[user_idx])
+    return dashboard
+
+
+def refresh_creator_dashboards(db: Session = None, rebuild: bool = False):
+    """
+    마지막 처리 시각 이후 종료된 세션을 대시보드에 반영. 첫 실행이거나 rebuild 면 전체 대시보드를 새로 계산.
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # 같은 구간을 두 번 누적하지 않도록 다른 워커 / cron 이 실행 중이면 건너뜀 (잠금은 트랜잭션이 끝날 때 풀림)
+        if not try_lock_job(db, JOB_NAME):
+            print("다른 프로세스에서 제작자 대시보드를 갱신하고 있어 건너뜁니다.")
+            return
+        upper = db_now(db) - INGEST_LAG
+        watermark = get_watermark(db, JOB_NAME)
+        if watermark is None or rebuild:
+            owners = [
+                owner for (owner,) in
+                db.query(Character.character_owner).filter(Character.character_owner.isnot(None)).distinct().all()
+            ]
+            for owner in owners:
+                rebuild_creator_dashboard(db, owner)
+            add_log_counts(db, [ChatLog.end_time <= upper])
+        elif watermark < upper:
+            add_log_counts(db, [ChatLog.end_time > watermark, ChatLog.end_time <= upper])
+        else:
+            return
+        set_watermark(db, JOB_NAME, upper)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def load_creator_dashboard(db: Session, user_idx: int, base_url: str = "") -> dict:
+    """
+    대시보드 행을 PK 로 읽어 정렬된 응답 형태로 변환 (조회에서는 쓰지 않음).
+    행이 없는 사용자(캐릭터가 없거나 아직 집계 전)는 빈 대시보드를 반환하고, 생성은 캐릭터 API / 갱신 작업이 담당.
+    """
+    dashboard = db.query(CreatorDashboard).filter(CreatorDashboard.user_idx == user_idx).first()
+    if not dashboard:
+        return {"user_idx": user_idx, "characters": [], "fields": [], "tags": [], "updated_at": None}
+
+    characters = sorted(
+        (
+            {
+                "char_idx": int(char_idx),
+                "char_name": stats["char_name"],
+                "log_count": stats["session_count"],
+                "message_count": stats["message_count"],
+                "character_image": media_url(base_url, stats["character_image"]),
+            }
+            for char_idx, stats in dashboard.character_stats.items()
+        ),
+        key=lambda item: (-item["log_count"], item["char_idx"])
+    )
+    fields = sorted(
+        (
+            {"field_idx": int(field_idx), "field_category": stats["field_category"], "char_count": stats["char_count"]}
+            for field_idx, stats in dashboard.field_stats.items()
+        ),
+        key=lambda item: (-item["char_count"], item["field_idx"])
+    )
+    tags = sorted(
+        ({"tag_name": tag_name, "tag_count": tag_count} for tag_name, tag_count in dashboard.tag_stats.items()),
+        key=lambda item: (-item["tag_count"], item["tag_name"])
+    )
+
+    return {
+        "user_idx": user_idx,
+        "characters": characters,
+        "fields": fields,
+        "tags": tags,
+        "updated_at": dashboard.updated_at.isoformat() if dashboard.updated_at else None,
+    }
+
+
+# 제작자 대시보드 조회 API
+@router.get("/api/users/{user_idx}/dashboard", response_model=dict)
+def get_creator_dashboard(user_idx: int, db: Session = Depends(get_db), request: Request = None):
+    """
+    제작자의 캐릭터별 대화 수, 필드 분포, 태그 분포를 한 번에 반환합니다.
+    """
+    try:
+        base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+        return load_creator_dashboard(db, user_idx, base_url)
+    except Exception as e:
+        db.rollback()
+        print(f"Error fetching creator dashboard: {e}")
+        raise HTTPException(status_code=500, detail="대시보드 데이터를 가져오는 중 오류가 발생했습니다.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="제작자 대시보드 집계")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    refresh_creator_dashboards(rebuild=True)
@@ -1,10 +1,13 @@
-from sqlalchemy import create_engine, UniqueConstraint, Column, String, Text, DateTime, ForeignKey, Integer, Boolean, JSON, ARRAY, text, Index, and_
+from sqlalchemy import create_engine, UniqueConstraint, Column, String, Text, DateTime, ForeignKey, Integer, Float, Boolean, JSON, ARRAY, LargeBinary, text, Index, and_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, object_session
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 
+from chat_log_codec import read_log
+
 # .env 파일 로드
 load_dotenv()
 
@@ -45,6 +48,8 @@ class Character(Base):
         nullable=False,
         default=lambda: {30: "stranger", 70: "friend", 100: "best friend"}
 )
+    # 활성 팔로워 수 (팔로우/언팔로우 트랜잭션에서 함께 갱신, follower_counter.py 참고)
+    follower_count = Column(Integer, server_default=text("0"), nullable=False)
 
 # Scenario 테이블
 class Scenario(Base):
@@ -56,6 +61,13 @@ class Scenario(Base):
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
     is_active = Column(Boolean, server_default=text("true"), nullable=False)
 
+# 채팅방의 활성 시나리오 조회용 (scenario.py 참고)
+Index(
+    "ix_scenario_chat_active",
+    Scenario.chat_id,
+    postgresql_where=and_(Scenario.is_active == True)
+)
+
 # Fields 테이블
 class Field(Base):
     __tablename__ = "fields"
@@ -73,6 +85,21 @@ class Tag(Base):
     tag_description = Column(Text, nullable=True)
     is_deleted = Column(Boolean, server_default=text("false"), nullable=False)
 
+# TagVocab 테이블 - 정규화된 태그 이름 사전 (tag_index.py 참고)
+class TagVocab(Base):
+    __tablename__ = "tag_vocab"
+
+    tag_id = Column(Integer, primary_key=True, autoincrement=True)
+    tag_name = Column(String(50), nullable=False, unique=True)
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# CharacterTags 테이블 - 캐릭터와 태그 사전의 매핑
+class CharacterTag(Base):
+    __tablename__ = "character_tags"
+
+    char_idx = Column(Integer, ForeignKey("characters.char_idx"), primary_key=True)
+    tag_id = Column(Integer, ForeignKey("tag_vocab.tag_id"), primary_key=True, index=True)
+
 # Voice 테이블
 class Voice(Base):
     __tablename__ = "voice"
@@ -87,10 +114,46 @@ class ChatLog(Base):
 
     session_id = Column(String(50), primary_key=True)
     chat_id = Column(String(50), ForeignKey("chat_rooms.chat_id"), nullable=False)
-    log = Column(Text, nullable=False)
+    _log = Column("log", Text, nullable=True)  # 원문 로그 (압축 전환 전 또는 미압축 저장)
+    log_body = Column(LargeBinary, nullable=True)  # zstd 압축 로그 (chat_log_codec.py 포맷)
     start_time = Column(DateTime, nullable=False)
     end_time = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
 
+    # 압축본이 있으면 log 를 읽을 때만 압축 해제
+    @hybrid_property
+    def log(self):
+        return read_log(self._log, self.log_body, object_session(self))
+
+    @log.setter
+    def log(self, value):
+        self._log = value
+        self.log_body = None
+
+    @log.expression
+    def log(cls):
+        return cls._log
+
+# LogCompressionDicts 테이블 - chat_logs.log_body 압축용 zstd 학습 사전
+class LogCompressionDict(Base):
+    __tablename__ = "log_compression_dicts"
+
+    dict_id = Column(Integer, primary_key=True, autoincrement=True)
+    dict_data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# ChatLogsArchive 테이블
+# 보존 기간이 지난 chat_logs 파티션을 압축해 옮겨두는 테이블 (chat_log_partition.py 참고)
+class ArchivedChatLog(Base):
+    __tablename__ = "chat_logs_archive"
+
+    session_id = Column(String(50), primary_key=True)
+    chat_id = Column(String(50), nullable=False, index=True)
+    log_compressed = Column(LargeBinary, nullable=False)  # zlib 압축된 log
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
 # Images 테이블
 class Image(Base):
     __tablename__ = "images"
@@ -141,6 +204,8 @@ class CharacterPrompt(Base):
     character_background = Column(Text, nullable=False)
     character_speech_style = Column(Text, nullable=False)
     example_dialogues = Column(ARRAY(Text), nullable=True)
+    # 페르소나 필드의 SHA-256 (같은 내용이면 행을 재사용, character_prompts.py 참고)
+    content_hash = Column(String(64), nullable=True)
 
 # GroupChats 테이블
 class GroupChat(Base):
@@ -158,7 +223,7 @@ class ScenarioPrompt(Base):
     __tablename__ = "scenario_prompts"
 
     scenario_prompt_id = Column(Integer, primary_key=True, autoincrement=True)
-    scenario_id = Column(Integer, ForeignKey("scenario.scenario_id"), nullable=False)
+    scenario_id = Column(Integer, ForeignKey("scenario.scenario_id"), nullable=False, index=True)
     prompt_text = Column(JSON, nullable=False)
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
     updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
@@ -177,7 +242,10 @@ class SecretDiary(Base):
     __tablename__ = "secret_diary"
 
     diary_idx = Column(Integer, primary_key=True, autoincrement=True)
-    session = Column(String(50), ForeignKey("chat_logs.session_id"), nullable=False)
+    # 세션당 일기 1개. chat_logs 는 (session_id, start_time) 파티션 테이블이라 session_id 가 단독 unique 가 아니어서
+    # FK 를 두지 않음 (chat_log_partition convert 에서도 CASCADE 로 제거됨)
+    session = Column(String(50), nullable=False, unique=True)
+    chat_id = Column(String(50), ForeignKey("chat_rooms.chat_id"), nullable=True, index=True)  # 채팅방별 조회용
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
 
@@ -188,7 +256,21 @@ class GroupChatCharacter(Base):
     group_chars_idx = Column(Integer, primary_key=True, autoincrement=True)
     group_chat_idx = Column(Integer, ForeignKey("group_chats.group_chat_idx"), nullable=False)
     char_idx = Column(Integer, ForeignKey("characters.char_idx"), nullable=False)
-    
+
+# GroupChatMessages 테이블 - 그룹 채팅 대화 내역 (캐릭터별로 복사하지 않고 그룹당 한 번 저장)
+class GroupChatMessage(Base):
+    __tablename__ = "group_chat_messages"
+
+    message_idx = Column(Integer, primary_key=True, autoincrement=True)
+    group_chat_idx = Column(Integer, ForeignKey("group_chats.group_chat_idx"), nullable=False)
+    char_idx = Column(Integer, ForeignKey("characters.char_idx"), nullable=True)  # NULL 이면 사용자 메시지
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_group_chat_messages_group_created", "group_chat_idx", "created_at"),
+    )
+
 
 # 캐릭터 이미지 생성 프롬프트
 class ImagePrompt(Base):
@@ -201,5 +283,106 @@ class ImagePrompt(Base):
     updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
     version = Column(Integer, nullable=False)
 
+# JobWatermarks 테이블 - 배치 작업별 마지막 처리 시각 (job_watermark.py 참고)
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+
+    job_name = Column(String(50), primary_key=True)
+    watermark = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# CharacterRankings 테이블 - 인기 캐릭터 순위 (trending.py 에서 주기적으로 갱신)
+class CharacterRanking(Base):
+    __tablename__ = "character_rankings"
+
+    char_idx = Column(Integer, ForeignKey("characters.char_idx"), primary_key=True)
+    activity_score = Column(Float, server_default=text("0"), nullable=False)  # scored_at 기준으로 감쇠된 대화 세션 점수
+    score = Column(Float, server_default=text("0"), nullable=False)  # 팔로워 수 + 대화 활동 종합 점수
+    rank = Column(Integer, nullable=True, index=True)
+    scored_at = Column(DateTime, nullable=False)  # activity_score 의 기준 시각 (새 세션이 반영될 때만 바뀜)
+
+# CharacterSimilarities 테이블 - 비슷한 캐릭터 top-K (recommendations.py 에서 계산)
+class CharacterSimilarity(Base):
+    __tablename__ = "character_similarities"
+
+    char_idx = Column(Integer, ForeignKey("characters.char_idx"), primary_key=True)
+    neighbors = Column(JSON, nullable=False)  # [[char_idx, score], ...] (유사도 내림차순)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# CharacterCofollows 테이블 - 함께 팔로우되는 캐릭터 top-N (feed.py 에서 계산)
+class CharacterCofollow(Base):
+    __tablename__ = "character_cofollows"
+
+    char_idx = Column(Integer, ForeignKey("characters.char_idx"), primary_key=True)
+    neighbors = Column(JSON, nullable=False)  # [[char_idx, score], ...] (점수 내림차순)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# UserFeeds 테이블 - 사용자별 추천 피드 (feed.py 에서 계산)
+class UserFeed(Base):
+    __tablename__ = "user_feeds"
+
+    user_idx = Column(Integer, ForeignKey("users.user_idx"), primary_key=True)
+    items = Column(JSON, nullable=False)  # [[char_idx, score], ...] (점수 내림차순)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# CreatorDashboards 테이블 - 제작자별 대시보드 집계 (creator_dashboard.py 에서 증분 갱신)
+class CreatorDashboard(Base):
+    __tablename__ = "creator_dashboards"
+
+    user_idx = Column(Integer, ForeignKey("users.user_idx"), primary_key=True)
+    # {char_idx: {"char_name", "character_image", "session_count", "message_count"}}
+    character_stats = Column(JSON, nullable=False, default=dict)
+    # {field_idx: {"field_category", "char_count"}}
+    field_stats = Column(JSON, nullable=False, default=dict)
+    # {tag_name: tag_count}
+    tag_stats = Column(JSON, nullable=False, default=dict)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# ChangeCounters 테이블 - 조회 API 의 ETag 버전 (etag.py 에서 쓰기 API 가 증가시킴)
+class ChangeCounter(Base):
+    __tablename__ = "change_counters"
+
+    name = Column(String(100), primary_key=True)  # "characters", "character:{char_idx}", "fields", "voices", "tags"
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), nullable=False)
+
+# 핫 경로 조회용 보조 인덱스
+# create_all 은 이미 존재하는 테이블에 인덱스를 추가하지 않으므로 기존 DB 는
+# `python db_index_audit.py migrate` 로 반영 (CREATE INDEX CONCURRENTLY IF NOT EXISTS)
+HOT_PATH_INDEXES = [
+    # 대화 내역 (최근 N개 / 시간순 전체 조회)
+    Index("ix_chat_logs_chat_id_end_time", ChatLog.chat_id, ChatLog.end_time.desc()),
+    Index("ix_chat_logs_chat_id_start_time", ChatLog.chat_id, ChatLog.start_time),
+    # 팔로워 수 집계 / 팔로우 여부 확인
+    Index("ix_friends_char_idx_active", Friend.char_idx, postgresql_where=Friend.is_active == True),
+    Index("ix_friends_user_idx_char_idx", Friend.user_idx, Friend.char_idx, postgresql_include=["is_active"]),
+    # 캐릭터별 태그 (삭제되지 않은 태그만, tag_name 포함)
+    # tag_description 은 길이 제한이 없는 Text 라 INCLUDE 하면 인덱스 튜플 크기 제한(~2.7KB)을 넘는 INSERT 가 실패하므로 제외
+    Index(
+        "ix_tags_char_idx_active",
+        Tag.char_idx,
+        postgresql_include=["tag_name"],
+        postgresql_where=Tag.is_deleted == False
+    ),
+    # 캐릭터별 최신 프롬프트 (max(created_at) 서브쿼리 + 조인)
+    Index(
+        "ix_char_prompts_char_idx_created_at",
+        CharacterPrompt.char_idx,
+        CharacterPrompt.created_at.desc(),
+        postgresql_include=["char_prompt_id"]
+    ),
+    # 같은 내용의 프롬프트 재사용 확인
+    Index("ix_char_prompts_char_idx_content_hash", CharacterPrompt.char_idx, CharacterPrompt.content_hash),
+    # 캐릭터 목록 (제작자별 / 최신순 / 필드별)
+    Index("ix_characters_owner_active", Character.character_owner, postgresql_where=Character.is_active == True),
+    Index("ix_characters_created_at_active", Character.created_at.desc(), postgresql_where=Character.is_active == True),
+    Index("ix_characters_field_idx_active", Character.field_idx, postgresql_where=Character.is_active == True),
+    # 사용자별 채팅방 / 프롬프트 기준 조인
+    Index("ix_chat_rooms_user_idx", ChatRoom.user_idx, postgresql_include=["chat_id"]),
+    Index("ix_chat_rooms_char_prompt_id_active", ChatRoom.char_prompt_id, postgresql_where=ChatRoom.is_active == True),
+    # 로그인 / 회원가입 중복 확인
+    Index("ix_users_user_id", User.user_id),
+]
+
 # 테이블 생성
 Base.metadata.create_all(bind=engine)
@@ -0,0 +1,236 @@
+"""
+핫 경로 인덱스 마이그레이션 및 EXPLAIN 감사.
+
+- migrate : database.HOT_PATH_INDEXES 를 CREATE INDEX CONCURRENTLY IF NOT EXISTS 로 생성
+            (파티션 테이블인 chat_logs 는 CONCURRENTLY 를 지원하지 않아 일반 CREATE INDEX 사용)
+- audit   : 엔드포인트별 대표 쿼리에 EXPLAIN 을 실행해 큰 테이블의 Seq Scan 을 표시
+            --seed 를 주면 트랜잭션 안에서 가상 데이터를 넣고 ANALYZE 후 측정한 뒤 롤백
+
+사용법 (app 디렉토리에서 실행):
+    python db_index_audit.py migrate
+    python db_index_audit.py audit --seed 10 --min-rows 5000
+"""
+from sqlalchemy import select, text, func, literal_column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+import argparse
+import json
+
+from database import (
+    engine, HOT_PATH_INDEXES, User, Character, CharacterPrompt, ChatRoom, ChatLog,
+    Friend, Tag, Image, ImageMapping
+)
+
+
+# 정의가 바뀐 인덱스: 인덱스 이름 -> 이전 정의에만 있는 문자열 (해당하면 삭제 후 다시 생성)
+OUTDATED_INDEXES = {
+    "ix_tags_char_idx_active": "tag_description",
+}
+
+
+def migrate():
+    # CONCURRENTLY 는 트랜잭션 블록 안에서 실행할 수 없음
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, marker in OUTDATED_INDEXES.items():
+            indexdef = conn.execute(
+                text("SELECT indexdef FROM pg_indexes WHERE indexname = :name"), {"name": name}
+            ).scalar()
+            if indexdef and marker in indexdef:
+                print(f"{name} (이전 정의 삭제) ...")
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+        for index in HOT_PATH_INDEXES:
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+            relkind = conn.execute(
+                text("SELECT relkind FROM pg_class WHERE relname = :name"),
+                {"name": index.table.name}
+            ).scalar()
+            if relkind != "p":
+                ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+            print(f"{index.name} ...")
+            conn.execute(text(ddl))
+    print("인덱스 마이그레이션 완료")
+
+
+# ====== 감사용 가상 데이터 ======
+
+SEED_SQL = [
+    # 필드 / 보이스
+    """
+    INSERT INTO fields (field_idx, field_category)
+    VALUES (:field_idx, 'audit')
+    """,
+    """
+    INSERT INTO voice (voice_idx, voice_path, voice_speaker)
+    VALUES ('audit_voice', 'audit', 'audit')
+    """,
+    """
+    INSERT INTO users (user_idx, user_id, nickname, password)
+    SELECT :user_base + g, 'audit_user_' || g, 'audit', 'audit'
+    FROM generate_series(1, :users) g
+    """,
+    """
+    INSERT INTO characters (char_idx, character_owner, field_idx, voice_idx, char_name, char_description, nicknames)
+    SELECT :char_base + g, :user_base + 1 + (g % :users), :field_idx, 'audit_voice',
+           'audit_char_' || g, 'audit', '{}'
+    FROM generate_series(1, :chars) g
+    """,
+    # 캐릭터마다 프롬프트 3개 (수정 이력)
+    """
+    INSERT INTO char_prompts (char_idx, created_at, character_appearance, character_personality,
+                              character_background, character_speech_style)
+    SELECT :char_base + 1 + (g % :chars), now() - (g || ' minutes')::interval, 'a', 'p', 'b', 's'
+    FROM generate_series(1, :chars * 3) g
+    """,
+    """
+    INSERT INTO images (img_idx, file_path)
+    SELECT :img_base + g, 'audit_' || g || '.png'
+    FROM generate_series(1, :chars) g
+    """,
+    """
+    INSERT INTO image_mapping (char_idx, img_idx)
+    SELECT :char_base + g, :img_base + g
+    FROM generate_series(1, :chars) g
+    """,
+    """
+    INSERT INTO tags (char_idx, tag_name, tag_description, is_deleted)
+    SELECT :char_base + 1 + (g % :chars), 'tag_' || (g % 200), 'audit', g % 10 = 0
+    FROM generate_series(1, :chars * 3) g
+    """,
+    """
+    INSERT INTO friends (user_idx, char_idx, is_active)
+    SELECT :user_base + 1 + (g % :users), :char_base + 1 + ((g * 7) % :chars), g % 5 <> 0
+    FROM generate_series(1, :friends) g
+    """,
+    """
+    INSERT INTO chat_rooms (chat_id, user_idx, char_prompt_id, is_active)
+    SELECT 'audit_room_' || g, :user_base + 1 + (g % :users),
+           (SELECT min(char_prompt_id) FROM char_prompts), g % 10 <> 0
+    FROM generate_series(1, :rooms) g
+    """,
+    """
+    INSERT INTO chat_logs (session_id, chat_id, log, start_time, end_time)
+    SELECT 'audit_session_' || g, 'audit_room_' || (1 + g % :rooms),
+           'user: 안녕\nchatbot: 반가워', now() - ((g % 400) || ' days')::interval,
+           now() - ((g % 400) || ' days')::interval + interval '10 minutes'
+    FROM generate_series(1, :logs) g
+    """,
+]
+
+SEED_TABLES = ["users", "characters", "char_prompts", "images", "image_mapping", "tags", "friends", "chat_rooms", "chat_logs"]
+
+
+def seed(conn, scale: int) -> dict:
+    base = lambda table, column: conn.execute(text(f"SELECT COALESCE(max({column}), 0) FROM {table}")).scalar()
+    params = {
+        "user_base": base("users", "user_idx"),
+        "char_base": base("characters", "char_idx"),
+        "img_base": base("images", "img_idx"),
+        "field_idx": base("fields", "field_idx") + 1,
+        "users": 1000 * scale,
+        "chars": 1000 * scale,
+        "friends": 20000 * scale,
+        "rooms": 5000 * scale,
+        "logs": 50000 * scale,
+    }
+    for sql in SEED_SQL:
+        conn.execute(text(sql), params)
+    for table in SEED_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+    return params
+
+
+# ====== 엔드포인트별 대표 쿼리 ======
+
+def audit_queries(user_idx: int, char_idx: int, chat_id: str) -> dict:
+    latest_prompt = (
+        select(CharacterPrompt.char_idx, func.max(CharacterPrompt.created_at).label("latest_created_at"))
+        .where(CharacterPrompt.char_idx == char_idx)
+        .group_by(CharacterPrompt.char_idx)
+    )
+    return {
+        "get_chat_history": (
+            select(ChatLog.session_id, ChatLog.end_time)
+            .where(ChatLog.chat_id == chat_id, ChatLog.start_time >= literal_column("now() - interval '90 days'"))
+            .order_by(ChatLog.end_time.desc())
+            .limit(10)
+        ),
+        "get_chat_logs": select(ChatLog.session_id).where(ChatLog.chat_id == chat_id).order_by(ChatLog.start_time),
+        "follower_count": select(func.count(Friend.friend_idx)).where(Friend.char_idx == char_idx, Friend.is_active == True),
+        "check_follow": select(Friend.friend_idx).where(
+            Friend.user_idx == user_idx, Friend.char_idx == char_idx, Friend.is_active == True
+        ),
+        "followed_characters": select(Friend.char_idx).where(Friend.user_idx == user_idx, Friend.is_active == True),
+        "character_tags": select(Tag.tag_name, Tag.tag_description).where(Tag.char_idx == char_idx, Tag.is_deleted == False),
+        "latest_prompt": latest_prompt,
+        "character_image": (
+            select(Image.file_path)
+            .join(ImageMapping, ImageMapping.img_idx == Image.img_idx)
+            .where(ImageMapping.char_idx == char_idx)
+        ),
+        "characters_by_owner": select(Character.char_idx).where(Character.character_owner == user_idx, Character.is_active == True),
+        "new_characters": select(Character.char_idx).where(Character.is_active == True).order_by(Character.created_at.desc()).limit(10),
+        "user_chat_rooms": select(ChatRoom.chat_id).where(ChatRoom.user_idx == user_idx, ChatRoom.is_active == True),
+        "wordcloud_chat_rooms": select(ChatRoom.chat_id).where(ChatRoom.user_idx == user_idx),
+        "signin": select(User.user_idx).where(User.user_id == "audit_user_1"),
+    }
+
+
+def find_seq_scans(plan: dict) -> list:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child))
+    return found
+
+
+def table_rows(conn) -> dict:
+    rows = conn.execute(text("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")).all()
+    return {name: max(tuples, 0) for name, tuples in rows}
+
+
+def audit(seed_scale: int, min_rows: int) -> list:
+    flagged = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if seed_scale:
+                params = seed(conn, seed_scale)
+                user_idx, char_idx, chat_id = params["user_base"] + 1, params["char_base"] + 1, "audit_room_1"
+            else:
+                user_idx = conn.execute(text("SELECT COALESCE(min(user_idx), 1) FROM users")).scalar()
+                char_idx = conn.execute(text("SELECT COALESCE(min(char_idx), 1) FROM characters")).scalar()
+                chat_id = conn.execute(text("SELECT COALESCE(min(chat_id), '') FROM chat_rooms")).scalar()
+
+            sizes = table_rows(conn)
+            for name, stmt in audit_queries(user_idx, char_idx, chat_id).items():
+                sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                root = plan[0]["Plan"]
+                large_scans = [t for t in find_seq_scans(root) if sizes.get(t, 0) >= min_rows]
+                status = f"SEQ SCAN: {', '.join(large_scans)}" if large_scans else "ok"
+                print(f"{name:>22}  cost={root['Total Cost']:>10.1f}  {status}")
+                if large_scans:
+                    flagged.append((name, large_scans))
+        finally:
+            # 가상 데이터는 남기지 않음
+            trans.rollback()
+    return flagged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="핫 경로 인덱스 마이그레이션 및 감사")
+    parser.add_argument("command", choices=["migrate", "audit"])
+    parser.add_argument("--seed", type=int, default=0, help="가상 데이터 배율 (0이면 현재 데이터로 측정)")
+    parser.add_argument("--min-rows", type=int, default=5000, help="이 행 수 이상인 테이블의 Seq Scan 만 표시")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    else:
+        flagged = audit(args.seed, args.min_rows)
+        if flagged:
+            raise SystemExit(f"큰 테이블 Seq Scan {len(flagged)}건 발견")
@@ -0,0 +1,130 @@
+"""
+조회 API 의 ETag / 조건부 GET.
+
+change_counters 테이블에 이름별 버전을 두고, 쓰기 API 가 같은 트랜잭션에서 bump 로 증가시킵니다.
+- "characters"           : 캐릭터 목록 (/api/characters/)
+- "character:{char_idx}" : 캐릭터 상세 (/api/characters/{char_idx})
+- "fields", "voices", "tags"
+
+조회 API 는 본 쿼리 전에 not_modified 로 버전만 읽어 If-None-Match / If-Modified-Since 가
+맞으면 304 를 바로 반환합니다. DB 를 직접 수정한 경우(필드/보이스 등록 등)는 수동으로 증가시킵니다.
+
+사용법 (app 디렉토리에서 실행):
+    python etag.py bump fields voices
+"""
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import datetime, timezone
+import argparse
+
+from database import SessionLocal, ChangeCounter
+
+CATALOG = "characters"
+FIELDS = "fields"
+VOICES = "voices"
+TAGS = "tags"
+
+BUMP_SQL = text(
+    """
+    INSERT INTO change_counters (name, version, updated_at)
+    VALUES (:name, 1, :now)
+    ON CONFLICT (name) DO UPDATE
+    SET version = change_counters.version + 1, updated_at = EXCLUDED.updated_at
+    """
+)
+
+
+def character_counter(char_idx: int) -> str:
+    return f"character:{char_idx}"
+
+
+def bump(db: Session, *names: str):
+    """
+    버전 증가. 커밋은 호출한 쪽 트랜잭션에서 함께 수행.
+    """
+    now = datetime.utcnow()
+    # 여러 트랜잭션이 같은 행을 갱신할 때 교착 상태가 생기지 않도록 이름 순서로 잠금
+    for name in sorted(set(names)):
+        db.execute(BUMP_SQL, {"name": name, "now": now})
+
+
+def current_validators(db: Session, names) -> tuple:
+    """
+    (ETag, Last-Modified) 를 계산. 한 번도 증가되지 않은 이름은 버전 0.
+    """
+    rows = dict(
+        (name, (version, updated_at))
+        for name, version, updated_at in db.query(ChangeCounter.name, ChangeCounter.version, ChangeCounter.updated_at)
+        .filter(ChangeCounter.name.in_(names))
+        .all()
+    )
+    versions = [rows.get(name, (0, None)) for name in names]
+    etag = '"' + "-".join(f"{name}.{version}" for name, (version, _) in zip(names, versions)) + '"'
+    updated = [updated_at for _, updated_at in versions if updated_at is not None]
+    last_modified = max(updated).replace(tzinfo=timezone.utc, microsecond=0) if updated else None
+    return etag, last_modified
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match 비교 (약한 비교: W/ 접두어는 무시).
+    """
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate[2:] == etag if candidate.startswith("W/") else candidate == etag for candidate in candidates)
+
+
+def not_modified(request: Request, db: Session, *names: str) -> tuple:
+    """
+    (응답에 붙일 헤더, 304 응답 또는 None) 을 반환.
+
+        headers, cached = not_modified(request, db, etag.CATALOG)
+        if cached:
+            return cached
+        ...
+        return FastJSONResponse(results, headers=headers)
+    """
+    etag, last_modified = current_validators(db, names)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if request is None:
+        return headers, None
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match 가 있으면 If-Modified-Since 는 무시 (RFC 9110 13.1.3)
+        if etag_matches(if_none_match, etag):
+            return headers, Response(status_code=304, headers=headers)
+        return headers, None
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and since.tzinfo is not None and last_modified <= since:
+            return headers, Response(status_code=304, headers=headers)
+
+    return headers, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ETag 버전 관리")
+    parser.add_argument("command", choices=["bump"])
+    parser.add_argument("names", nargs="+", help="증가시킬 이름 (characters, character:1, fields, voices, tags)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        bump(db, *args.names)
+        db.commit()
+        print(f"버전 증가: {', '.join(args.names)}")
+    finally:
+        db.close()
@@ -0,0 +1,205 @@
+"""
+필드 / 태그 패싯 필터링.
+
+활성 캐릭터를 char_idx 번째 비트로 나타내는 비트셋(파이썬 int)을 필드별로 두고
+필터 교집합과 필드 패싯 개수를 비트 연산(&, |, bit_count)으로 계산합니다.
+태그는 종류가 많아 태그마다 비트셋을 두지 않고, 태그 역색인(tag_index.py)의 char_idx 배열을
+조회할 때만 비트셋으로 바꾸며 태그 패싯은 결과에 포함된 캐릭터의 태그만 셉니다.
+- 필드는 OR (선택한 필드 중 하나), 태그는 match 에 따라 AND / OR, 필드와 태그 사이는 AND
+- 필드 패싯 개수는 태그 조건만, 태그 패싯 개수는 필드/태그 조건을 모두 적용한 결과 기준
+  (필드는 여러 개를 골라 넓히는 필터이므로 자기 자신의 조건은 빼고 셈)
+
+캐릭터 생성/수정/삭제 API 가 커밋 후 해당 캐릭터의 비트만 바꾸고,
+다른 서버 프로세스의 변경은 FACET_REFRESH_INTERVAL 마다 전체를 다시 읽어 반영합니다.
+"""
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from dotenv import load_dotenv
+import threading
+import os
+
+from database import SessionLocal, Character, Field as DBField
+from tag_index import tag_index
+
+# .env 파일 로드
+load_dotenv()
+
+REFRESH_INTERVAL = float(os.getenv("FACET_REFRESH_INTERVAL", "300"))  # 초
+MAX_TAG_FACETS = 30  # 응답에 포함할 태그 패싯 수 (개수 내림차순)
+
+
+def bits_from(char_ids) -> int:
+    """
+    char_idx 배열 -> 비트셋.
+    """
+    if not char_ids:
+        return 0
+    buffer = bytearray(max(char_ids) // 8 + 1)
+    for char_idx in char_ids:
+        buffer[char_idx >> 3] |= 1 << (char_idx & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bits(bits: int):
+    """
+    비트셋의 char_idx 를 작은 값부터 반환 (바이트 단위로 훑어 큰 int 연산을 반복하지 않음).
+    """
+    for position, byte in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, "little")):
+        while byte:
+            low = byte & -byte
+            yield position * 8 + low.bit_length() - 1
+            byte ^= low
+
+
+def iter_bits_desc(bits: int):
+    """
+    비트셋의 char_idx 를 큰 값(최근 생성)부터 반환.
+    """
+    while bits:
+        top = bits.bit_length() - 1
+        yield top
+        bits ^= 1 << top
+
+
+def page_bits(bits: int, offset: int, limit: int) -> list:
+    result = []
+    for position, char_idx in enumerate(iter_bits_desc(bits)):
+        if position < offset:
+            continue
+        if len(result) >= limit:
+            break
+        result.append(char_idx)
+    return result
+
+
+class FacetIndex:
+    """
+    필드별 활성 캐릭터 비트셋. 조회는 잠금 밖에서 dict 를 순회하므로 갱신은 새 dict 를 만들어 교체합니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        self.field_bits = {}  # field_idx -> 비트셋
+        self.field_categories = {}  # field_idx -> field_category
+        self._character_field = {}  # char_idx -> field_idx
+        self.loaded = False
+
+    def reload(self, db: Session = None):
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            characters = db.query(Character.char_idx, Character.field_idx).filter(Character.is_active == True).all()
+            field_categories = dict(db.query(DBField.field_idx, DBField.field_category).all())
+        finally:
+            if own_session:
+                db.close()
+
+        active = 0
+        field_bits = defaultdict(int)
+        character_field = {}
+        for char_idx, field_idx in characters:
+            bit = 1 << char_idx
+            active |= bit
+            field_bits[field_idx] |= bit
+            character_field[char_idx] = field_idx
+
+        with self._lock:
+            self.active = active
+            self.field_bits = dict(field_bits)
+            self.field_categories = field_categories
+            self._character_field = character_field
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.reload()
+
+    def _remove_locked(self, char_idx: int, field_bits: dict):
+        mask = ~(1 << char_idx)
+        self.active &= mask
+        field_idx = self._character_field.pop(char_idx, None)
+        if field_idx is not None:
+            field_bits[field_idx] = field_bits.get(field_idx, 0) & mask
+
+    def set_character(self, char_idx: int, field_idx: int):
+        """
+        커밋 후 호출. 태그는 tag_index 가 반영.
+        """
+        if not self.loaded:
+            return  # 처음 조회할 때 전체를 읽으므로 그때 반영됨
+        bit = 1 << char_idx
+        with self._lock:
+            field_bits = dict(self.field_bits)
+            self._remove_locked(char_idx, field_bits)
+            self.active |= bit
+            field_bits[field_idx] = field_bits.get(field_idx, 0) | bit
+            self._character_field[char_idx] = field_idx
+            self.field_bits = field_bits
+
+    def remove_character(self, char_idx: int):
+        if not self.loaded:
+            return
+        with self._lock:
+            field_bits = dict(self.field_bits)
+            self._remove_locked(char_idx, field_bits)
+            self.field_bits = field_bits
+
+    def browse(self, field_ids=None, tag_names=None, match_all: bool = True, offset: int = 0, limit: int = 10) -> dict:
+        """
+        {"total", "char_ids"(최근 생성 순 페이지), "fields": [{field_idx, field_category, count}], "tags": [{tag_name, count}]}
+        """
+        self.ensure_loaded()
+        # 갱신은 dict 를 통째로 교체하므로 참조만 한 번에 가져오면 일관된 값을 씀
+        with self._lock:
+            active = self.active
+            field_bits = self.field_bits
+            field_categories = self.field_categories
+
+        tag_filter = active
+        if tag_names:
+            postings = [bits_from(posting) for posting in tag_index.postings(tag_names)]
+            if postings:
+                if match_all:
+                    for bits in postings:
+                        tag_filter &= bits
+                else:
+                    tag_filter = 0
+                    for bits in postings:
+                        tag_filter |= bits
+                    tag_filter &= active
+
+        field_filter = active
+        if field_ids:
+            field_filter = 0
+            for field_idx in field_ids:
+                field_filter |= field_bits.get(field_idx, 0)
+
+        matched = tag_filter & field_filter
+
+        field_facets = [
+            {"field_idx": field_idx, "field_category": field_categories.get(field_idx), "count": (bits & tag_filter).bit_count()}
+            for field_idx, bits in field_bits.items()
+        ]
+        field_facets = sorted((facet for facet in field_facets if facet["count"]), key=lambda facet: facet["field_idx"])
+
+        # 결과에 포함된 캐릭터의 태그만 셈 (전체 태그 사전을 훑지 않음)
+        tag_counts = tag_index.count_tags(iter_bits(matched))
+        tag_facets = sorted(
+            ({"tag_name": tag_name, "count": count} for tag_name, count in tag_counts.items()),
+            key=lambda facet: (-facet["count"], facet["tag_name"]),
+        )
+
+        return {
+            "total": matched.bit_count(),
+            "char_ids": page_bits(matched, offset, limit),
+            "fields": field_facets,
+            "tags": tag_facets[:MAX_TAG_FACETS],
+        }
+
+
+facet_index = FacetIndex()
+
+
+def refresh_facet_index():
+    facet_index.reload()
@@ -0,0 +1,184 @@
+"""
+목록 API 용 빠른 JSON 응답 경로.
+
+- FastJSONResponse : orjson 으로 직렬화하는 Response (orjson 미설치 시 표준 json 사용)
+- RowSerializer    : SQLAlchemy 컬럼 선택(db.query(col1, col2, ...))에서 키 목록을 미리 만들어 두고
+                     결과 row 를 dict 로 바꾸는 직렬화기. 일부 키에 변환 함수를 지정할 수 있음
+- sparse_fields    : ?fields=char_idx,char_name 쿼리 파라미터. RowSerializer.project 로 선택 컬럼을 줄여
+                     SQL 에서 읽는 컬럼과 응답 키를 함께 줄임
+
+엔드포인트에서 FastJSONResponse 를 직접 반환하면 FastAPI 의 response_model 검증과
+jsonable_encoder 를 거치지 않습니다. (response_model 은 문서용으로만 남음)
+datetime 은 orjson 이 isoformat 과 같은 문자열로 변환합니다.
+
+벤치마크 (app 디렉토리에서 실행):
+    python fast_json.py --rows 1000 --repeat 50
+"""
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional
+from starlette.responses import Response
+from datetime import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 미설치 시 표준 json 으로 동작 (응답 형식은 동일)
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} 은(는) JSON 으로 변환할 수 없습니다.")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def column_key(column) -> str:
+    """
+    query 결과 row 의 키와 같은 이름 (label 이 있으면 label, 없으면 컬럼 이름). 문자열은 그대로 사용.
+    """
+    if isinstance(column, str):
+        return column
+    return getattr(column, "key", None) or column.name
+
+
+class RowSerializer:
+    """
+    컬럼 선택으로부터 만든 row -> dict 직렬화기.
+
+        CARD = RowSerializer(Character.char_idx, Character.char_name, Image.file_path.label("character_image"))
+        rows = db.query(*CARD.columns).all()
+        CARD.serialize_all(rows, character_image=image_url)
+
+    변환 함수는 호출 시점에 넘기므로 요청마다 달라지는 값(base_url 등)을 사용할 수 있습니다.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.keys = tuple(column_key(column) for column in columns)
+
+    def project(self, names: Optional[List[str]], always=(), extra=()) -> "RowSerializer":
+        """
+        names 에 있는 키(와 always)만 남긴 직렬화기. names 가 None 이면 그대로 반환.
+        extra 는 컬럼이 아니라 엔드포인트에서 따로 채우는 키 (예: tags) 로, 허용 목록 검사에만 사용.
+        """
+        if names is None:
+            return self
+        unknown = [name for name in names if name not in self.keys and name not in extra]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"알 수 없는 필드입니다: {', '.join(unknown)} (사용 가능: {', '.join(self.keys + tuple(extra))})"
+            )
+        wanted = set(names) | set(always)
+        return RowSerializer(*[column for column, key in zip(self.columns, self.keys) if key in wanted])
+
+    def serialize_all(self, rows, **transforms) -> list:
+        keys = self.keys
+        # 선택되지 않은 키의 변환은 건너뜀, 변환할 키는 row 의 위치로 미리 바꿔 둠
+        positions = [(key, keys.index(key), func) for key, func in transforms.items() if key in keys]
+        if not positions:
+            return [dict(zip(keys, row)) for row in rows]
+
+        results = []
+        for row in rows:
+            item = dict(zip(keys, row))
+            for key, index, func in positions:
+                item[key] = func(row[index])
+            results.append(item)
+        return results
+
+
+def sparse_fields(fields: Optional[str] = Query(default=None, description="응답에 포함할 키 (쉼표 구분, 생략 시 전체)")):
+    """
+    쉼표로 구분된 필드 목록을 List[str] 로 변환. 없으면 None (전체 필드).
+    """
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()]
+
+
+def wants(fields: Optional[List[str]], name: str) -> bool:
+    return fields is None or name in fields
+
+
+# ====== 벤치마크 ======
+
+def _bench_rows(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        (i, f"캐릭터 {i}", "캐릭터 설명 " * 8, now, i % 12, i % 300, f"./uploads/characters/{i}_image.png")
+        for i in range(count)
+    ]
+
+
+def bench(rows: int, repeat: int):
+    from pydantic import BaseModel
+    from typing import Optional
+    import os
+    import time
+
+    class CardSchema(BaseModel):
+        char_idx: int
+        char_name: str
+        char_description: str
+        created_at: datetime
+        field_idx: int
+        character_owner: int
+        character_image: Optional[str]
+
+    keys = ("char_idx", "char_name", "char_description", "created_at", "field_idx", "character_owner", "character_image")
+    serializer = RowSerializer(*keys)
+    base_url = "http://localhost:8000"
+    image_url = lambda path: f"{base_url}/static/{os.path.basename(path)}" if path else None
+    data = _bench_rows(rows)
+
+    def baseline():
+        # 기존 경로: dict 생성 + isoformat -> response_model 검증 -> jsonable_encoder -> json.dumps
+        items = []
+        for row in data:
+            item = dict(zip(keys, row))
+            item["created_at"] = row[3].isoformat()
+            item["character_image"] = image_url(row[6])
+            items.append(item)
+        try:
+            validated = [CardSchema.model_validate(item) for item in items]
+        except AttributeError:  # pydantic v1
+            validated = [CardSchema.parse_obj(item) for item in items]
+        encoded = jsonable_encoder(validated)
+        return json.dumps(encoded, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+    def fast():
+        return dumps(serializer.serialize_all(data, character_image=image_url))
+
+    print(f"{rows}행 x {repeat}회, orjson {'사용' if orjson else '미설치'}")
+    for name, func in (("baseline", baseline), ("fast", fast)):
+        func()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        elapsed = (time.perf_counter() - started) / repeat
+        print(f"{name:>10}: {elapsed * 1000:.2f} ms/응답")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="목록 응답 직렬화 벤치마크")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    bench(args.rows, args.repeat)
@@ -0,0 +1,305 @@
+"""
+팔로우 기반 추천 피드 (아이템-아이템 협업 필터링).
+
+활성 팔로우(friends)로 사용자 x 캐릭터 희소 행렬 M 을 만들고, 전체 재계산(rebuild_feeds)에서
+- 캐릭터 간 함께 팔로우된 수 C = M.T @ M 을 코사인으로 정규화해 캐릭터별 top-N 이웃을 character_cofollows 에
+- 사용자별 점수 M @ S (팔로우한 캐릭터들의 이웃 점수 합, 이미 팔로우한 캐릭터 제외) top-N 을 user_feeds 에
+저장합니다. 전체 재계산은 API 워커마다 돌지 않도록 cron 등에서 `python feed.py rebuild` 로 실행하고
+(FEED_REBUILD_INTERVAL 을 설정하면 API 프로세스에서도 주기 실행), 동시에 실행되면 advisory lock 을 얻은 하나만 계산합니다.
+팔로우/언팔로우 시에는 그 사용자의 피드만 저장된 이웃 목록으로 다시 계산합니다 (refresh_user_feed).
+/api/users/{user_idx}/feed 는 PK 조회 한 번과 카드 조회 한 번으로 응답하고,
+피드가 없는 사용자에게는 인기 순위(character_rankings) 상위 캐릭터를 반환합니다.
+
+사용법 (app 디렉토리에서 실행):
+    python feed.py rebuild
+"""
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from dotenv import load_dotenv
+import argparse
+import time
+import os
+
+from database import (
+    SessionLocal, Character, Friend, CharacterCofollow, UserFeed, CharacterRanking, Image, ImageMapping
+)
+from storage import media_url
+from job_watermark import db_now
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # 미설치 시 저장된 피드 조회와 사용자별 갱신만 동작
+    np = sparse = None
+
+# .env 파일 로드
+load_dotenv()
+
+REBUILD_INTERVAL = float(os.getenv("FEED_REBUILD_INTERVAL", "0"))  # 초, 0 이면 API 프로세스에서 실행하지 않음
+REBUILD_LOCK_KEY = 4802001  # pg_try_advisory_xact_lock 키 (전체 재계산은 한 번에 하나만)
+NEIGHBOR_SIZE = 50  # 캐릭터별 저장할 이웃 수
+FEED_SIZE = int(os.getenv("FEED_SIZE", "100"))  # 사용자별 저장할 추천 수
+USER_BLOCK = 5000  # 사용자 점수 계산 블록 크기
+MAX_PAGE_SIZE = 50
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def top_n(indices, scores, n: int) -> list:
+    """
+    (위치 배열, 점수 배열) 에서 점수 상위 n 개의 (위치, 점수).
+    """
+    if len(scores) > n:
+        keep = np.argpartition(-scores, n - 1)[:n]
+        indices, scores = indices[keep], scores[keep]
+    order = np.argsort(-scores)
+    return [(int(indices[i]), float(scores[i])) for i in order]
+
+
+def load_follow_matrix(db: Session):
+    """
+    활성 캐릭터에 대한 활성 팔로우로 (사용자 id 목록, 캐릭터 id 목록, 사용자 x 캐릭터 CSR 행렬) 생성.
+    """
+    rows = (
+        db.query(Friend.user_idx, Friend.char_idx)
+        .join(Character, Character.char_idx == Friend.char_idx)
+        .filter(Friend.is_active == True, Character.is_active == True)
+        .distinct()
+        .all()
+    )
+    user_ids = sorted({user_idx for user_idx, _ in rows})
+    char_ids = sorted({char_idx for _, char_idx in rows})
+    user_position = {user_idx: i for i, user_idx in enumerate(user_ids)}
+    char_position = {char_idx: i for i, char_idx in enumerate(char_ids)}
+
+    matrix = sparse.csr_matrix(
+        (
+            np.ones(len(rows), dtype=np.float32),
+            ([user_position[user_idx] for user_idx, _ in rows], [char_position[char_idx] for _, char_idx in rows]),
+        ),
+        shape=(len(user_ids), len(char_ids)),
+    )
+    return user_ids, char_ids, matrix
+
+
+def item_similarity(matrix):
+    """
+    캐릭터 x 캐릭터 코사인 유사도 (함께 팔로우된 수 / sqrt(팔로워 수 곱)), 대각선 제외, 캐릭터별 top-N 만 남긴 CSR.
+    """
+    cooccurrence = (matrix.T @ matrix).tocsr()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    norms = np.sqrt(np.maximum(counts, 1)).astype(np.float32)
+    inverse = sparse.diags(1.0 / norms)
+    similarity = (inverse @ cooccurrence @ inverse).tocsr()
+
+    # 행별 top-N 만 유지 (희소성 유지, 사용자 점수 계산량 제한)
+    data, indices, indptr = [], [], [0]
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        for column, score in top_n(similarity.indices[start:end], similarity.data[start:end], NEIGHBOR_SIZE):
+            indices.append(column)
+            data.append(score)
+        indptr.append(len(indices))
+    return sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=similarity.shape,
+    )
+
+
+def upsert_feeds(db: Session, feeds: list):
+    """
+    user_feeds 를 INSERT ... ON CONFLICT DO UPDATE 로 저장.
+    전체 재계산과 사용자별 갱신이 같은 행을 동시에 써도 충돌하지 않고, 더 나중에 시작한 쪽(updated_at)이 남음.
+    """
+    if not feeds:
+        return
+    statement = insert(UserFeed).values(feeds)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[UserFeed.user_idx],
+        set_={"items": statement.excluded.items, "updated_at": statement.excluded.updated_at},
+        where=UserFeed.updated_at <= statement.excluded.updated_at,
+    ))
+
+
+def rebuild_feeds(db: Session = None) -> int:
+    """
+    캐릭터 이웃과 전체 사용자 피드를 다시 계산. 저장한 사용자 수를 반환.
+    """
+    if sparse is None:
+        print("numpy / scipy 가 설치되지 않아 피드를 계산할 수 없습니다.")
+        return 0
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # 다른 워커 / cron 이 재계산 중이면 건너뜀 (잠금은 트랜잭션이 끝날 때 풀림)
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+            print("다른 프로세스에서 피드를 재계산하고 있어 건너뜁니다.")
+            return 0
+        started = time.perf_counter()
+        user_ids, char_ids, matrix = load_follow_matrix(db)
+        if not char_ids:
+            return 0
+        similarity = item_similarity(matrix)
+        now = db_now(db)  # 이 트랜잭션의 시작 시각 (사용자별 갱신의 updated_at 과 같은 시계)
+
+        # 읽는 쪽은 커밋 전까지 이전 결과를 봄
+        db.query(CharacterCofollow).delete(synchronize_session=False)
+        db.bulk_insert_mappings(CharacterCofollow, [
+            {
+                "char_idx": char_ids[row],
+                "neighbors": [
+                    [char_ids[column], round(float(score), 4)]
+                    for column, score in zip(
+                        similarity.indices[similarity.indptr[row]:similarity.indptr[row + 1]],
+                        similarity.data[similarity.indptr[row]:similarity.indptr[row + 1]],
+                    )
+                ],
+                "updated_at": now,
+            }
+            for row in range(len(char_ids))
+            if similarity.indptr[row + 1] > similarity.indptr[row]
+        ])
+
+        for start in range(0, len(user_ids), USER_BLOCK):
+            block = matrix[start:start + USER_BLOCK]
+            scores = (block @ similarity).tocsr()
+            feeds = []
+            for offset in range(block.shape[0]):
+                followed = set(block.indices[block.indptr[offset]:block.indptr[offset + 1]])
+                row_start, row_end = scores.indptr[offset], scores.indptr[offset + 1]
+                columns = scores.indices[row_start:row_end]
+                values = scores.data[row_start:row_end]
+                keep = np.fromiter((column not in followed for column in columns), dtype=bool, count=len(columns))
+                items = top_n(columns[keep], values[keep], FEED_SIZE)
+                if items:
+                    feeds.append({
+                        "user_idx": user_ids[start + offset],
+                        "items": [[char_ids[column], round(score, 4)] for column, score in items],
+                        "updated_at": now,
+                    })
+            upsert_feeds(db, feeds)
+        # 이번 계산에 포함되지 않은 사용자(팔로우가 없어진 사용자)의 이전 피드 삭제
+        db.query(UserFeed).filter(UserFeed.updated_at < now).delete(synchronize_session=False)
+        db.commit()
+        print(f"피드 재계산: 사용자 {len(user_ids)}명, 캐릭터 {len(char_ids)}개, {time.perf_counter() - started:.1f}초")
+        return len(user_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def refresh_user_feed(user_idx: int):
+    """
+    사용자 한 명의 피드를 저장된 캐릭터 이웃 목록으로 다시 계산 (팔로우/언팔로우 후 BackgroundTasks 로 실행).
+    팔로우한 캐릭터 수 만큼의 이웃 목록만 읽으므로 전체 재계산 없이 바로 반영됩니다.
+    """
+    db = SessionLocal()
+    try:
+        followed = {
+            char_idx for (char_idx,) in
+            db.query(Friend.char_idx).filter(Friend.user_idx == user_idx, Friend.is_active == True).all()
+        }
+        scores = defaultdict(float)
+        if followed:
+            for (neighbors,) in db.query(CharacterCofollow.neighbors).filter(CharacterCofollow.char_idx.in_(followed)).all():
+                for char_idx, score in neighbors:
+                    if char_idx not in followed:
+                        scores[char_idx] += score
+        items = sorted(scores.items(), key=lambda item: -item[1])[:FEED_SIZE]
+
+        if items:
+            upsert_feeds(db, [{
+                "user_idx": user_idx,
+                "items": [[char_idx, round(score, 4)] for char_idx, score in items],
+                "updated_at": func.localtimestamp(),
+            }])
+        else:
+            db.query(UserFeed).filter(UserFeed.user_idx == user_idx).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"피드 갱신 실패 (user_idx={user_idx}): {e}")
+    finally:
+        db.close()
+
+
+# ====== API ======
+
+@router.get("/api/users/{user_idx}/feed", response_model=dict)
+def get_user_feed(
+    user_idx: int,
+    limit: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    사용자 추천 피드. source 는 "cofollow"(팔로우 기반) 또는 "trending"(피드가 없는 사용자).
+    """
+    feed = db.query(UserFeed.items).filter(UserFeed.user_idx == user_idx).scalar()
+    if feed:
+        source = "cofollow"
+        scores = dict((char_idx, score) for char_idx, score in feed)
+        # 삭제된 캐릭터를 건너뛰어도 limit 을 채우도록 여유 있게 조회
+        candidate_ids = [char_idx for char_idx, _ in feed[:limit * 2]]
+    else:
+        source = "trending"
+        ranked = (
+            db.query(CharacterRanking.char_idx, CharacterRanking.score)
+            .filter(CharacterRanking.rank.isnot(None), CharacterRanking.rank <= limit * 2)
+            .all()
+        )
+        scores = dict(ranked)
+        candidate_ids = list(scores)
+
+    rows = []
+    if candidate_ids:
+        rows = (
+            db.query(Character.char_idx, Character.char_name, Character.char_description, Character.field_idx, Image.file_path)
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+            .filter(Character.char_idx.in_(candidate_ids), Character.is_active == True)
+            .all()
+        )
+    rows.sort(key=lambda row: -scores[row.char_idx])
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    items = [
+        {
+            "char_idx": char_idx,
+            "char_name": char_name,
+            "char_description": char_description,
+            "field_idx": field_idx,
+            "character_image": media_url(base_url, image_path),
+            "score": scores[char_idx],
+        }
+        for char_idx, char_name, char_description, field_idx, image_path in rows[:limit]
+    ]
+    return {"user_idx": user_idx, "source": source, "items": items}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="팔로우 기반 추천 피드")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+    rebuild_feeds()
@@ -4,7 +4,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.future import select
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from datetime import datetime, timedelta
@@ -12,6 +12,8 @@ import os
 from dotenv import load_dotenv
 from jose import jwt, JWTError
 from database import SessionLocal, Friend, Character, User
+from follower_counter import change_follower_count
+import feed
 
 # .env 파일 로드
 load_dotenv()
@@ -45,6 +47,7 @@ class FollowRequest(BaseModel):
 @router.post("/users/{user_idx}/follow", response_model=dict)
 async def add_character_to_user(
     user_idx: int,
+    background_tasks: BackgroundTasks,
     request: FollowRequest = Body(...),
     db: Session = Depends(get_db)
 ):
@@ -65,7 +68,9 @@ async def add_character_to_user(
 
         new_follow = Friend(user_idx=request.user_idx, char_idx=request.char_idx)
         db.add(new_follow)
+        change_follower_count(db, request.char_idx, 1)
         db.commit()
+        background_tasks.add_task(feed.refresh_user_feed, request.user_idx)
         return {"message": f"캐릭터 {request.char_idx}가 유저 {request.user_idx}에게 추가되었습니다."}
 
     except Exception as e:
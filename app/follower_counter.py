@@ -0,0 +1,120 @@
+"""
+캐릭터 팔로워 수 비정규화 카운터.
+
+characters.follower_count 는 팔로우/언팔로우와 같은 트랜잭션에서 change_follower_count 로 갱신하고,
+reconcile_follower_counts 가 주기적으로 friends 테이블 기준 실제 값과 비교해 어긋난 값을 바로잡습니다.
+팔로우마다 전역 카탈로그 ETag 행(change_counters 'characters')을 갱신하면 모든 팔로우 트랜잭션이 한 행 잠금에
+직렬화되고 목록 ETag 가 계속 바뀌므로, 팔로우 시에는 캐릭터 상세 버전만 올리고
+목록 버전은 FOLLOWER_CATALOG_BUMP_INTERVAL 마다 (그 사이 팔로우가 있었을 때만) 올립니다.
+
+사용법 (app 디렉토리에서 실행):
+    python follower_counter.py migrate    # 컬럼 추가 + 초기값 계산
+    python follower_counter.py reconcile  # 수동 보정
+"""
+from sqlalchemy import text, func
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+import argparse
+import threading
+import os
+
+from database import engine, SessionLocal, Character
+import etag
+
+# .env 파일 로드
+load_dotenv()
+
+CATALOG_BUMP_INTERVAL = float(os.getenv("FOLLOWER_CATALOG_BUMP_INTERVAL", "60"))  # 초
+
+# 이 프로세스에서 마지막 목록 버전 갱신 이후 팔로워 수가 바뀌었는지
+_catalog_dirty = threading.Event()
+
+RECONCILE_SQL = text(
+    """
+    UPDATE characters AS c
+    SET follower_count = COALESCE(f.cnt, 0)
+    FROM characters AS c2
+    LEFT JOIN (
+        SELECT char_idx, count(*) AS cnt
+        FROM friends
+        WHERE is_active = true
+        GROUP BY char_idx
+    ) AS f ON f.char_idx = c2.char_idx
+    WHERE c.char_idx = c2.char_idx
+      AND c.follower_count <> COALESCE(f.cnt, 0)
+    RETURNING c.char_idx
+    """
+)
+
+
+def change_follower_count(db: Session, char_idx: int, delta: int):
+    """
+    팔로워 수를 원자적으로 증감. 커밋은 호출한 쪽 트랜잭션에서 함께 수행.
+    """
+    db.query(Character).filter(Character.char_idx == char_idx).update(
+        # 음수가 되지 않도록 0 하한
+        {Character.follower_count: func.greatest(Character.follower_count + delta, 0)},
+        synchronize_session=False
+    )
+    # 상세 응답 ETag 는 바로 갱신, 목록(CATALOG) 은 bump_catalog_version 에서 모아서 갱신
+    etag.bump(db, etag.character_counter(char_idx))
+    _catalog_dirty.set()
+
+
+def bump_catalog_version():
+    """
+    마지막 실행 이후 팔로워 수가 바뀌었으면 목록 ETag 버전을 한 번 올림 (주기 실행).
+    """
+    if not _catalog_dirty.is_set():
+        return
+    _catalog_dirty.clear()
+    db = SessionLocal()
+    try:
+        etag.bump(db, etag.CATALOG)
+        db.commit()
+    except Exception:
+        db.rollback()
+        _catalog_dirty.set()
+        raise
+    finally:
+        db.close()
+
+
+def reconcile_follower_counts(db: Session = None) -> int:
+    """
+    friends 테이블 기준으로 어긋난 follower_count 를 보정하고 보정한 캐릭터 수를 반환.
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        fixed = db.execute(RECONCILE_SQL).scalars().all()
+        if fixed:
+            etag.bump(db, etag.CATALOG, *[etag.character_counter(char_idx) for char_idx in fixed])
+        db.commit()
+        if fixed:
+            print(f"follower_count 보정: {len(fixed)}개 캐릭터")
+        return len(fixed)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def migrate():
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE characters ADD COLUMN IF NOT EXISTS follower_count INTEGER NOT NULL DEFAULT 0"))
+    reconcile_follower_counts()
+    print("follower_count 마이그레이션 완료")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="팔로워 수 카운터 관리")
+    parser.add_argument("command", choices=["migrate", "reconcile"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    else:
+        reconcile_follower_counts()
@@ -0,0 +1,399 @@
+"""
+그룹 채팅.
+
+한 그룹(group_chats)에 여러 캐릭터(group_chat_characters)가 참여하고, 사용자가 메시지를 보내면
+모든 캐릭터의 LangChain 요청을 동시에 보내 먼저 끝난 답변부터 NDJSON 으로 스트리밍합니다.
+- 동시 요청 수는 그룹마다 GROUP_CHAT_CONCURRENCY 개로 제한 (같은 그룹에 동시에 보낸 메시지도 함께 제한)
+- 캐릭터 페르소나는 (char_prompt_id, 캐릭터 이름, 호칭) 별로 캐싱
+  (프롬프트 내용이 같으면 id 를 재사용하므로 이름 / 호칭만 바꾼 수정도 키에 반영되도록 함께 사용)
+- 대화 내역은 group_chat_messages 에 그룹당 한 번만 저장하고 모든 캐릭터가 같은 내역을 참고
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import List, Optional
+from dotenv import load_dotenv
+import asyncio
+import threading
+import weakref
+import os
+
+from database import (
+    SessionLocal, GroupChat, GroupChatCharacter, GroupChatMessage, Character, CharacterPrompt, User
+)
+from fast_json import dumps
+from langchain_client import send_to_langchain
+from persona import build_persona_payload
+
+# .env 파일 로드
+load_dotenv()
+
+GROUP_CHAT_CONCURRENCY = int(os.getenv("GROUP_CHAT_CONCURRENCY", "4"))  # 그룹당 LangChain 동시 요청 수
+GROUP_CHAT_MAX_MEMBERS = int(os.getenv("GROUP_CHAT_MAX_MEMBERS", "8"))
+GROUP_CHAT_HISTORY_LIMIT = 30  # LangChain 에 보낼 최근 메시지 수
+PERSONA_CACHE_SIZE = 1024
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ====== Pydantic 스키마 ======
+
+class CreateGroupChatSchema(BaseModel):
+    user_idx: int
+    chat_title: Optional[str] = None
+    chat_prompt: Optional[str] = None  # 그룹 대화 상황 설명
+    char_ids: List[int]
+
+class GroupMessageSchema(BaseModel):
+    content: str
+
+
+# ====== 페르소나 캐시 ======
+
+class PersonaCache:
+    """
+    (char_prompt_id, char_name, nicknames) -> 페르소나 dict 의 LRU 캐시. 스레드풀에서 접근하므로 잠금을 사용합니다.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys) -> dict:
+        with self._lock:
+            found = {}
+            for key in keys:
+                persona = self._entries.get(key)
+                if persona is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = persona
+            return found
+
+    def put(self, key: tuple, persona: dict):
+        with self._lock:
+            self._entries[key] = persona
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+persona_cache = PersonaCache(PERSONA_CACHE_SIZE)
+
+# 그룹 채팅에는 채팅방별 호칭/소개가 없으므로 빈 값으로 페르소나를 만듦
+GROUP_CHAT_ROOM = SimpleNamespace(user_unique_name=None, user_introduction=None)
+
+
+def load_member_personas(db: Session, group_chat_idx: int) -> list:
+    """
+    그룹 참여 캐릭터의 [(char_idx, char_name, 페르소나)] 를 반환.
+    최신 char_prompt_id 만 조회하고, 캐시에 없는 프롬프트만 한 번에 읽어 페르소나를 만듦.
+    """
+    # 재사용된 프롬프트는 created_at 만 갱신되므로 id 가 아니라 created_at 기준으로 최신을 찾음
+    latest = (
+        db.query(CharacterPrompt.char_idx, func.max(CharacterPrompt.created_at).label("latest_created_at"))
+        .group_by(CharacterPrompt.char_idx)
+        .subquery()
+    )
+    members = (
+        db.query(Character.char_idx, Character.char_name, Character.nicknames, CharacterPrompt.char_prompt_id)
+        .join(GroupChatCharacter, GroupChatCharacter.char_idx == Character.char_idx)
+        .join(latest, latest.c.char_idx == Character.char_idx)
+        .join(
+            CharacterPrompt,
+            (CharacterPrompt.char_idx == latest.c.char_idx) &
+            (CharacterPrompt.created_at == latest.c.latest_created_at)
+        )
+        .filter(GroupChatCharacter.group_chat_idx == group_chat_idx, Character.is_active == True)
+        .order_by(GroupChatCharacter.group_chars_idx)
+        .all()
+    )
+
+    # 페르소나에 들어가는 캐릭터 정보(이름, 호칭)도 키에 포함
+    keys = [(prompt_id, char_name, nicknames) for _, char_name, nicknames, prompt_id in members]
+    personas = persona_cache.get_many(keys)
+    missing = [key[0] for key in keys if key not in personas]
+    if missing:
+        rows = (
+            db.query(CharacterPrompt, Character)
+            .join(Character, Character.char_idx == CharacterPrompt.char_idx)
+            .filter(CharacterPrompt.char_prompt_id.in_(missing))
+            .all()
+        )
+        for prompt, character in rows:
+            key = (prompt.char_prompt_id, character.char_name, character.nicknames)
+            persona = build_persona_payload(GROUP_CHAT_ROOM, prompt, character)
+            persona_cache.put(key, persona)
+            personas[key] = persona
+
+    return [
+        (char_idx, char_name, personas[key])
+        for (char_idx, char_name, _, _), key in zip(members, keys)
+        if key in personas
+    ]
+
+
+def get_group_history(db: Session, group_chat_idx: int, limit: int = GROUP_CHAT_HISTORY_LIMIT) -> str:
+    """
+    그룹의 최근 대화 내역을 "이름: 내용" 줄로 반환 (오래된 순).
+    """
+    messages = (
+        db.query(GroupChatMessage.content, Character.char_name)
+        .outerjoin(Character, Character.char_idx == GroupChatMessage.char_idx)
+        .filter(GroupChatMessage.group_chat_idx == group_chat_idx)
+        .order_by(GroupChatMessage.created_at.desc(), GroupChatMessage.message_idx.desc())
+        .limit(limit)
+        .all()
+    )
+    return "\n".join(f"{char_name or 'user'}: {content}" for content, char_name in reversed(messages))
+
+
+def get_active_group(db: Session, group_chat_idx: int) -> GroupChat:
+    group = db.query(GroupChat).filter(
+        GroupChat.group_chat_idx == group_chat_idx,
+        GroupChat.is_deleted == False
+    ).first()
+    if not group:
+        raise HTTPException(status_code=404, detail="그룹 채팅을 찾을 수 없습니다.")
+    return group
+
+
+def prepare_turn(group_chat_idx: int, content: str) -> dict:
+    """
+    사용자 메시지를 저장하고 이번 턴에 필요한 그룹 정보/페르소나/대화 내역을 한 번에 조회.
+    """
+    db = SessionLocal()
+    try:
+        group = get_active_group(db, group_chat_idx)
+        members = load_member_personas(db, group_chat_idx)
+        if not members:
+            raise HTTPException(status_code=400, detail="그룹에 참여 중인 캐릭터가 없습니다.")
+
+        # 내역은 사용자 메시지를 저장하기 전에 읽고, 이번 메시지는 user_message 로 따로 보냄
+        history = get_group_history(db, group_chat_idx)
+        db.add(GroupChatMessage(group_chat_idx=group_chat_idx, content=content))
+        db.commit()
+        return {
+            "chat_prompt": group.chat_prompt,
+            "members": members,
+            "history": history,
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def save_replies(group_chat_idx: int, replies: list):
+    """
+    캐릭터 답변을 한 번에 저장. replies: [(char_idx, content)] (도착 순서)
+    """
+    if not replies:
+        return
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(GroupChatMessage, [
+            {"group_chat_idx": group_chat_idx, "char_idx": char_idx, "content": content}
+            for char_idx, content in replies
+        ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# 그룹별 세마포어. 요청이 모두 끝나면 참조가 사라져 자동으로 정리됨
+_group_semaphores = weakref.WeakValueDictionary()
+
+
+def group_semaphore(group_chat_idx: int) -> asyncio.Semaphore:
+    semaphore = _group_semaphores.get(group_chat_idx)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(GROUP_CHAT_CONCURRENCY)
+        _group_semaphores[group_chat_idx] = semaphore
+    return semaphore
+
+
+async def ask_member(semaphore: asyncio.Semaphore, group_chat_idx: int, member: tuple, turn: dict, content: str) -> dict:
+    char_idx, char_name, persona = member
+    request_data = {
+        **persona,
+        "user_message": content,
+        "favorability": 0,
+        "chat_history": turn["history"],
+        "group_prompt": turn["chat_prompt"],  # 그룹 대화 상황
+        "group_members": [name for _, name, _ in turn["members"]],
+    }
+    async with semaphore:
+        try:
+            response_data = await send_to_langchain(request_data, f"group-{group_chat_idx}-{char_idx}")
+        except HTTPException as e:
+            return {"char_idx": char_idx, "char_name": char_name, "error": e.detail}
+    return {
+        "char_idx": char_idx,
+        "char_name": char_name,
+        "text": response_data.get("text", "openai_api 에러가 발생했습니다."),
+    }
+
+
+async def stream_replies(group_chat_idx: int, turn: dict, content: str):
+    """
+    캐릭터 답변을 끝나는 순서대로 한 줄씩 내보냄. 클라이언트가 연결을 끊으면 남은 요청은 취소.
+    """
+    semaphore = group_semaphore(group_chat_idx)
+    tasks = [
+        asyncio.ensure_future(ask_member(semaphore, group_chat_idx, member, turn, content))
+        for member in turn["members"]
+    ]
+    replies = []
+    try:
+        for next_reply in asyncio.as_completed(tasks):
+            reply = await next_reply
+            if "text" in reply:
+                replies.append((reply["char_idx"], reply["text"]))
+            yield dumps(reply) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+        try:
+            await run_in_threadpool(save_replies, group_chat_idx, replies)
+        except Exception as e:
+            print(f"그룹 채팅 답변 저장 실패 (group_chat_idx={group_chat_idx}): {e}")
+
+
+# ====== API ======
+
+@router.post("/api/group-chat/", response_model=dict)
+def create_group_chat(group: CreateGroupChatSchema, db: Session = Depends(get_db)):
+    char_ids = list(dict.fromkeys(group.char_ids))
+    if not char_ids:
+        raise HTTPException(status_code=400, detail="캐릭터를 한 명 이상 선택하세요.")
+    if len(char_ids) > GROUP_CHAT_MAX_MEMBERS:
+        raise HTTPException(status_code=400, detail=f"그룹 채팅에는 최대 {GROUP_CHAT_MAX_MEMBERS}명까지 참여할 수 있습니다.")
+    try:
+        if not db.query(User.user_idx).filter(User.user_idx == group.user_idx).first():
+            raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다.")
+
+        found = {
+            char_idx for (char_idx,) in
+            db.query(Character.char_idx).filter(Character.char_idx.in_(char_ids), Character.is_active == True).all()
+        }
+        missing = [char_idx for char_idx in char_ids if char_idx not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"캐릭터를 찾을 수 없습니다: {missing}")
+
+        new_group = GroupChat(user_idx=group.user_idx, chat_title=group.chat_title, chat_prompt=group.chat_prompt)
+        db.add(new_group)
+        db.flush()
+        db.bulk_insert_mappings(GroupChatCharacter, [
+            {"group_chat_idx": new_group.group_chat_idx, "char_idx": char_idx} for char_idx in char_ids
+        ])
+        db.commit()
+        return {"group_chat_idx": new_group.group_chat_idx, "chat_title": new_group.chat_title, "char_ids": char_ids}
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error in create_group_chat: {e}")
+        raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
+
+
+@router.get("/api/group-chat/user/{user_idx}", response_model=List[dict])
+def get_user_group_chats(user_idx: int, db: Session = Depends(get_db)):
+    groups = (
+        db.query(GroupChat.group_chat_idx, GroupChat.chat_title, GroupChat.created_at)
+        .filter(GroupChat.user_idx == user_idx, GroupChat.is_deleted == False)
+        .order_by(GroupChat.created_at.desc())
+        .all()
+    )
+    return [
+        {
+            "group_chat_idx": group_chat_idx,
+            "chat_title": chat_title,
+            "created_at": created_at.isoformat() if created_at else None,
+        }
+        for group_chat_idx, chat_title, created_at in groups
+    ]
+
+
+@router.get("/api/group-chat/{group_chat_idx}", response_model=dict)
+def get_group_chat(group_chat_idx: int, db: Session = Depends(get_db)):
+    group = get_active_group(db, group_chat_idx)
+    members = (
+        db.query(Character.char_idx, Character.char_name)
+        .join(GroupChatCharacter, GroupChatCharacter.char_idx == Character.char_idx)
+        .filter(GroupChatCharacter.group_chat_idx == group_chat_idx)
+        .order_by(GroupChatCharacter.group_chars_idx)
+        .all()
+    )
+    messages = (
+        db.query(GroupChatMessage.message_idx, GroupChatMessage.char_idx, GroupChatMessage.content, GroupChatMessage.created_at)
+        .filter(GroupChatMessage.group_chat_idx == group_chat_idx)
+        .order_by(GroupChatMessage.created_at, GroupChatMessage.message_idx)
+        .all()
+    )
+    return {
+        "group_chat_idx": group.group_chat_idx,
+        "user_idx": group.user_idx,
+        "chat_title": group.chat_title,
+        "chat_prompt": group.chat_prompt,
+        "members": [{"char_idx": char_idx, "char_name": char_name} for char_idx, char_name in members],
+        "messages": [
+            {
+                "message_idx": message_idx,
+                "char_idx": char_idx,  # None 이면 사용자 메시지
+                "content": content,
+                "created_at": created_at.isoformat() if created_at else None,
+            }
+            for message_idx, char_idx, content, created_at in messages
+        ],
+    }
+
+
+@router.post("/api/group-chat/{group_chat_idx}/messages")
+async def send_group_message(group_chat_idx: int, message: GroupMessageSchema):
+    """
+    사용자 메시지를 저장하고 참여 캐릭터들의 답변을 끝나는 순서대로 스트리밍합니다.
+    응답은 application/x-ndjson 으로 한 줄에 하나씩
+    {"char_idx": ..., "char_name": ..., "text": ...} (실패 시 "text" 대신 "error") 입니다.
+    """
+    content = message.content.strip()
+    if not content:
+        raise HTTPException(status_code=400, detail="메시지를 입력하세요.")
+    try:
+        turn = await run_in_threadpool(prepare_turn, group_chat_idx, content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in send_group_message: {e}")
+        raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
+
+    return StreamingResponse(stream_replies(group_chat_idx, turn, content), media_type="application/x-ndjson")
+
+
+@router.delete("/api/group-chat/{group_chat_idx}")
+def delete_group_chat(group_chat_idx: int, db: Session = Depends(get_db)):
+    group = get_active_group(db, group_chat_idx)
+    group.is_deleted = True
+    db.commit()
+    return {"message": "그룹 채팅이 삭제되었습니다."}
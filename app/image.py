@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from database import SessionLocal, Image, ImageMapping, Character
-from fastapi.responses import FileResponse
+from image_cache import resolve_image, resolve_static, image_url, serve_image
+from storage import download_url
 import os
 
 # APIRouter 인스턴스 생성
@@ -33,27 +35,29 @@ def get_user_images(request: Request, user_idx: int, db: Session = Depends(get_d
             raise HTTPException(status_code=404, detail="해당 유저에 연결된 이미지가 없습니다.")
 
         base_url = str(request.base_url).rstrip("/")
+        # 경로는 이미 조회했으므로 이미지 경로 캐시를 채우면서 버전이 붙은 URL 생성
         return [
-            {"img_idx": img.img_idx, "file_path": f"{base_url}/images/{img.img_idx}"}
+            {"img_idx": img.img_idx, "file_path": image_url(base_url, img.img_idx, img.file_path)}
             for img in images
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@router.get("/images/{img_idx}")
-def get_image(img_idx: int, db: Session = Depends(get_db)):
-    # 데이터베이스에서 img_idx에 해당하는 이미지 경로 검색
-    image = db.query(Image).filter(Image.img_idx == img_idx).first()
-
-    if not image:
-        raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다.")
-
-    # 이미지 파일 경로 생성
-    file_path = image.file_path
-
-    # 이미지 파일이 존재하는지 확인
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="이미지 파일이 존재하지 않습니다.")
-
-    # 이미지 파일 반환
-    return FileResponse(file_path)
\ No newline at end of file
+@router.api_route("/images/{img_idx}", methods=["GET", "HEAD"])
+def get_image(img_idx: int, request: Request):
+    # 경로 / 크기 / ETag 는 메모리 캐시에서 조회 (캐시에 없을 때만 DB 조회)
+    entry = resolve_image(img_idx)
+    if entry.remote:
+        # 오브젝트 스토리지의 이미지는 스토리지가 직접 전송
+        return RedirectResponse(download_url(entry.path), status_code=307)
+
+    # ?v= 가 현재 버전과 같으면 내용이 바뀌지 않으므로 immutable 로 캐싱
+    immutable = request.query_params.get("v") == entry.version
+    return serve_image(request, entry, img_idx, immutable)
+
+
+@router.api_route("/static/{filename}", methods=["GET", "HEAD"])
+def get_static_image(filename: str, request: Request):
+    # 업로드 파일명은 고유하므로 항상 immutable
+    entry = resolve_static(filename)
+    return serve_image(request, entry, filename, immutable=True)
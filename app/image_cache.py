@@ -0,0 +1,295 @@
+"""
+이미지 전송.
+
+- ImagePathCache : img_idx -> (경로, 크기, 수정 시각, ETag) 를 메모리에 캐싱해 이미지 요청마다 DB 조회 / stat 을 하지 않음
+                   이미지 교체(캐릭터 수정) 시 invalidate, 다른 서버 프로세스의 변경은 IMAGE_PATH_CACHE_TTL 이내에 반영
+- serve_image      : If-None-Match(304), Range(206, 단일 범위) 처리 후 ImageFileResponse 로 전송
+- ImageFileResponse : 서버가 지원하면 ASGI zerocopy(sendfile) / pathsend 확장으로, 아니면 청크 단위로 파일을 전송
+- IMAGE_ACCEL_REDIRECT_PREFIX 를 설정하면 본문 대신 X-Accel-Redirect 헤더만 보내 앞단 nginx 가 파일을 전송
+- 오브젝트 스토리지(s3://)에 있는 이미지는 RemoteImageEntry 로 캐싱하고 /images/{img_idx} 가 스토리지 URL 로 리다이렉트
+
+/static/{파일명} 은 업로드 시 고유한 파일명을 쓰므로 immutable 로 1년 캐싱하고,
+/images/{img_idx} 는 같은 번호의 이미지가 교체될 수 있어 ?v=버전 이 현재 버전과 같을 때만 immutable 로 캐싱합니다.
+"""
+from fastapi import HTTPException
+from starlette.responses import Response
+from collections import OrderedDict
+from dotenv import load_dotenv
+import mimetypes
+import threading
+import anyio
+import time
+import zlib
+import os
+
+from database import SessionLocal, Image
+from etag import etag_matches
+from storage import is_remote
+
+# .env 파일 로드
+load_dotenv()
+
+STATIC_DIR = "./uploads/characters"  # 캐릭터 이미지 저장 경로 (main.UPLOAD_DIR)
+PATH_CACHE_TTL = float(os.getenv("IMAGE_PATH_CACHE_TTL", "300"))  # 초
+PATH_CACHE_SIZE = int(os.getenv("IMAGE_PATH_CACHE_SIZE", "10000"))
+ACCEL_REDIRECT_PREFIX = os.getenv("IMAGE_ACCEL_REDIRECT_PREFIX")  # 예: "/protected-images/" (nginx internal location)
+CHUNK_SIZE = 64 * 1024
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+class ImageEntry:
+    __slots__ = ("path", "size", "mtime_ns", "etag", "version", "media_type")
+    remote = False
+
+    def __init__(self, path: str, stat_result):
+        self.path = path
+        self.size = stat_result.st_size
+        self.mtime_ns = stat_result.st_mtime_ns
+        self.version = f"{self.mtime_ns:x}-{self.size:x}"
+        self.etag = f'"{self.version}"'
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+class RemoteImageEntry:
+    """
+    오브젝트 스토리지의 이미지. 참조(s3://버킷/키)는 업로드마다 고유하므로 버전으로 사용.
+    """
+    __slots__ = ("path", "version")
+    remote = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = f"{zlib.crc32(path.encode()):x}"
+
+
+def stat_entry(path: str):
+    if is_remote(path):
+        return RemoteImageEntry(path)
+    try:
+        return ImageEntry(path, os.stat(path))
+    except OSError:
+        return None
+
+
+class ImagePathCache:
+    """
+    키 -> ImageEntry 의 TTL + LRU 캐시. 키는 img_idx(int) 또는 static 파일명(str).
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # 키 -> (만료 시각, ImageEntry)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                return None
+            expires_at, entry = cached
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry: ImageEntry):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+path_cache = ImagePathCache(PATH_CACHE_TTL, PATH_CACHE_SIZE)
+
+
+def invalidate_image(img_idx: int, old_path: str = None):
+    """
+    이미지 파일 경로가 바뀌었을 때 (커밋 후) 호출.
+    """
+    path_cache.invalidate(img_idx)
+    if old_path:
+        path_cache.invalidate(os.path.basename(old_path))
+
+
+def resolve_image(img_idx: int) -> ImageEntry:
+    """
+    img_idx 의 파일 정보. 캐시에 없을 때만 DB 를 조회하고 stat 을 실행.
+    """
+    entry = path_cache.get(img_idx)
+    if entry is not None:
+        return entry
+
+    db = SessionLocal()
+    try:
+        file_path = db.query(Image.file_path).filter(Image.img_idx == img_idx).scalar()
+    finally:
+        db.close()
+    if not file_path:
+        raise HTTPException(status_code=404, detail="이미지를 찾을 수 없습니다.")
+
+    entry = stat_entry(file_path)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="이미지 파일이 존재하지 않습니다.")
+    path_cache.put(img_idx, entry)
+    return entry
+
+
+def prime_image(img_idx: int, file_path: str):
+    """
+    이미 DB 에서 경로를 읽은 경우(목록 API) 캐시를 채우고 ImageEntry 를 반환. 파일이 없으면 None.
+    """
+    entry = path_cache.get(img_idx)
+    if entry is not None and entry.path == file_path:
+        return entry
+    entry = stat_entry(file_path)
+    if entry is not None:
+        path_cache.put(img_idx, entry)
+    return entry
+
+
+def resolve_static(filename: str) -> ImageEntry:
+    """
+    /static/{filename} 의 파일 정보 (디렉토리 밖 경로는 거부).
+    """
+    if filename != os.path.basename(filename) or filename.startswith("."):
+        raise HTTPException(status_code=404, detail="이미지 파일이 존재하지 않습니다.")
+    entry = path_cache.get(filename)
+    if entry is None:
+        entry = stat_entry(os.path.join(STATIC_DIR, filename))
+        if entry is None:
+            raise HTTPException(status_code=404, detail="이미지 파일이 존재하지 않습니다.")
+        path_cache.put(filename, entry)
+    return entry
+
+
+def image_url(base_url: str, img_idx: int, file_path: str = None) -> str:
+    """
+    버전이 붙은 /images/{img_idx}?v=... URL (파일 정보를 모르면 버전 없이).
+    """
+    entry = prime_image(img_idx, file_path) if file_path else path_cache.get(img_idx)
+    if entry is None:
+        return f"{base_url}/images/{img_idx}"
+    return f"{base_url}/images/{img_idx}?v={entry.version}"
+
+
+def parse_range(range_header: str, size: int):
+    """
+    단일 바이트 범위 (start, end) (end 포함). 해석할 수 없거나 여러 범위면 None (전체 전송),
+    만족할 수 없는 범위면 416.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[6:].strip().partition("-")
+    try:
+        if start_text == "":
+            # bytes=-N : 마지막 N 바이트
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="요청한 범위를 만족할 수 없습니다.", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+class ImageFileResponse(Response):
+    """
+    파일의 [offset, offset + count) 구간을 전송. 서버가 지원하면 zerocopy(sendfile) / pathsend 확장 사용.
+    """
+
+    def __init__(self, entry: ImageEntry, cache_key, status_code: int = 200, headers: dict = None, offset: int = 0, count: int = None):
+        self.entry = entry
+        self.cache_key = cache_key
+        self.offset = offset
+        self.count = entry.size - offset if count is None else count
+        headers = dict(headers or {})
+        headers["content-length"] = str(self.count)
+        super().__init__(status_code=status_code, headers=headers, media_type=entry.media_type)
+
+    async def __call__(self, scope, receive, send):
+        # 헤더를 보내기 전에 파일을 열어, 캐시 이후 파일이 지워졌으면 404 로 응답
+        try:
+            f = open(self.entry.path, "rb")
+        except OSError:
+            path_cache.invalidate(self.cache_key)
+            await Response("이미지 파일이 존재하지 않습니다.", status_code=404)(scope, receive, send)
+            return
+
+        with f:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope.get("method") == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+            extensions = scope.get("extensions") or {}
+            if "http.response.zerocopy" in extensions:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+                return
+            if "http.response.pathsend" in extensions and self.offset == 0 and self.count == self.entry.size:
+                await send({"type": "http.response.pathsend", "path": self.entry.path})
+                return
+
+            async_file = anyio.wrap_file(f)
+            await async_file.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await async_file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # 전송 중 파일이 줄어든 경우 응답을 끝냄
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def serve_image(request, entry: ImageEntry, cache_key, immutable: bool) -> Response:
+    """
+    조건부 요청 / 범위 요청을 처리해 이미지 응답을 생성.
+    """
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx 가 Range / sendfile 을 처리 (location 은 internal 로 설정)
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + os.path.basename(entry.path)
+        headers["Content-Type"] = entry.media_type
+        return Response(status_code=200, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == entry.etag):
+        byte_range = parse_range(range_header, entry.size)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+            return ImageFileResponse(entry, cache_key, status_code=206, headers=headers, offset=start, count=end - start + 1)
+
+    return ImageFileResponse(entry, cache_key, headers=headers)
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import datetime
+
+from database import JobWatermark
+
+
+def db_now(conn) -> datetime:
+    """
+    DB 서버의 현재 시각 (세션 TimeZone 기준, timezone 없는 값).
+    chat_logs.end_time / created_at 등은 DB 의 CURRENT_TIMESTAMP 로 채워지므로
+    워터마크 상한이나 파티션 경계도 파이썬 시각(utcnow)이 아닌 같은 시계로 계산합니다.
+    conn 은 Session 또는 Connection.
+    """
+    return conn.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+
+
+def try_lock_job(db: Session, job_name: str) -> bool:
+    """
+    같은 배치 작업이 다른 워커 / cron 에서 실행 중이면 False (워터마크를 같이 읽어 두 번 반영하지 않도록).
+    잠금은 트랜잭션이 끝날 때 풀리므로 워터마크를 읽기 전에 같은 트랜잭션에서 호출합니다.
+    """
+    return bool(db.execute(
+        text("SELECT pg_try_advisory_xact_lock(hashtext(:job_name))"), {"job_name": job_name}
+    ).scalar())
+
+
+def get_watermark(db: Session, job_name: str):
+    """
+    배치 작업이 마지막으로 처리한 시각을 반환. 처음 실행이면 None.
+    """
+    return db.query(JobWatermark.watermark).filter(JobWatermark.job_name == job_name).scalar()
+
+
+def set_watermark(db: Session, job_name: str, watermark: datetime):
+    """
+    처리 시각을 기록. 커밋은 호출한 쪽 트랜잭션에서 함께 수행.
+    """
+    row = db.query(JobWatermark).filter(JobWatermark.job_name == job_name).first()
+    if row:
+        row.watermark = watermark
+        row.updated_at = datetime.utcnow()
+    else:
+        db.add(JobWatermark(job_name=job_name, watermark=watermark))
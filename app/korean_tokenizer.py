@@ -0,0 +1,347 @@
+"""
+한국어 분석용 단어 추출기.
+
+- STOPWORDS : 모듈 로드 시 한 번만 만드는 frozenset 불용어 표
+- 조사/어미 제거 : 역순 접미사 트라이로 가장 긴 조사를 떼어냄 ("캐릭터가", "캐릭터를" -> "캐릭터")
+  어간이 MIN_STEM_LENGTH 글자 미만이 되면 떼지 않음 ("사과" 는 그대로)
+  "이/이랑/이나 ..." 와 "도" 는 명사의 일부일 수 있으므로 ("고양이", "고양이랑", "제주도")
+  조사를 뗀 어간이 다른 어절에서도 쓰일 때만 떼고, 아니면 긴 쪽("고양이", "제주도")을 씀
+- count_terms : 로그 문자열을 하나씩 받아 Counter 에 누적하는 스트리밍 API
+  (모든 로그를 하나의 큰 문자열로 합치지 않음)
+
+벤치마크 (app 디렉토리에서 실행):
+    python korean_tokenizer.py --lines 200000
+"""
+from collections import Counter
+from functools import lru_cache
+from typing import Iterable, Iterator
+import re
+
+HANGUL_RUN = re.compile(r"[가-힣]+")
+
+MIN_STEM_LENGTH = 2
+BATCH_SIZE = 256  # count_terms 가 한 번에 정규식으로 처리하는 로그 수
+
+# 한국어 불용어 목록
+STOPWORDS = frozenset([
+    "은", "는", "이", "가", "을", "를", "에", "의", "와", "과", "도", "로", "에서", "에게", "한", "하다", "있다", "합니다",
+    "했다", "하지만", "그리고", "그러나", "때문에", "한다", "것", "같다", "더", "못", "이런", "저런", "그런", "어떻게", "왜", "수",
+    "가까스로", "가령", "각", "각각", "각자", "각종", "갖고말하자면", "같이", "개의치않고", "거니와", "거바", "거의", "것과 같이", "것들",
+    "게다가", "게우다", "겨우", "견지에서", "결과에 이르다", "결국", "결론을 낼 수 있다", "겸사겸사", "고려하면", "고로", "곧", "공동으로",
+    "과연", "관계가 있다", "관계없이", "관련이 있다", "관하여", "관한", "관해서는", "구", "구체적으로", "구토하다", "그", "그들", "그때",
+    "그래", "그래도", "그래서", "그러니", "그러니까", "그러면", "그러므로", "그러한즉", "그런 까닭에", "그런데", "그런즉", "그럼",
+    "그럼에도 불구하고", "그렇게 함으로써", "그렇지", "그렇지 않다면", "그렇지 않으면", "그렇지만", "그렇지않으면", "그리하여", "그만이다",
+    "그에 따르는", "그위에", "그저", "그중에서", "그치지 않다", "근거로", "근거하여", "기대여", "기점으로", "기준으로", "기타", "까닭으로",
+    "까악", "까지", "까지 미치다", "까지도", "꽈당", "끙끙", "끼익", "나", "나머지는", "남들", "남짓", "너", "너희", "너희들", "네",
+    "넷", "년", "논하지 않다", "놀라다", "누가 알겠는가", "누구", "다른", "다른 방면으로", "다만", "다섯", "다소", "다수", "다시 말하자면",
+    "다시말하면", "다음", "다음에", "다음으로", "단지", "답다", "당신", "당장", "대로 하다", "대하면", "대하여", "대해 말하자면", "대해서",
+    "댕그", "더구나", "더군다나", "더라도", "더불어", "더욱더", "더욱이는", "도달하다", "도착하다", "동시에", "동안", "된바에야", "된이상",
+    "두번째로", "둘", "둥둥", "뒤따라", "뒤이어", "든간에", "들", "등", "등등", "딩동", "따라", "따라서", "따위", "따지지 않다", "딱",
+    "때", "때가 되어", "또", "또한", "뚝뚝", "라 해도", "령", "로 인하여", "로부터", "로써", "륙", "마음대로", "마저", "마저도",
+    "마치", "막론하고", "만 못하다", "만약", "만약에", "만은 아니다", "만이 아니다", "만일", "만큼", "말하자면", "말할것도 없고", "매",
+    "매번", "메쓰겁다", "몇", "모", "모두", "무렵", "무릎쓰고", "무슨", "무엇", "무엇때문에", "물론", "및", "바꾸어말하면",
+    "바꾸어말하자면", "바꾸어서 말하면", "바꾸어서 한다면", "바꿔 말하면", "바로", "바와같이", "밖에 안된다", "반대로", "반대로 말하자면", "반드시",
+    "버금", "보는데서", "보다더", "보드득", "본대로", "봐", "봐라", "부류의 사람들", "부터", "불구하고", "불문하고", "붕붕", "비걱거리다",
+    "비교적", "비길수 없다", "비로소", "비록", "비슷하다", "비추어 보아", "비하면", "뿐만 아니라", "뿐만아니라", "뿐이다", "삐걱", "삐걱거리다",
+    "사", "삼", "상대적으로 말하자면", "생각한대로", "설령", "설마", "설사", "셋", "소생", "소인", "솨", "쉿", "습니까", "습니다",
+    "시각", "시간", "시작하여", "시초에", "시키다", "실로", "심지어", "아", "아니", "아니나다를가", "아니라면", "아니면", "아니었다면",
+    "아래윗", "아무거나", "아무도", "아야", "아울러", "아이", "아이고", "아이구", "아이야", "아이쿠", "아하", "아홉", "안 그러면",
+    "않기 위하여", "않기 위해서", "알 수 있다", "알았어", "앗", "앞에서", "앞의것", "야", "약간", "양자", "어", "어기여차", "어느",
+    "어느 년도", "어느것", "어느곳", "어느때", "어느쪽", "어느해", "어디", "어때", "어떠한", "어떤", "어떤것", "어떤것들", "어떻해",
+    "어이", "어째서", "어쨋든", "어쩔수 없다", "어찌", "어찌됏든", "어찌됏어", "어찌하든지", "어찌하여", "언제", "언젠가", "얼마",
+    "얼마 안 되는 것", "얼마간", "얼마나", "얼마든지", "얼마만큼", "얼마큼", "엉엉", "에 가서", "에 달려 있다", "에 대해", "에 있다",
+    "에 한하다", "여", "여기", "여덟", "여러분", "여보시오", "여부", "여섯", "여전히", "여차", "연관되다", "연이서", "영", "영차",
+    "옆사람", "예", "예를 들면", "예를 들자면", "예컨대", "예하면", "오", "오로지", "오르다", "오자마자", "오직", "오호", "오히려",
+    "와 같은 사람들", "와르르", "와아", "왜냐하면", "외에도", "요만큼", "요만한 것", "요만한걸", "요컨대", "우르르", "우리", "우리들",
+    "우선", "우에 종합한것과같이", "운운", "월", "위에서 서술한바와같이", "위하여", "위해서", "윙윙", "육", "으로", "으로 인하여", "으로서",
+    "으로써", "응", "응당", "의거하여", "의지하여", "의해", "의해되다", "의해서", "이 되다", "이 때문에", "이 밖에", "이 외에",
+    "이 정도의", "이것", "이곳", "이때", "이라면", "이래", "이러이러하다", "이러한", "이럴정도로", "이렇게 많은 것", "이렇게되면",
+    "이렇게말하자면", "이렇구나", "이로 인하여", "이르기까지", "이리하여", "이만큼", "이번", "이봐", "이상", "이어서", "이었다", "이와 같다",
+    "이와 같은", "이와 반대로", "이와같다면", "이외에도", "이용하여", "이유만으로", "이젠", "이지만", "이쪽", "이천구", "이천육", "이천칠",
+    "이천팔", "인 듯하다", "인젠", "일", "일것이다", "일곱", "일단", "일때", "일반적으로", "일지라도", "임에 틀림없다", "입각하여",
+    "입장에서", "잇따라", "자", "자기", "자기집", "자마자", "자신", "잠깐", "잠시", "저", "저것", "저것만큼", "저기", "저쪽", "저희",
+    "전부", "전자", "전후", "점에서 보아", "정도에 이르다", "제", "제각기", "제외하고", "조금", "조차", "조차도", "졸졸", "좀", "좋아",
+    "좍좍", "주룩주룩", "주저하지 않고", "줄은 몰랏다", "줄은모른다", "중에서", "중의하나", "즈음하여", "즉", "즉시", "지든지", "지만",
+    "지말고", "진짜로", "쪽으로", "차라리", "참", "참나", "첫번째로", "쳇", "총적으로", "총적으로 말하면", "총적으로 보면", "칠", "콸콸",
+    "쾅쾅", "쿵", "타다", "타인", "탕탕", "토하다", "통하여", "툭", "퉤", "틈타", "팍", "팔", "퍽", "펄렁", "하", "하게될것이다",
+    "하게하다", "하겠는가", "하고 있다", "하고있었다", "하곤하였다", "하구나", "하기 때문에", "하기 위하여", "하기는한데", "하기만 하면",
+    "하기보다는", "하기에", "하나", "하느니", "하는 김에", "하는 편이 낫다", "하는것도", "하는것만 못하다", "하는것이 낫다", "하는바", "하더라도",
+    "하도다", "하도록시키다", "하도록하다", "하든지", "하려고하다", "하마터면", "하면 할수록", "하면된다", "하면서", "하물며", "하여금", "하여야",
+    "하자마자", "하지 않는다면", "하지 않도록", "하지마", "하지마라", "하하", "한 까닭에", "한 이유는", "한 후", "한다면", "한다면 몰라도",
+    "한데", "한마디", "한적이있다", "한켠으로는", "한항목", "할 따름이다", "할 생각이다", "할 줄 안다", "할 지경이다", "할 힘이 있다", "할때",
+    "할만하다", "할망정", "할뿐", "할수있다", "할수있어", "할줄알다", "할지라도", "할지언정", "함께", "해도된다", "해도좋다", "해봐요",
+    "해서는 안된다", "해야한다", "해요", "했어요", "향하다", "향하여", "향해서", "허", "허걱", "허허", "헉", "헉헉", "헐떡헐떡",
+    "형식으로 쓰여", "혹시", "혹은", "혼자", "훨씬", "휘익", "휴", "흐흐", "흥", "힘입어", "하고", "싶어", "궁금해요", "궁금해",
+    "너무", "내가", "정말", "뭐", "그렇게", "세션", "안녕하세요", "거예요", "게", "잘", "모르겠어요", "건", "저장", "나도", "로그",
+    "생성", "거야", "싶어요", "거", "안녕", "있어", "제가", "오늘은", "함께라면", "같아", "있는", "이렇게", "오류가", "저는", "나는",
+    "경우", "음", "비활성화", "것도", "때도"
+])
+
+# "너를", "나도" 처럼 조사만 붙은 한 글자 대명사
+PRONOUNS = frozenset(["나", "너", "저", "제", "그"])
+
+# 떼어낼 조사와 앞 글자 받침 조건
+# "C": 받침 있음 (이/을/은/과/으로 ...), "V": 받침 없음 (가/를/는/와 ...),
+# "R": 받침 없음 또는 ㄹ 받침 (로/로서/로써), None: 조건 없음
+PARTICLES = {
+    "이": "C", "을": "C", "은": "C", "과": "C", "이랑": "C", "이나": "C", "이야": "C", "이에요": "C",
+    "이라도": "C", "이라고": "C", "으로": "C", "으로는": "C", "으로도": "C", "으로서": "C", "으로써": "C",
+    "가": "V", "를": "V", "는": "V", "와": "V", "랑": "V", "야": "V", "예요": "V", "라도": "V", "라고": "V",
+    "로": "R", "로는": "R", "로도": "R", "로서": "R", "로써": "R",
+    "의": None, "에": None, "에는": None, "에도": None, "에서": None, "에서는": None, "에서도": None,
+    "에게": None, "에게는": None, "에게서": None, "한테": None, "한테서": None, "께": None, "께서": None,
+    "도": None, "만": None, "까지": None, "부터": None, "처럼": None, "보다": None, "마저": None,
+    "조차": None, "밖에": None, "들": None, "들이": None, "들을": None, "들은": None, "들의": None,
+    "들에게": None, "들과": None, "들도": None,
+}
+
+# 앞 글자까지 포함해 명사일 수 있는 조사 ("고양+이" / "고양이", "제주+도" / "제주도")
+AMBIGUOUS_PARTICLES = frozenset([particle for particle in PARTICLES if particle.startswith("이")] + ["도"])
+
+_HANGUL_BASE = 0xAC00
+_RIEUL_FINAL = 8
+
+
+def _final_consonant(syllable: str) -> int:
+    """
+    한글 음절의 받침 번호 (0 이면 받침 없음).
+    """
+    return (ord(syllable) - _HANGUL_BASE) % 28
+
+
+def _condition_holds(condition, syllable: str) -> bool:
+    if condition is None:
+        return True
+    final = _final_consonant(syllable)
+    if condition == "C":
+        return final != 0
+    if condition == "V":
+        return final == 0
+    return final == 0 or final == _RIEUL_FINAL
+
+
+class SuffixTrie:
+    """
+    접미사를 뒤에서부터 저장한 트라이. 단어 끝에서 거슬러 올라가며 조건에 맞는 가장 긴 접미사를 찾습니다.
+    """
+    _END = object()
+
+    def __init__(self, suffixes: dict):
+        self.root = {}
+        for suffix, condition in suffixes.items():
+            node = self.root
+            for ch in reversed(suffix):
+                node = node.setdefault(ch, {})
+            node[self._END] = condition
+
+    def candidates(self, word: str, min_stem: int = MIN_STEM_LENGTH) -> list:
+        """
+        조건에 맞는 조사를 뗄 수 있는 위치 목록 (짧은 조사부터, 즉 위치 내림차순).
+        """
+        node = self.root
+        found = []
+        for position in range(len(word) - 1, 0, -1):
+            node = node.get(word[position])
+            if node is None:
+                break
+            if self._END in node and _condition_holds(node[self._END], word[position - 1]):
+                if position < min_stem:
+                    # 더 긴 조사가 맞지만 어간이 너무 짧아지는 경우 ("집으로") 짧은 조사("로")로 대신 떼지 않음
+                    return []
+                found.append(position)
+        return found
+
+    def strip(self, word: str, min_stem: int = MIN_STEM_LENGTH) -> str:
+        found = self.candidates(word, min_stem)
+        return word[:found[-1]] if found else word
+
+
+PARTICLE_TRIE = SuffixTrie(PARTICLES)
+
+
+@lru_cache(maxsize=65536)
+def analyze(word: str):
+    """
+    한글 어절 하나의 (어간, 명사로 볼 때의 긴 형태). 모호하지 않으면 긴 형태는 None, 불용어면 None.
+    같은 어절이 반복해서 나오므로 결과를 캐싱합니다.
+    """
+    if word in STOPWORDS:
+        return None
+    found = PARTICLE_TRIE.candidates(word)
+    stem = word[:found[-1]] if found else word
+    if stem in STOPWORDS:
+        return None
+
+    # 한 글자 불용어 + 조사 ("너를", "것이") 도 불용어로 처리. 단 "도" 는 "수도" 같은 명사가 많아 대명사만
+    short = PARTICLE_TRIE.candidates(word, min_stem=1)
+    if short and word[:short[-1]] in STOPWORDS and (word[short[-1]:] != "도" or word[:short[-1]] in PRONOUNS):
+        return None
+
+    longer = None
+    if found and word[found[-1]:] in AMBIGUOUS_PARTICLES:
+        # "고양이랑" -> "고양이"(+랑), "고양이" / "제주도" -> 어절 그대로
+        longer = word[:found[-2]] if len(found) > 1 else word
+    return stem, longer
+
+
+def known_stems(words) -> set:
+    """
+    어절 그대로 또는 모호하지 않은 조사를 떼고 나온 어간 집합. 모호한 조사를 뗄지 판단하는 데 사용.
+    """
+    known = set()
+    for word in words:
+        known.add(word)
+        analyzed = analyze(word)
+        if analyzed is not None and analyzed[1] is None:
+            known.add(analyzed[0])
+    return known
+
+
+def normalize(word: str, known: set = frozenset()):
+    """
+    한글 어절 하나를 분석용 단어로 변환. 불용어면 None.
+    모호한 조사("이", "이랑", "도" ...) 는 뗀 어간이 known 에 있을 때만 떼고, 아니면 긴 형태를 씀.
+    """
+    analyzed = analyze(word)
+    if analyzed is None:
+        return None
+    stem, longer = analyzed
+    if longer is not None and stem not in known:
+        return longer
+    return stem
+
+
+def tokenize(text: str) -> Iterator[str]:
+    """
+    텍스트에서 한글 어절을 찾아 조사를 떼고 불용어를 제외한 단어를 차례로 반환.
+    """
+    words = HANGUL_RUN.findall(text)
+    known = known_stems(set(words))
+    for word in words:
+        term = normalize(word, known)
+        if term is not None:
+            yield term
+
+
+def count_terms(texts: Iterable[str], counter: Counter = None) -> Counter:
+    """
+    로그 문자열을 하나씩 받아 단어 빈도를 누적. texts 는 제너레이터여도 됩니다.
+    어절 빈도를 먼저 세고(Counter.update 는 C 로 구현됨) 서로 다른 어절만 정규화해 합칩니다.
+    """
+    counter = Counter() if counter is None else counter
+    raw_counts = Counter()
+    findall = HANGUL_RUN.findall
+    # 짧은 로그마다 정규식을 호출하는 비용을 줄이기 위해 BATCH_SIZE 개씩 묶어서 처리 (메모리는 배치 크기로 제한)
+    batch = []
+    for text in texts:
+        if text:
+            batch.append(text)
+            if len(batch) >= BATCH_SIZE:
+                raw_counts.update(findall("\n".join(batch)))
+                batch.clear()
+    if batch:
+        raw_counts.update(findall("\n".join(batch)))
+
+    known = known_stems(raw_counts)
+    for word, count in raw_counts.items():
+        term = normalize(word, known)
+        if term is not None:
+            counter[term] += count
+    return counter
+
+
+# ====== 벤치마크 ======
+
+_BENCH_SENTENCES = (
+    "user: 안녕 오늘은 캐릭터가 너무 귀여워서 같이 바다에 가고 싶어",
+    "chatbot: 저도 바다를 정말 좋아하거든요! 파도 소리를 들으면 마음이 편해져요",
+    "user: 고양이랑 강아지 중에 누가 더 좋아? 나는 고양이가 좋아",
+    "chatbot: 저는 강아지들을 좋아해요. 산책하면서 친구들과 이야기하는 시간이 즐거워요",
+    "user: 내일은 친구에게 선물을 주려고 하는데 어떤 선물이 좋을까",
+    "chatbot: 직접 만든 편지와 작은 꽃다발은 어때요? 마음이 잘 전해질 거예요",
+)
+
+
+def _legacy_preprocess(logs_text: str, stopword_list: list) -> list:
+    # 기존 방식: 호출마다 set 을 만들고, 전체 문자열에서 findall 후 리스트로 필터링
+    words = re.findall(r"[가-힣]+", logs_text)
+    korean_stopwords = set(stopword_list)
+    return [word for word in words if word not in korean_stopwords]
+
+
+# 회귀 확인용 (python korean_tokenizer.py --check)
+CHECK_WORDS = {
+    "캐릭터가": "캐릭터",
+    "캐릭터를": "캐릭터",
+    "사과": "사과",
+    "고양이": "고양이",
+    "고양이가": "고양이",
+    "고양이랑": "고양이",
+    "원숭이": "원숭이",
+    "제주도": "제주도",
+    "제주도에서": "제주도",
+    "수도": "수도",
+    "나이": "나이",
+    "너를": None,
+    "나는": None,
+    "것이": None,
+}
+CHECK_TEXTS = [
+    ("고양이랑 강아지 중에 누가 더 좋아? 나는 고양이가 좋아 고양이", {"고양이": 3, "강아지": 1}),
+    ("사람이 많은 곳에서 사람을 만났다", {"사람": 2}),
+    ("수도에 가서 제주도 여행을 했다 제주도는 좋다", {"수도": 1, "제주도": 2}),
+]
+
+
+def check() -> list:
+    """
+    CHECK_WORDS / CHECK_TEXTS 와 다른 결과 목록 (비어 있으면 통과).
+    """
+    failures = []
+    for word, expected in CHECK_WORDS.items():
+        actual = normalize(word)
+        if actual != expected:
+            failures.append(f"normalize({word!r}) = {actual!r}, 기대값 {expected!r}")
+    for text, expected in CHECK_TEXTS:
+        counted = count_terms([text])
+        for term, count in expected.items():
+            if counted[term] != count:
+                failures.append(f"count_terms({text!r})[{term!r}] = {counted[term]}, 기대값 {count}")
+    return failures
+
+
+def bench(lines: int):
+    import time
+
+    corpus = [_BENCH_SENTENCES[i % len(_BENCH_SENTENCES)] + f" {i % 97}번째" for i in range(lines)]
+    stopword_list = list(STOPWORDS)
+
+    started = time.perf_counter()
+    legacy = Counter(_legacy_preprocess(" ".join(corpus), stopword_list))
+    legacy_elapsed = time.perf_counter() - started
+
+    analyze.cache_clear()
+    started = time.perf_counter()
+    counted = count_terms(iter(corpus))
+    elapsed = time.perf_counter() - started
+
+    legacy_tokens = sum(legacy.values())
+    tokens = sum(counted.values())
+    print(f"로그 {lines:,}줄")
+    print(f"  기존  : {legacy_tokens:,} 토큰, 서로 다른 단어 {len(legacy):,}, {legacy_tokens / legacy_elapsed:,.0f} 토큰/초")
+    print(f"  신규  : {tokens:,} 토큰, 서로 다른 단어 {len(counted):,}, {tokens / elapsed:,.0f} 토큰/초")
+    print(f"  상위 10: {counted.most_common(10)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="한국어 단어 추출 벤치마크")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--check", action="store_true", help="회귀 확인만 실행")
+    args = parser.parse_args()
+    if args.check:
+        failures = check()
+        print("\n".join(failures) if failures else "통과")
+        raise SystemExit(1 if failures else 0)
+    bench(args.lines)
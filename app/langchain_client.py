@@ -0,0 +1,109 @@
+from fastapi import HTTPException
+from dotenv import load_dotenv
+import websockets
+import asyncio
+import json
+import os
+
+# .env 파일 로드
+load_dotenv()
+
+WS_SERVER_DOMAIN = os.getenv("WS_SERVER_DOMAIN")
+# 비밀 일기 생성 엔드포인트 경로 (LangChain 서버)
+DIARY_WS_PATH = os.getenv("DIARY_WS_PATH", "/ws/diary/")
+# 배치 작업에서 LangChain 응답을 기다리는 최대 시간 (초)
+LANGCHAIN_TIMEOUT = float(os.getenv("LANGCHAIN_TIMEOUT", "120"))
+
+
+def is_final_frame(frame: dict) -> bool:
+    """
+    LangChain 서버 응답 프레임이 한 턴의 마지막 프레임인지 확인.
+    최종 응답은 text 키를 포함하거나 done 플래그를 가짐.
+    """
+    return "text" in frame or bool(frame.get("done"))
+
+
+async def send_to_langchain(request_data: dict, room_id: str):
+    """
+    LangChain WebSocket 서버에 데이터를 전송하고 응답을 반환.
+    """
+    try:
+        uri = f"{WS_SERVER_DOMAIN}/ws/generate/?room_id={room_id}"
+        async with websockets.connect(uri) as websocket:
+            # 요청 데이터 전송
+            await websocket.send(json.dumps(request_data))
+
+            # 서버 응답 수신
+            response = await websocket.recv()
+            return json.loads(response)
+    except asyncio.TimeoutError:
+        print("WebSocket 응답 시간이 초과되었습니다.")
+        raise HTTPException(status_code=504, detail="LangChain 서버 응답 시간 초과.")
+    except websockets.exceptions.ConnectionClosedError as e:
+        print(f"WebSocket closed with error: {str(e)}")
+        raise HTTPException(status_code=500, detail="WebSocket 연결이 닫혔습니다.")
+    except Exception as e:
+        print(f"Error in send_to_langchain: {str(e)}")
+        raise HTTPException(status_code=500, detail="LangChain 서버와 통신 중 오류가 발생했습니다.")
+
+
+async def request_langchain(path: str, request_data: dict, room_id: str, timeout: float = LANGCHAIN_TIMEOUT) -> dict:
+    """
+    LangChain 서버의 path 엔드포인트에 요청 하나를 보내고 응답 하나를 받음.
+    배치 작업용으로 HTTPException 으로 바꾸지 않고 예외를 그대로 전달합니다.
+    """
+    uri = f"{WS_SERVER_DOMAIN}{path}?room_id={room_id}"
+    async with websockets.connect(uri) as websocket:
+        await websocket.send(json.dumps(request_data))
+        response = await asyncio.wait_for(websocket.recv(), timeout)
+        return json.loads(response)
+
+
+class LangChainSession:
+    """
+    채팅방 하나에 대해 LangChain 서버와의 WebSocket 연결을 유지하는 세션.
+    클라이언트 WebSocket 연결이 살아있는 동안 여러 턴에서 같은 연결을 재사용.
+    """
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self._websocket = None
+
+    async def _ensure_connected(self):
+        if self._websocket is None:
+            uri = f"{WS_SERVER_DOMAIN}/ws/generate/?room_id={self.room_id}"
+            self._websocket = await websockets.connect(uri)
+        return self._websocket
+
+    async def stream(self, request_data: dict):
+        """
+        요청을 전송하고 LangChain 서버에서 도착하는 프레임을 순서대로 yield.
+        최종 프레임(is_final_frame)을 받으면 종료.
+        """
+        payload = json.dumps(request_data)
+        for attempt in range(2):
+            websocket = await self._ensure_connected()
+            try:
+                await websocket.send(payload)
+                frame = await websocket.recv()
+            except websockets.exceptions.ConnectionClosed:
+                # 서버가 이전 턴 이후 연결을 닫은 경우 한 번만 재연결
+                self._websocket = None
+                if attempt:
+                    raise
+                continue
+            break
+
+        while True:
+            data = json.loads(frame)
+            yield data
+            if is_final_frame(data):
+                return
+            frame = await websocket.recv()
+
+    async def close(self):
+        if self._websocket is not None:
+            try:
+                await self._websocket.close()
+            finally:
+                self._websocket = None
@@ -0,0 +1,145 @@
+"""
+채팅 로그 대량 조회용 스트리밍 유틸리티.
+
+- iter_chat_logs : 서버 측 커서(stream_results + yield_per)로 로그를 배치 단위로 읽어 dict 로 하나씩 반환
+                   아카이브(chat_logs_archive) 로그를 먼저, 그다음 chat_logs 를 시간순으로 반환
+- json_array_stream / ndjson_stream : 위 제너레이터를 StreamingResponse 용 bytes 청크로 변환
+
+StreamingResponse 는 요청 의존성(get_db)이 정리된 뒤에도 본문을 읽을 수 있으므로
+제너레이터가 자체 세션을 열고 끝나면 닫습니다. 메모리 사용량은 로그 개수와 관계없이 배치 크기로 제한됩니다.
+"""
+from sqlalchemy.orm import Session
+from typing import Iterable, Iterator
+from dotenv import load_dotenv
+import os
+
+from database import SessionLocal, ChatRoom, ChatLog, ArchivedChatLog
+from chat_log_codec import read_log
+from chat_log_partition import decompress_log
+from fast_json import dumps
+
+# .env 파일 로드
+load_dotenv()
+
+LOG_STREAM_BATCH = int(os.getenv("LOG_STREAM_BATCH", "200"))  # 서버 측 커서에서 한 번에 가져오는 행 수
+STREAM_CHUNK_SIZE = 64 * 1024  # 응답 청크 크기 (bytes)
+
+
+def _stream(query, batch_size: int):
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def _iter_archived(db: Session, filters, batch_size: int) -> Iterator[dict]:
+    query = (
+        db.query(
+            ArchivedChatLog.session_id,
+            ArchivedChatLog.chat_id,
+            ArchivedChatLog.log_compressed,
+            ArchivedChatLog.start_time,
+            ArchivedChatLog.end_time,
+        )
+        .join(ChatRoom, ChatRoom.chat_id == ArchivedChatLog.chat_id)
+        .filter(*filters)
+        .order_by(ArchivedChatLog.chat_id, ArchivedChatLog.start_time)
+    )
+    for session_id, chat_id, log_compressed, start_time, end_time in _stream(query, batch_size):
+        yield {
+            "session_id": session_id,
+            "chat_id": chat_id,
+            "log": decompress_log(log_compressed),
+            "start_time": start_time,
+            "end_time": end_time,
+        }
+
+
+def _iter_hot(db: Session, filters, batch_size: int) -> Iterator[dict]:
+    query = (
+        db.query(
+            ChatLog.session_id,
+            ChatLog.chat_id,
+            ChatLog.log,  # 원문 컬럼 (압축본은 log_body, read_log 로 복원)
+            ChatLog.log_body,
+            ChatLog.start_time,
+            ChatLog.end_time,
+        )
+        .join(ChatRoom, ChatRoom.chat_id == ChatLog.chat_id)
+        .filter(*filters)
+        .order_by(ChatLog.chat_id, ChatLog.start_time)
+    )
+    for session_id, chat_id, log, log_body, start_time, end_time in _stream(query, batch_size):
+        yield {
+            "session_id": session_id,
+            "chat_id": chat_id,
+            "log": read_log(log, log_body, db),
+            "start_time": start_time,
+            "end_time": end_time,
+        }
+
+
+def iter_chat_logs(
+    chat_id: str = None,
+    user_idx: int = None,
+    include_archived: bool = True,
+    batch_size: int = LOG_STREAM_BATCH,
+) -> Iterator[dict]:
+    """
+    채팅방(chat_id) 또는 사용자(user_idx)의 로그를 채팅방별, 시작 시각 순으로 하나씩 반환.
+    """
+    if chat_id is None and user_idx is None:
+        raise ValueError("chat_id 또는 user_idx 중 하나는 필요합니다.")
+
+    db = SessionLocal()
+    try:
+        if chat_id is not None:
+            archived_filters = [ArchivedChatLog.chat_id == chat_id]
+            hot_filters = [ChatLog.chat_id == chat_id]
+        else:
+            archived_filters = [ChatRoom.user_idx == user_idx]
+            hot_filters = [ChatRoom.user_idx == user_idx]
+
+        if include_archived:
+            yield from _iter_archived(db, archived_filters, batch_size)
+        yield from _iter_hot(db, hot_filters, batch_size)
+    finally:
+        db.close()
+
+
+def _chunked(parts: Iterable[bytes], chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    # 작은 조각을 모아 보내 전송/압축(flush) 횟수를 줄임
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _json_array_parts(items: Iterable) -> Iterator[bytes]:
+    yield b"["
+    first = True
+    for item in items:
+        if first:
+            first = False
+            yield dumps(item)
+        else:
+            yield b"," + dumps(item)
+    yield b"]"
+
+
+def json_array_stream(items: Iterable) -> Iterator[bytes]:
+    """
+    항목을 JSON 배열로 이어서 내보냄 ("[", 항목, ",", 항목, ..., "]").
+    """
+    return _chunked(_json_array_parts(items))
+
+
+def ndjson_stream(items: Iterable) -> Iterator[bytes]:
+    """
+    항목을 한 줄에 하나씩 JSON 으로 내보냄 (application/x-ndjson).
+    """
+    return _chunked(dumps(item) + b"\n" for item in items)
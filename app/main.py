@@ -1,5 +1,6 @@
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, Query, Body # FastAPI 프레임워크 및 종속성 주입 도구
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Depends, HTTPException, APIRouter, Query, Body, WebSocket, WebSocketDisconnect, BackgroundTasks, status # FastAPI 프레임워크 및 종속성 주입 도구
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.sql.expression import case
 from sqlalchemy import select,cast,String
 from sqlalchemy.sql import func
@@ -14,10 +15,9 @@ import uuid # 고유 ID 생성을 위한 UUID 라이브러리
 from datetime import datetime # 날짜 및 시간 처리
 from fastapi.middleware.cors import CORSMiddleware # CORS 설정용 미들웨어
 import re
-import websockets
 import asyncio
+from jose import jwt, JWTError
 from pathlib import Path  # 파일 경로 조작을 위한 모듈
-from fastapi.staticfiles import StaticFiles
 
 
 
@@ -35,6 +35,29 @@ import user
 import wordcloud_router
 import search
 import image
+import trending
+import creator_dashboard
+import secret_diary
+import group_chat
+import scenario
+import recommendations
+import feed
+from creator_dashboard import refresh_creator_catalog, load_creator_dashboard
+from log_stream import iter_chat_logs, json_array_stream, ndjson_stream
+from fast_json import FastJSONResponse, RowSerializer, sparse_fields, wants
+import etag
+from compression import CompressionMiddleware
+from langchain_client import send_to_langchain, LangChainSession, is_final_frame
+from persona import build_persona_payload, clean_json_string
+from tag_index import tag_index, set_character_tags, refresh_tag_index, MAX_QUERY_TAGS, REFRESH_INTERVAL as TAG_INDEX_REFRESH_INTERVAL
+from image_cache import invalidate_image
+import storage
+from storage import media_url, store_image
+from facets import facet_index, refresh_facet_index, REFRESH_INTERVAL as FACET_REFRESH_INTERVAL
+from character_prompts import save_character_prompt, compact_character_prompts, COMPACTION_INTERVAL as PROMPT_COMPACTION_INTERVAL
+from chat_log_partition import hot_window_start, load_archived_logs
+from follower_counter import change_follower_count, reconcile_follower_counts, bump_catalog_version, CATALOG_BUMP_INTERVAL as FOLLOWER_CATALOG_BUMP_INTERVAL
+import scheduler
 
 
 # FastAPI 앱 초기화
@@ -44,11 +67,14 @@ app.include_router(user.router)
 app.include_router(wordcloud_router.router, prefix="/api", tags=["WordCloud"])
 app.include_router(search.router, tags=["Search"])
 app.include_router(image.router, tags=["Images"])
-
-# 이미지 경로 - OS 따라 경로 변하는 이슈로 인해 os 패키지 사용 (김민식)
-UPLOAD_DIR = "./uploads/characters"
-app.mount("/images", StaticFiles(directory=UPLOAD_DIR), name="images")
-app.mount("/static", StaticFiles(directory=UPLOAD_DIR), name="static")
+app.include_router(trending.router, tags=["Trending"])
+app.include_router(creator_dashboard.router, tags=["Dashboard"])
+app.include_router(secret_diary.router, tags=["SecretDiary"])
+app.include_router(group_chat.router, tags=["GroupChat"])
+app.include_router(scenario.router, tags=["Scenario"])
+app.include_router(recommendations.router, tags=["Recommendations"])
+app.include_router(feed.router, tags=["Feed"])
+app.include_router(storage.router, tags=["Storage"])
 
 # RabbitMQ 연결 설정
 # 배포용 PC 에 rabbitMQ 서버 및 GPU서버 세팅 완료 - 250102 민식 
@@ -64,7 +90,19 @@ REQUEST_TTS_QUEUE = "tts_generation_requests" # TTS 요청
 RESPONSE_TTS_QUEUE = "tts_generation_responses" #
 
 CLIENT_DOMAIN = os.getenv("CLIENT_DOMAIN")
-WS_SERVER_DOMAIN = os.getenv("WS_SERVER_DOMAIN")
+
+# WebSocket 채팅 인증용 JWT 설정 (user.py와 동일)
+SECRET_KEY = os.getenv("SECRET_KEY", "default_key")
+ALGORITHM = "HS256"
+
+# 응답 압축 (zstd/br/gzip 협상, 이미지/오디오 및 작은 응답 제외)
+app.add_middleware(
+    CompressionMiddleware,
+    route_levels={
+        # 캐릭터 목록/상세는 페르소나 텍스트가 길고 반복이 많아 압축률이 높음
+        "/api/characters": {"br": 5, "zstd": 6},
+    },
+)
 
 # CORS 설정: 모든 도메인, 메서드, 헤더를 허용
 app.add_middleware(
@@ -81,6 +119,32 @@ app.add_middleware(
 )
 
 
+# 주기 작업 간격 (초, 0 이하면 비활성화)
+FOLLOWER_RECONCILE_INTERVAL = float(os.getenv("FOLLOWER_RECONCILE_INTERVAL", "3600"))
+
+@app.on_event("startup")
+async def start_background_jobs():
+    scheduler.start_periodic_job("reconcile_follower_counts", FOLLOWER_RECONCILE_INTERVAL, reconcile_follower_counts)
+    scheduler.start_periodic_job("bump_follower_catalog_version", FOLLOWER_CATALOG_BUMP_INTERVAL, bump_catalog_version)
+    scheduler.start_periodic_job("refresh_trending", trending.REFRESH_INTERVAL, trending.refresh_trending)
+    scheduler.start_periodic_job(
+        "refresh_creator_dashboards", creator_dashboard.REFRESH_INTERVAL, creator_dashboard.refresh_creator_dashboards
+    )
+    scheduler.start_periodic_job("secret_diary", secret_diary.BATCH_INTERVAL, secret_diary.run_diary_batch)
+    scheduler.start_periodic_job("compact_character_prompts", PROMPT_COMPACTION_INTERVAL, compact_character_prompts)
+    scheduler.start_periodic_job("refresh_tag_index", TAG_INDEX_REFRESH_INTERVAL, refresh_tag_index)
+    scheduler.start_periodic_job("refresh_facet_index", FACET_REFRESH_INTERVAL, refresh_facet_index)
+    scheduler.start_periodic_job(
+        "rebuild_similarities", recommendations.REBUILD_INTERVAL, recommendations.rebuild_similarities
+    )
+    scheduler.start_periodic_job("rebuild_feeds", feed.REBUILD_INTERVAL, feed.rebuild_feeds)
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    await scheduler.stop_periodic_jobs()
+    wordcloud_router.shutdown_render_pool()
+
+
 # DB 세션 관리
 def get_db():
     """
@@ -181,6 +245,29 @@ class CharacterCardResponseSchema(BaseModel):
         }
 
 
+# 배치 조회 요청 최대 개수
+MAX_BATCH_SIZE = 100
+
+# 캐릭터 배치 조회 요청 스키마
+class CharacterBatchRequest(BaseModel):
+    char_ids: List[int]
+
+# 팔로우 여부 배치 조회 요청 스키마
+class FollowCheckBatchRequest(BaseModel):
+    user_idx: int
+    char_ids: List[int]
+
+
+def unique_batch_ids(char_ids: List[int]) -> List[int]:
+    """
+    요청 순서를 유지하며 중복 제거. 최대 개수를 넘으면 400.
+    """
+    char_ids = list(dict.fromkeys(char_ids))
+    if len(char_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"한 번에 최대 {MAX_BATCH_SIZE}개까지 조회할 수 있습니다.")
+    return char_ids
+
+
 # 이미지 생성 요청 스키마
 class ImageRequest(BaseModel):
     prompt: str
@@ -223,11 +310,9 @@ def get_rabbitmq_channel(req_que, res_que):
 # ====== API 엔드포인트 ======
 
 from fastapi import File, UploadFile, Form, Request
-from fastapi.staticfiles import StaticFiles
 
 UPLOAD_DIR = "./uploads/characters/"  # 캐릭터 이미지 파일 저장 경로
 os.makedirs(UPLOAD_DIR, exist_ok=True) # 디렉토리 생성
-app.mount("/static", StaticFiles(directory=UPLOAD_DIR), name="static")
 
 
 # 채팅방 생성 API
@@ -322,98 +407,95 @@ def create_chat_room(room: CreateRoomSchema, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"채팅방 생성 중 오류가 발생했습니다: {str(e)}")
 
 # 채팅방 목록 조회 API
-@app.get("/api/chat-room/", response_model=List[dict])
-def get_all_chat_rooms(request: Request, db: Session = Depends(get_db)):
+# 채팅방 목록 직렬화기
+CHAT_ROOM_LIST = RowSerializer(
+    ChatRoom.chat_id.label("room_id"),
+    Character.char_name.label("character_name"),
+    Character.char_description,
+    CharacterPrompt.character_appearance,
+    CharacterPrompt.character_personality,
+    CharacterPrompt.character_background,
+    CharacterPrompt.character_speech_style,
+    ChatRoom.created_at.label("room_created_at"),
+    Image.file_path.label("character_image"),
+)
+
+def query_chat_rooms(db: Session, request: Request, fields: Optional[List[str]], *filters) -> list:
     """
-    모든 채팅방 목록을 반환하는 API 엔드포인트.
-    각 채팅방에 연결된 캐릭터 정보 및 이미지를 포함.
+    채팅방 목록을 선택한 컬럼만 조회해 직렬화. room_id 는 항상 포함.
     """
-    rooms = (
-        db.query(ChatRoom, Character, CharacterPrompt, Image.file_path)
+    serializer = CHAT_ROOM_LIST.project(fields, always=("room_id",))
+    query = (
+        db.query(*serializer.columns)
+        .select_from(ChatRoom)
         .join(CharacterPrompt, CharacterPrompt.char_prompt_id == ChatRoom.char_prompt_id)
         .join(Character, Character.char_idx == CharacterPrompt.char_idx)
-        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
-        .filter(Character.is_active == True, ChatRoom.is_active == True)
-        .all()
+        .filter(Character.is_active == True, ChatRoom.is_active == True, *filters)
     )
+    if wants(fields, "character_image"):
+        query = (
+            query
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        )
 
     base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
-    result = []
-    for room, character, prompt, image_path in rooms:
-        # 이미지 경로를 URL로 변환
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
-        result.append({
-            "room_id": room.chat_id,
-            "character_name": character.char_name,
-            "char_description": character.char_description,
-            "character_appearance": prompt.character_appearance,
-            "character_personality": prompt.character_personality,
-            "character_background": prompt.character_background,
-            "character_speech_style": prompt.character_speech_style,
-            "room_created_at": room.created_at,
-            "character_image": image_url,  # 전체 URL 반환
-        })
-    return result
+    # 이미지 경로를 URL로 변환
+    return serializer.serialize_all(
+        query.all(),
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
+
+@app.get("/api/chat-room/", response_model=List[dict])
+def get_all_chat_rooms(
+    request: Request,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    db: Session = Depends(get_db)
+):
+    """
+    모든 채팅방 목록을 반환하는 API 엔드포인트.
+    각 채팅방에 연결된 캐릭터 정보 및 이미지를 포함.
+    fields 가 주어지면 해당 키만 반환합니다. (예: ?fields=character_name,character_image)
+    """
+    return FastJSONResponse(query_chat_rooms(db, request, fields))
 
 
 # 특정 유저가 생성한 채팅방 목록 조회 API
 @app.get("/api/chat-room/user/{user_idx}", response_model=List[dict])
-def get_user_chat_rooms(user_idx: int, request: Request, db: Session = Depends(get_db)):
+def get_user_chat_rooms(
+    user_idx: int,
+    request: Request,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    db: Session = Depends(get_db)
+):
     """
     특정 사용자가 생성한 채팅방 목록을 반환하는 API 엔드포인트.
     각 채팅방에 연결된 캐릭터 정보 및 이미지를 포함.
+    fields 가 주어지면 해당 키만 반환합니다.
     """
-    rooms = (
-        db.query(ChatRoom, Character, CharacterPrompt, Image.file_path)
-        .join(CharacterPrompt, CharacterPrompt.char_prompt_id == ChatRoom.char_prompt_id)
-        .join(Character, Character.char_idx == CharacterPrompt.char_idx)
-        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
-        .filter(ChatRoom.user_idx == user_idx, Character.is_active == True, ChatRoom.is_active == True)
-        .all()
-    )
-
-    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
-    result = []
-    for room, character, prompt, image_path in rooms:
-        # 이미지 경로를 URL로 변환
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
-        result.append({
-            "room_id": room.chat_id,
-            "character_name": character.char_name,
-            "char_description": character.char_description,
-            "character_appearance": prompt.character_appearance,
-            "character_personality": prompt.character_personality,
-            "character_background": prompt.character_background,
-            "character_speech_style": prompt.character_speech_style,
-            "room_created_at": room.created_at,
-            "character_image": image_url,  # 이미지 URL 반환
-        })
-    return result
+    return FastJSONResponse(query_chat_rooms(db, request, fields, ChatRoom.user_idx == user_idx))
 
 
 # 채팅 메시지 불러오기
 @app.get("/api/chat/{room_id}")
-def get_chat_logs(room_id: str, db: Session = Depends(get_db)):
+def get_chat_logs(room_id: str):
     """
     특정 채팅방의 메시지 로그를 반환하는 API 엔드포인트.
+    보존 기간이 지나 아카이브된 로그가 먼저 오며, 서버 측 커서로 읽어 JSON 배열로 스트리밍합니다.
     """
-    logs = (
-        db.query(ChatLog)
-        .filter(ChatLog.chat_id == room_id)
-        .order_by(ChatLog.start_time)
-        .all()
+    return StreamingResponse(json_array_stream(iter_chat_logs(chat_id=room_id)), media_type="application/json")
+
+# 사용자 전체 대화 내보내기
+@app.get("/api/users/{user_idx}/chat-export")
+def export_user_chats(user_idx: int):
+    """
+    사용자의 모든 채팅방 로그를 한 줄에 한 세션씩 NDJSON 으로 스트리밍합니다.
+    """
+    return StreamingResponse(
+        ndjson_stream(iter_chat_logs(user_idx=user_idx)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-export-{user_idx}.ndjson"'}
     )
-    return [
-        {
-            "session_id": log.session_id,
-            "log": log.log,
-            "start_time": log.start_time,
-            "end_time": log.end_time,
-        }
-        for log in logs
-    ]
 
 # 채팅방에서 캐릭터 정보 불러오기
 @app.get("/api/chat-room-info/{room_id}")
@@ -466,46 +548,50 @@ def get_chat_history(db: Session, room_id: str, limit: int = 10) -> str:
     """
     채팅방의 최근 대화 내역을 가져옵니다.
     """
+    # 최근 파티션부터 조회되도록 start_time 범위를 지정
+    window_start = hot_window_start()
     logs = db.query(ChatLog).filter(
-        ChatLog.chat_id == room_id
+        ChatLog.chat_id == room_id,
+        ChatLog.start_time >= window_start
     ).order_by(ChatLog.end_time.desc()).limit(limit).all()
+    log_texts = [log.log for log in logs]
+
+    # 모자란 만큼 오래된 파티션에서, 그래도 모자라면 아카이브에서 채움 (최신순)
+    if len(log_texts) < limit:
+        logs = db.query(ChatLog).filter(
+            ChatLog.chat_id == room_id,
+            ChatLog.start_time < window_start
+        ).order_by(ChatLog.end_time.desc()).limit(limit - len(log_texts)).all()
+        log_texts += [log.log for log in logs]
+    if len(log_texts) < limit:
+        archived = load_archived_logs(db, room_id)[-(limit - len(log_texts)):]
+        log_texts += [log["log"] for log in archived][::-1]
     
     # 시간순으로 정렬
-    logs = logs[::-1]
+    log_texts = log_texts[::-1]
     
     # 대화 내역을 문자열로 포맷팅
     history = ""
-    for log in logs:
+    for log_text in log_texts:
         # ChatLog의 log 필드에서 대화 내용 파싱
-        log_lines = log.log.split('\n')
+        log_lines = log_text.split('\n')
         for line in log_lines:
             if 'user:' in line or 'chatbot:' in line:
                 history += line + '\n'
     
     return history
 
-async def send_to_langchain(request_data: dict, room_id: str):
+def load_chat_context(db: Session, room_id: str):
     """
-    LangChain WebSocket 서버에 데이터를 전송하고 응답을 반환.
+    채팅방과 연결된 (채팅방, 캐릭터 프롬프트, 캐릭터) 정보를 조회합니다.
     """
-    try:
-        uri = f"{WS_SERVER_DOMAIN}/ws/generate/?room_id={room_id}"
-        async with websockets.connect(uri) as websocket:
-            # 요청 데이터 전송
-            await websocket.send(json.dumps(request_data))
-            
-            # 서버 응답 수신
-            response = await websocket.recv()
-            return json.loads(response)
-    except asyncio.TimeoutError:
-        print("WebSocket 응답 시간이 초과되었습니다.")
-        raise HTTPException(status_code=504, detail="LangChain 서버 응답 시간 초과.")
-    except websockets.exceptions.ConnectionClosedError as e:
-        print(f"WebSocket closed with error: {str(e)}")
-        raise HTTPException(status_code=500, detail="WebSocket 연결이 닫혔습니다.")
-    except Exception as e:
-        print(f"Error in send_to_langchain: {str(e)}")
-        raise HTTPException(status_code=500, detail="LangChain 서버와 통신 중 오류가 발생했습니다.")
+    return (
+        db.query(ChatRoom, CharacterPrompt, Character)
+        .join(CharacterPrompt, ChatRoom.char_prompt_id == CharacterPrompt.char_prompt_id)
+        .join(Character, CharacterPrompt.char_idx == Character.char_idx)
+        .filter(ChatRoom.chat_id == room_id, ChatRoom.is_active == True)
+        .first()
+    )
 
 # ----------------------------------------------------------------------------------------
 @app.post("/api/chat/{room_id}")
@@ -514,44 +600,23 @@ async def query_langchain(room_id: str, message: MessageSchema, db: Session = De
     LangChain 서버에 요청을 보내고 응답을 처리합니다.
     """
     try:
-        chat_data = (
-            db.query(ChatRoom, CharacterPrompt, Character)
-            .join(CharacterPrompt, ChatRoom.char_prompt_id == CharacterPrompt.char_prompt_id)
-            .join(Character, CharacterPrompt.char_idx == Character.char_idx)
-            .filter(ChatRoom.chat_id == room_id, ChatRoom.is_active == True)
-            .first()
-        )
+        chat_data = load_chat_context(db, room_id)
 
         if not chat_data:
             raise HTTPException(status_code=404, detail="해당 채팅방 정보를 찾을 수 없습니다.")
         
         chat, prompt, character = chat_data
 
-        if prompt:
-            example_dialogues = [json.loads(clean_json_string(dialogue)) if dialogue else {} for dialogue in prompt.example_dialogues] if prompt.example_dialogues else []
-            nicknames = json.loads(character.nicknames) if character.nicknames else {'30': '', '70': '', '100': ''}
-        else:
-            # 기본값 설정
-            example_dialogues = []
-            nicknames = {'30': '', '70': '', '100': ''}
-
         # --------------------대화 내역 가져오기--------------------
         chat_history = get_chat_history(db, room_id)
         print("Chat History being sent to LangChain:", chat_history)
 
         # LangChain 서버로 보낼 요청 데이터 준비
         request_data = {
+            **build_persona_payload(chat, prompt, character),
+            **scenario.load_scenario_payload(room_id, db), # 활성 시나리오 (캐시)
             "user_message": message.content,
-            "character_name": character.char_name, # 캐릭터 이름
-            "nickname": nicknames, # 호감도에 따른 호칭 명
-            "user_unique_name": chat.user_unique_name, # 캐릭터가 사용자에게 부르는 이름 (nickname보다 우선순위)
-            "user_introduction": chat.user_introduction, # 캐릭터한테 사용자를 소개하는 글
             "favorability": chat.favorability, # 호감도
-            "character_appearance": prompt.character_appearance, # 캐릭터 외형
-            "character_personality": prompt.character_personality, # 캐릭터 성격
-            "character_background": prompt.character_background, # 캐릭터 배경
-            "character_speech_style": prompt.character_speech_style, # 캐릭터 말투
-            "example_dialogues": example_dialogues, # 예시 대화
             "chat_history": chat_history # 채팅 기록
         }
         print("Full request data:", request_data)  # 로그 추가
@@ -582,14 +647,154 @@ async def query_langchain(room_id: str, message: MessageSchema, db: Session = De
         print(f"Error in query_langchain: {str(e)}")  # 디버깅용
         raise HTTPException(status_code=500, detail=str(e))
 
+# WebSocket 채팅 - 연결 시 한 번 인증하고 채팅방 정보를 캐싱한 뒤 여러 턴을 처리
+WS_CHAT_HISTORY_MAX_LINES = 200  # 연결 동안 메모리에 유지할 대화 내역 최대 줄 수
+
+def decode_ws_token(token: str) -> Optional[int]:
+    """
+    WebSocket 연결 토큰에서 user_idx를 추출. 유효하지 않으면 None.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        return payload.get("user_idx")
+    except JWTError:
+        return None
+
+def load_ws_chat_session(room_id: str):
+    """
+    WebSocket 연결 동안 사용할 채팅방 정보를 한 번에 조회.
+    (chat_id, user_idx, favorability, 페르소나 데이터, 대화 내역 줄 리스트)를 반환.
+    """
+    db = SessionLocal()
+    try:
+        chat_data = load_chat_context(db, room_id)
+        if not chat_data:
+            return None
+        chat, prompt, character = chat_data
+        history_lines = [line for line in get_chat_history(db, room_id).split('\n') if line]
+        return {
+            "user_idx": chat.user_idx,
+            "favorability": chat.favorability,
+            "persona": build_persona_payload(chat, prompt, character),
+            "history_lines": history_lines,
+        }
+    finally:
+        db.close()
+
+def save_favorability(room_id: str, favorability: int):
+    """
+    호감도가 변경된 경우에만 PK 기준 단일 UPDATE로 반영.
+    """
+    db = SessionLocal()
+    try:
+        db.query(ChatRoom).filter(ChatRoom.chat_id == room_id).update(
+            {ChatRoom.favorability: favorability}, synchronize_session=False
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+@app.websocket("/ws/chat/{room_id}")
+async def chat_websocket(websocket: WebSocket, room_id: str, token: str = Query(...)):
+    """
+    하나의 WebSocket 연결로 여러 턴의 대화를 처리합니다.
+    클라이언트는 {"sender": ..., "content": ...} 형식으로 메시지를 보내고,
+    LangChain 서버에서 받은 중간 프레임은 {"type": "frame"}, 최종 응답은 {"type": "reply"}로 전달됩니다.
+    """
+    user_idx = decode_ws_token(token)
+    if user_idx is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    session = await run_in_threadpool(load_ws_chat_session, room_id)
+    if not session or session["user_idx"] != user_idx:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    upstream = LangChainSession(room_id)
+    favorability = session["favorability"]
+    history_lines = session["history_lines"]
+
+    try:
+        while True:
+            try:
+                message = MessageSchema(**await websocket.receive_json())
+            except (ValueError, TypeError):
+                await websocket.send_json({"type": "error", "detail": "메시지 형식이 올바르지 않습니다."})
+                continue
+
+            # 시나리오는 연결 중에도 바뀔 수 있으므로 턴마다 캐시에서 확인 (만료된 경우에만 DB 조회)
+            scenario_payload = scenario.cached_scenario_payload(room_id)
+            if scenario_payload is None:
+                scenario_payload = await run_in_threadpool(scenario.load_scenario_payload, room_id)
+
+            request_data = {
+                **session["persona"],
+                **scenario_payload,
+                "user_message": message.content,
+                "favorability": favorability, # 호감도
+                "chat_history": "".join(line + '\n' for line in history_lines) # 채팅 기록
+            }
+
+            try:
+                async for frame in upstream.stream(request_data):
+                    if not is_final_frame(frame):
+                        # 중간 프레임은 도착하는 즉시 전달
+                        await websocket.send_json({"type": "frame", "data": frame})
+                        continue
+
+                    bot_response_text = frame.get("text", "openai_api 에러가 발생했습니다.")
+                    predicted_emotion = frame.get("emotion", "Neutral")
+                    updated_favorability = frame.get("favorability", favorability)
+
+                    if updated_favorability != favorability:
+                        await run_in_threadpool(save_favorability, room_id, updated_favorability)
+                        favorability = updated_favorability
+
+                    history_lines.append(f"user: {message.content}")
+                    history_lines.append(f"chatbot: {bot_response_text}")
+                    del history_lines[:-WS_CHAT_HISTORY_MAX_LINES]
+
+                    await websocket.send_json({
+                        "type": "reply",
+                        "user": message.content,
+                        "bot": bot_response_text,
+                        "updated_favorability": updated_favorability,
+                        "emotion": predicted_emotion
+                    })
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Error in chat_websocket: {str(e)}")  # 디버깅용
+                await upstream.close()
+                await websocket.send_json({"type": "error", "detail": "LangChain 서버와 통신 중 오류가 발생했습니다."})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await upstream.close()
+
 # 캐릭터 생성 api
 @app.post("/api/characters/", response_model=CharacterResponseSchema)
 async def create_character(
-    character_image: UploadFile = File(...),
+    background_tasks: BackgroundTasks,
+    character_image: Optional[UploadFile] = None,
     character_data: str = Form(...),
+    image_key: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
+    """
+    이미지는 파일(character_image) 또는 /api/storage/uploads 로 직접 업로드한 키(image_key) 로 전달.
+    """
     try:
+        if not character_image and not image_key:
+            raise HTTPException(status_code=400, detail="캐릭터 이미지가 필요합니다.")
+        # 트랜잭션 밖에서 저장 (S3 업로드 / 확인 동안 DB 커넥션을 잡지 않음)
+        file_path = await store_image("characters", character_image, image_key)
+
         with db.begin():
             print("Received character data:", character_data)  # 디버깅용 로그
             character_dict = json.loads(character_data)
@@ -607,31 +812,20 @@ async def create_character(
             db.add(new_character)
             db.flush()  # `new_character.char_idx`를 사용하기 위해 flush 실행
             
-            # 캐릭터 프롬프트 생성
-            new_prompt = CharacterPrompt(
-                char_idx=new_character.char_idx,
-                character_appearance=character.character_appearance,
-                character_personality=character.character_personality,
-                character_background=character.character_background,
-                character_speech_style=character.character_speech_style,
+            # 캐릭터 프롬프트 저장 (내용이 같은 기존 프롬프트가 있으면 재사용)
+            new_prompt = save_character_prompt(
+                db,
+                new_character.char_idx,
+                character.character_appearance,
+                character.character_personality,
+                character.character_background,
+                character.character_speech_style,
                 example_dialogues=(
                     [json.dumps(dialogue, ensure_ascii=False) for dialogue in character.example_dialogues]
                     if character.example_dialogues else None
                 ),
             )
 
-            db.add(new_prompt)
-
-            # 이미지 파일 저장
-            file_extension = character_image.filename.split(".")[-1]
-            timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-            unique_filename = f"{timestamp}_{uuid.uuid4().hex}.{file_extension}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-            # 파일 저장
-            with open(file_path, "wb") as f:
-                f.write(await character_image.read())
-
              # 이미지 테이블에 저장
             new_image = Image(file_path=file_path)
             db.add(new_image)
@@ -652,9 +846,25 @@ async def create_character(
                         tag_description=tag["tag_description"]
                     )
                     db.add(new_tag)
+            # 태그 사전 매핑 (태그 필터링용)
+            tag_ids = set_character_tags(db, new_character.char_idx, [tag["tag_name"] for tag in character.tags or []])
+
+            # 제작자 대시보드의 필드/태그 분포 갱신
+            db.flush()
+            refresh_creator_catalog(db, new_character.character_owner)
+
+            # 조회 API ETag 버전 증가
+            changed = [etag.CATALOG, etag.character_counter(new_character.char_idx)]
+            if character.tags:
+                changed.append(etag.TAGS)
+            etag.bump(db, *changed)
 
         # 트랜잭션 커밋 (with 블록 종료 시 자동으로 커밋됨, 명시적으로 작성)
         db.commit()
+        tag_index.set_character(new_character.char_idx, tag_ids)
+        facet_index.set_character(new_character.char_idx, character.field_idx)
+        # 비슷한 캐릭터 목록은 응답 후 증분 계산
+        background_tasks.add_task(recommendations.add_character, new_character.char_idx)
 
         return CharacterResponseSchema(
             char_idx=new_character.char_idx,
@@ -671,19 +881,67 @@ async def create_character(
             ] if new_prompt.example_dialogues else None,
             character_image=file_path
         )
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         print(f"Error in create_character: {str(e)}")
         db.rollback() # 트랜잭션 롤백
         raise HTTPException(status_code=500, detail=str(e))
 
-def clean_json_string(json_string):
-    if not json_string:
-        return json_string
-    return re.sub(r'[\x00-\x1F\x7F]', '', json_string)
+# 목록 API 직렬화기 (fast_json.RowSerializer, 선택한 컬럼 순서대로 응답 키가 만들어짐)
+CHARACTER_CARD = RowSerializer(
+    Character.char_idx,
+    Character.char_name,
+    Character.char_description,
+    Character.created_at,
+    Character.field_idx,
+    Character.character_owner,
+    Image.file_path.label("character_image"),
+)
+
+CHARACTER_LIST = RowSerializer(
+    Character.char_idx,
+    Character.char_name,
+    Character.char_description,
+    Character.created_at,
+    Character.nicknames,
+    CharacterPrompt.character_appearance,
+    CharacterPrompt.character_personality,
+    CharacterPrompt.character_background,
+    CharacterPrompt.character_speech_style,
+    CharacterPrompt.example_dialogues,
+    Image.file_path.label("character_image"),
+    Character.field_idx,
+    Character.follower_count,
+)
+
+def parse_nicknames(nicknames):
+    return json.loads(nicknames) if nicknames else {'30': '', '70': '', '100': ''}
+
+def parse_example_dialogues(example_dialogues):
+    if not example_dialogues:
+        return []
+    return [json.loads(clean_json_string(dialogue)) if dialogue else {} for dialogue in example_dialogues]
 
 # 캐릭터 목록 조회 API
 @app.get("/api/characters/", response_model=List[dict])
-def get_characters(db: Session = Depends(get_db), request: Request = None):
+def get_characters(
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    fields 가 주어지면 해당 키만 조회/반환합니다. (예: ?fields=char_name,char_description,character_image)
+    char_idx 는 항상 포함됩니다.
+    """
+    serializer = CHARACTER_LIST.project(fields, always=("char_idx",), extra=("tags",))
+
+    # 목록이 바뀌지 않았으면 버전 조회 한 번으로 304 반환
+    headers, cached = etag.not_modified(request, db, etag.CATALOG)
+    if cached:
+        return cached
+
     # 각 캐릭터에 대한 최신 char_prompt_id를 가져오는 subquery
     subquery = (
         select(
@@ -694,68 +952,50 @@ def get_characters(db: Session = Depends(get_db), request: Request = None):
         .subquery()
     )
 
-    # 캐릭터를 최신 프롬프트와 join하고 이미지 정보를 포함하는 query
+    # 캐릭터를 최신 프롬프트와 join하고 이미지 정보를 포함하는 query (선택한 컬럼만 조회)
     query = (
-        db.query(Character, CharacterPrompt, Image.file_path)
+        db.query(*serializer.columns)
+        .select_from(Character)
         .join(subquery, subquery.c.char_idx == Character.char_idx)
         .join(
             CharacterPrompt,
             (CharacterPrompt.char_idx == subquery.c.char_idx) &
             (CharacterPrompt.created_at == subquery.c.latest_created_at)
         )
-        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
         .filter(Character.is_active == True)  # is_active가 True인 캐릭터만 가져오기
     )
+    if wants(fields, "character_image"):
+        query = (
+            query
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        )
 
     characters_info = query.all()
     base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
-    results = []
 
-    for char, prompt, image_path in characters_info:
-
-        follower_count = (
-            db.query(func.count(Friend.friend_idx))
-            .filter(Friend.char_idx == char.char_idx, Friend.is_active == True)
-            .scalar()
+    # 캐릭터별 태그를 한 번의 쿼리로 조회
+    tag_map = {}
+    if characters_info and wants(fields, "tags"):
+        tags = (
+            db.query(Tag.char_idx, Tag.tag_name, Tag.tag_description)
+            .filter(Tag.char_idx.in_([row.char_idx for row in characters_info]), Tag.is_deleted == False)
+            .all()
         )
-        print(f"Character: {char.char_name}, field_idx: {char.field_idx}, type: {type(char.field_idx)}")
-        if prompt:
-            example_dialogues = [json.loads(clean_json_string(dialogue)) if dialogue else {} for dialogue in prompt.example_dialogues] if prompt.example_dialogues else []
-            nicknames = json.loads(char.nicknames) if char.nicknames else {'30': '', '70': '', '100': ''}
-        else:
-            # 기본값 설정
-            example_dialogues = []
-            nicknames = {'30': '', '70': '', '100': ''}
-
-        # 이미지 URL 생성
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
-
-        tags = db.query(Tag).filter(
-            Tag.char_idx == char.char_idx,
-            Tag.is_deleted == False
-        ).all()
-        
-        tag_list = [{"tag_name": tag.tag_name, "tag_description": tag.tag_description} for tag in tags]
-
-        results.append({
-            "char_idx": char.char_idx,
-            "char_name": char.char_name,
-            "char_description": char.char_description,
-            "created_at": char.created_at.isoformat(),
-            "nicknames": nicknames,
-            "character_appearance": prompt.character_appearance if prompt else "",
-            "character_personality": prompt.character_personality if prompt else "",
-            "character_background": prompt.character_background if prompt else "",
-            "character_speech_style": prompt.character_speech_style if prompt else "",
-            "example_dialogues": example_dialogues,
-            "tags": tag_list,
-            "character_image": image_url,
-            "field_idx": char.field_idx,
-            "follower_count": follower_count
-        })
+        for tag_char_idx, tag_name, tag_description in tags:
+            tag_map.setdefault(tag_char_idx, []).append({"tag_name": tag_name, "tag_description": tag_description})
+
+    results = serializer.serialize_all(
+        characters_info,
+        nicknames=parse_nicknames,
+        example_dialogues=parse_example_dialogues,
+        character_image=lambda image_path: media_url(base_url, image_path),
+    )
+    if wants(fields, "tags"):
+        for item in results:
+            item["tags"] = tag_map.get(item["char_idx"], [])
 
-    return results
+    return FastJSONResponse(results, headers=headers)
 
 # 특정 유저가 생성한 캐릭터 목록 조회 API
 @app.get("/api/characters/user/{user_id}", response_model=List[dict])
@@ -801,7 +1041,7 @@ def get_characters(user_id: int, db: Session = Depends(get_db), request: Request
             nicknames = {'30': '', '70': '', '100': ''}
 
         # 이미지 URL 생성
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
+        image_url = media_url(base_url, image_path)
 
         results.append({
             "char_idx": char.char_idx,
@@ -847,7 +1087,7 @@ def get_characters_by_field(
     """
     # 기본 쿼리 작성
     query = (
-        db.query(Character, Image.file_path)
+        db.query(*CHARACTER_CARD.columns)
         .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
         .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
         .filter(Character.is_active == True)
@@ -863,52 +1103,126 @@ def get_characters_by_field(
     # 요청 URL로부터 base URL 생성
     base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
 
-    # 결과 리스트 생성
-    results = []
-    for char, image_path in characters_info:
-        # 이미지 URL 생성
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
+    # 결과 리스트 생성 (이미 검증된 DB 값이므로 response_model 검증 없이 바로 직렬화)
+    results = CHARACTER_CARD.serialize_all(
+        characters_info,
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
 
-        # 결과에 추가
-        results.append({
-            "char_idx": char.char_idx,
-            "char_name": char.char_name,
-            "char_description": char.char_description,
-            "created_at": char.created_at.isoformat(),
-            "field_idx": char.field_idx,
-            "character_owner": char.character_owner,
-            "character_image": image_url,
-        })
+    return FastJSONResponse(results)
 
-    return results
 
+# 캐릭터 탐색 API - 필드 + 태그 조합 필터와 패싯별 개수
+@app.get("/api/characters/browse", response_model=dict)
+def browse_characters(
+    fields: Optional[List[int]] = Depends(parse_fields),
+    tags: Optional[str] = Query(default=None, description="쉼표로 구분된 태그 이름"),
+    match: str = Query(default="all", pattern="^(all|any)$", description="태그 조건 all: AND, any: OR"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=20, ge=1, le=100),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    필드(OR)와 태그(AND/OR)를 함께 적용한 캐릭터 목록과 필드/태그별 개수를 반환합니다.
+    필터와 개수는 메모리 비트셋(facets.py)으로 계산하고, DB 는 해당 페이지의 캐릭터 카드만 조회합니다.
+    """
+    tag_names = [name.strip() for name in tags.split(",") if name.strip()] if tags else []
+    if len(tag_names) > MAX_QUERY_TAGS:
+        raise HTTPException(status_code=400, detail=f"태그는 최대 {MAX_QUERY_TAGS}개까지 지정할 수 있습니다.")
+
+    result = facet_index.browse(fields, tag_names, match_all=(match == "all"), offset=offset, limit=limit)
+    char_ids = result["char_ids"]
+    rows = []
+    if char_ids:
+        rows = (
+            db.query(*CHARACTER_CARD.columns)
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+            .filter(Character.char_idx.in_(char_ids), Character.is_active == True)
+            .all()
+        )
+        position = {char_idx: index for index, char_idx in enumerate(char_ids)}
+        rows.sort(key=lambda row: position[row.char_idx])
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    items = CHARACTER_CARD.serialize_all(
+        rows,
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
+    return FastJSONResponse({
+        "total": result["total"],
+        "offset": offset,
+        "items": items,
+        "facets": {"fields": result["fields"], "tags": result["tags"]},
+    })
 
 # 캐릭터 목록 조회 API - 태그 기준 조회
 @app.get("/api/characters/tag", response_model=List[CharacterCardResponseSchema])
 def get_characters_by_tag(
-    tags: Optional[List[str]] = Depends(parse_fields), 
-    limit: int = Query(default=10),
-    db: Session = Depends(get_db)):
+    tags: Optional[str] = Query(default=None, description="쉼표로 구분된 태그 이름"),
+    match: str = Query(default="all", pattern="^(all|any)$", description="all: 모든 태그(AND), any: 하나 이상(OR)"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
     """
-    태그 값이 없으면 전체 데이터를 반환합니다.
+    태그 값이 없으면 전체 데이터를 최근 생성 순으로 반환합니다.
+    태그가 주어지면 태그 역색인에서 char_idx 페이지를 먼저 구하고 해당 캐릭터만 조회합니다.
+    전체 개수는 X-Total-Count 헤더로 반환합니다.
     """
-    query = db.query(Character).filter(Character.is_active == True)
-    if tags:  # 태그 값이 주어지면 필터링
-        query = query.join(Character.tags).filter(Tag.name.in_(tags))
-    characters = query.limit(limit).all()  # limit 적용
+    tag_names = [name.strip() for name in tags.split(",") if name.strip()] if tags else []
+    if len(tag_names) > MAX_QUERY_TAGS:
+        raise HTTPException(status_code=400, detail=f"태그는 최대 {MAX_QUERY_TAGS}개까지 지정할 수 있습니다.")
+
+    query = (
+        db.query(*CHARACTER_CARD.columns)
+        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        .filter(Character.is_active == True)
+    )
+    if tag_names:
+        total, char_ids = tag_index.query(tag_names, match_all=(match == "all"), offset=offset, limit=limit)
+        rows = query.filter(Character.char_idx.in_(char_ids)).all() if char_ids else []
+        # 역색인 순서(최근 생성 순)대로 정렬
+        position = {char_idx: index for index, char_idx in enumerate(char_ids)}
+        rows.sort(key=lambda row: position[row.char_idx])
+    else:
+        total = query.count()
+        rows = query.order_by(Character.created_at.desc()).offset(offset).limit(limit).all()
 
-    return characters
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    results = CHARACTER_CARD.serialize_all(
+        rows,
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
+    return FastJSONResponse(results, headers={"X-Total-Count": str(total)})
 
 # 캐릭터 목록 조회 API - 최근 생성 순 조회
 @app.get("/api/characters/new", response_model=List[CharacterCardResponseSchema])
-def get_new_characters(limit: Optional[int] = 10, db: Session = Depends(get_db)):
+def get_new_characters(limit: Optional[int] = 10, db: Session = Depends(get_db), request: Request = None):
     """
     최근 생성된 캐릭터를 조회합니다.
     limit 값이 없으면 기본적으로 10개의 데이터를 반환합니다.
     """
-    characters = db.query(Character).filter(Character.is_active == True).order_by(Character.created_at.desc()).limit(limit).all()
-    
-    return characters
+    characters_info = (
+        db.query(*CHARACTER_CARD.columns)
+        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        .filter(Character.is_active == True)
+        .order_by(Character.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    results = CHARACTER_CARD.serialize_all(
+        characters_info,
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
+
+    return FastJSONResponse(results)
 
 # 캐릭터 삭제 API
 @app.delete("/api/characters/{char_idx}")
@@ -924,7 +1238,13 @@ def delete_character(char_idx: int, db: Session = Depends(get_db)):
 
     # 캐릭터 숨김 처리
     character.is_active = False
+    db.flush()
+    refresh_creator_catalog(db, character.character_owner)
+    # /api/tags 의 character_count 에서도 빠지므로 태그 버전도 증가
+    etag.bump(db, etag.CATALOG, etag.character_counter(char_idx), etag.TAGS)
     db.commit()
+    tag_index.remove_character(char_idx)
+    facet_index.remove_character(char_idx)
     return {"message": f"캐릭터 {char_idx}이(가) 성공적으로 삭제되었습니다."}
 
 # 이미지 생성 요청 API
@@ -1059,43 +1379,51 @@ def get_tts_model(room_id: str, db: Session = Depends(get_db)):
     }
 
 @app.get("/api/voices/")
-def get_voices(db: Session = Depends(get_db)):
+def get_voices(db: Session = Depends(get_db), request: Request = None):
+    headers, cached = etag.not_modified(request, db, etag.VOICES)
+    if cached:
+        return cached
+
     voices = db.query(Voice).all()
-    return [{"voice_idx": str(voice.voice_idx), "voice_speaker": voice.voice_speaker} for voice in voices]
+    return FastJSONResponse(
+        [{"voice_idx": str(voice.voice_idx), "voice_speaker": voice.voice_speaker} for voice in voices],
+        headers=headers
+    )
 
 
 # 필드 항목 가져오기 API
 @app.get("/api/fields/")
-def get_fields(db: Session = Depends(get_db)):
+def get_fields(db: Session = Depends(get_db), request: Request = None):
     """
     필드 항목을 반환하는 API 엔드포인트.
     """
     try:
+        headers, cached = etag.not_modified(request, db, etag.FIELDS)
+        if cached:
+            return cached
+
         fields = db.query(DBField).all()  # DBField로 변경
-        return [{"field_idx": field.field_idx, "field_category": field.field_category} for field in fields]
+        return FastJSONResponse(
+            [{"field_idx": field.field_idx, "field_category": field.field_category} for field in fields],
+            headers=headers
+        )
     except Exception as e:
         print(f"Error in get_fields: {str(e)}")  # 에러 로깅 추가
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.get("/api/tags")
-def get_tags(db: Session = Depends(get_db)):
-    tags = db.query(Tag).distinct(Tag.tag_name).all()
-    return [{"tag_idx": tag.tag_idx, "tag_name": tag.tag_name} for tag in tags]
-
-@app.get("/api/fields/")
-def get_fields(db: Session = Depends(get_db)):
-    """
-    필드 항목을 반환하는 API 엔드포인트.
-    """
-    try:
-        fields = db.query(DBField).all()  # DBField는 필드 정보를 저장하는 테이블
-        return [{"field_idx": field.field_idx, "field_category": field.field_category} for field in fields]
-    except Exception as e:
-        print(f"Error in get_fields: {str(e)}")  # 에러 로그
-        raise HTTPException(status_code=500, detail="필드 데이터를 불러오는 중 오류가 발생했습니다.")
+def get_tags(db: Session = Depends(get_db), request: Request = None):
+    headers, cached = etag.not_modified(request, db, etag.TAGS)
+    if cached:
+        return cached
+
+    # 태그 사전 역색인에서 바로 반환 (사용 캐릭터 수 내림차순), 다른 워커의 변경이 있으면 먼저 다시 읽음
+    tag_index.sync(db, headers["ETag"])
+    return FastJSONResponse(tag_index.tags(), headers=headers)
     
 @app.post("/api/friends/follow", response_model=dict)
 def follow_character(
+    background_tasks: BackgroundTasks,
     user_idx: int = Body(...),
     char_idx: int = Body(...),
     db: Session = Depends(get_db)
@@ -1117,7 +1445,10 @@ def follow_character(
             char_idx=char_idx
         )
         db.add(new_follow)
+        change_follower_count(db, char_idx, 1)
         db.commit()
+        # 추천 피드는 응답 후 이 사용자만 다시 계산
+        background_tasks.add_task(feed.refresh_user_feed, user_idx)
         return {"message": "성공적으로 팔로우했습니다."}
     except Exception as e:
         db.rollback()
@@ -1127,6 +1458,7 @@ def follow_character(
 def unfollow_character(
     user_idx: int,
     char_idx: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     try:
@@ -1140,12 +1472,38 @@ def unfollow_character(
             raise HTTPException(status_code=404, detail="팔로우 관계를 찾을 수 없습니다.")
 
         follow.is_active = False
+        change_follower_count(db, char_idx, -1)
         db.commit()
+        background_tasks.add_task(feed.refresh_user_feed, user_idx)
         return {"message": "성공적으로 언팔로우했습니다."}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/friends/check/batch", response_model=dict)
+def check_follow_batch(payload: FollowCheckBatchRequest, db: Session = Depends(get_db)):
+    """
+    여러 캐릭터의 팔로우 여부를 한 번에 반환합니다.
+    bitmap 의 i 번째 문자가 char_ids[i] 의 팔로우 여부 ('1' 팔로우, '0' 아님) 입니다.
+    """
+    char_ids = unique_batch_ids(payload.char_ids)
+    followed = set()
+    if char_ids:
+        followed = {
+            char_idx for (char_idx,) in
+            db.query(Friend.char_idx).filter(
+                Friend.user_idx == payload.user_idx,
+                Friend.char_idx.in_(char_ids),
+                Friend.is_active == True
+            ).all()
+        }
+
+    return {
+        "user_idx": payload.user_idx,
+        "char_ids": char_ids,
+        "bitmap": "".join("1" if char_idx in followed else "0" for char_idx in char_ids),
+    }
+
 @app.get("/api/friends/check/{user_idx}/{char_idx}")
 def check_follow(user_idx: int, char_idx: int, db: Session = Depends(get_db)):
     follow = db.query(Friend).filter(
@@ -1155,11 +1513,33 @@ def check_follow(user_idx: int, char_idx: int, db: Session = Depends(get_db)):
     ).first()
     return {"is_following": bool(follow)}
 
+# 팔로우한 캐릭터 목록 직렬화기
+FOLLOWED_CHARACTER_LIST = RowSerializer(
+    Character.char_idx,
+    Character.character_owner,
+    Character.char_name,
+    Character.char_description,
+    Character.created_at,
+    CharacterPrompt.character_appearance,
+    CharacterPrompt.character_personality,
+    CharacterPrompt.character_background,
+    CharacterPrompt.character_speech_style,
+    Image.file_path.label("character_image"),
+)
+
 @app.get("/api/friends/{user_idx}/characters", response_model=List[dict])
-def get_followed_characters(user_idx: int, db: Session = Depends(get_db), request: Request = None):
+def get_followed_characters(
+    user_idx: int,
+    fields: Optional[List[str]] = Depends(sparse_fields),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
     """
     특정 사용자가 팔로우한 캐릭터 목록을 반환하는 API 엔드포인트.
+    fields 가 주어지면 해당 키만 반환합니다. char_idx 는 항상 포함됩니다.
     """
+    serializer = FOLLOWED_CHARACTER_LIST.project(fields, always=("char_idx",))
+
     subquery = (
         select(
             CharacterPrompt.char_idx,
@@ -1171,15 +1551,14 @@ def get_followed_characters(user_idx: int, db: Session = Depends(get_db), reques
 
     # Friend 테이블을 사용하여 특정 사용자가 팔로우한 캐릭터 조회
     query = (
-        db.query(Character, CharacterPrompt, Image.file_path)
+        db.query(*serializer.columns)
+        .select_from(Character)
         .join(subquery, subquery.c.char_idx == Character.char_idx)
         .join(
             CharacterPrompt,
             (CharacterPrompt.char_idx == subquery.c.char_idx) &
             (CharacterPrompt.created_at == subquery.c.latest_created_at)
         )
-        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
         .join(Friend, Friend.char_idx == Character.char_idx)
         .filter(
             Friend.user_idx == user_idx,
@@ -1187,28 +1566,100 @@ def get_followed_characters(user_idx: int, db: Session = Depends(get_db), reques
             Character.is_active == True  # 활성화된 캐릭터만 조회
         )
     )
+    if wants(fields, "character_image"):
+        query = (
+            query
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        )
 
-    followed_characters = query.all()
     base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
-    results = []
+    results = serializer.serialize_all(
+        query.all(),
+        character_image=lambda image_path: media_url(base_url, image_path)
+    )
 
-    for char, prompt, image_path in followed_characters:
-        image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
+    return FastJSONResponse(results)
 
-        results.append({
-            "char_idx": char.char_idx,
-            "character_owner": char.character_owner,
-            "char_name": char.char_name,
-            "char_description": char.char_description,
-            "created_at": char.created_at.isoformat(),
-            "character_appearance": prompt.character_appearance if prompt else "",
-            "character_personality": prompt.character_personality if prompt else "",
-            "character_background": prompt.character_background if prompt else "",
-            "character_speech_style": prompt.character_speech_style if prompt else "",
+def load_character_profiles(db: Session, char_ids: List[int], base_url: str = "") -> dict:
+    """
+    캐릭터 상세 정보를 char_idx -> dict 로 반환. 캐릭터 수와 관계없이 쿼리 2번
+    (캐릭터+최신 프롬프트+이미지, 태그) 으로 조회하며 없는/삭제된 캐릭터는 빠집니다.
+    """
+    if not char_ids:
+        return {}
+
+    subquery = (
+        select(
+            CharacterPrompt.char_idx,
+            func.max(CharacterPrompt.created_at).label("latest_created_at")
+        )
+        .where(CharacterPrompt.char_idx.in_(char_ids))
+        .group_by(CharacterPrompt.char_idx)
+        .subquery()
+    )
+
+    rows = (
+        db.query(Character, CharacterPrompt, Image.file_path)
+        .join(subquery, subquery.c.char_idx == Character.char_idx)
+        .join(
+            CharacterPrompt,
+            (CharacterPrompt.char_idx == subquery.c.char_idx) &
+            (CharacterPrompt.created_at == subquery.c.latest_created_at)
+        )
+        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        .filter(Character.char_idx.in_(char_ids), Character.is_active == True)
+        .all()
+    )
+
+    tag_map = {}
+    tags = (
+        db.query(Tag.char_idx, Tag.tag_name, Tag.tag_description)
+        .filter(Tag.char_idx.in_(char_ids), Tag.is_deleted == False)
+        .all()
+    )
+    for tag_char_idx, tag_name, tag_description in tags:
+        tag_map.setdefault(tag_char_idx, []).append({"tag_name": tag_name, "tag_description": tag_description})
+
+    profiles = {}
+    for character, prompt, image_path in rows:
+        # 이미지 URL 생성
+        image_url = media_url(base_url, image_path)
+
+        profiles[character.char_idx] = {
+            "char_idx": character.char_idx,
+            "char_name": character.char_name,
+            "char_description": character.char_description,
+            "created_at": character.created_at.isoformat(),
+            "character_appearance": prompt.character_appearance,
+            "character_personality": prompt.character_personality,
+            "character_background": prompt.character_background,
+            "character_speech_style": prompt.character_speech_style,
+            "example_dialogues": prompt.example_dialogues,
+            "tags": tag_map.get(character.char_idx, []),
             "character_image": image_url,
-        })
+            "field_idx": character.field_idx,  # 필드 카테고리 추가
+            "nicknames": json.loads(character.nicknames) if character.nicknames else {},  # 호칭 정보 추가
+            "follower_count": character.follower_count
+        }
+    return profiles
 
-    return results
+# 캐릭터 배치 조회 API
+@app.post("/api/characters/batch", response_model=dict)
+def get_characters_batch(payload: CharacterBatchRequest, db: Session = Depends(get_db), request: Request = None):
+    """
+    여러 캐릭터의 상세 정보를 한 번에 반환합니다. 요청 순서대로 items 에 담고,
+    없거나 삭제된 캐릭터는 missing 에 담습니다.
+    """
+    char_ids = unique_batch_ids(payload.char_ids)
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    profiles = load_character_profiles(db, char_ids, base_url)
+
+    return FastJSONResponse({
+        "items": [profiles[char_idx] for char_idx in char_ids if char_idx in profiles],
+        "missing": [char_idx for char_idx in char_ids if char_idx not in profiles],
+    })
 
 # 특정 캐릭터 조회
 @app.get("/api/characters/{char_idx}", response_model=dict)
@@ -1216,49 +1667,16 @@ def get_character_by_id(char_idx: int, db: Session = Depends(get_db), request: R
     """
     특정 캐릭터 정보를 반환하는 API 엔드포인트 (이미지, 호칭, 필드값 포함).
     """
-    character_data = (
-        db.query(Character, CharacterPrompt, Image.file_path, DBField.field_category)
-        .join(CharacterPrompt, Character.char_idx == CharacterPrompt.char_idx)
-        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
-        .join(DBField, DBField.field_idx == Character.field_idx)
-        .filter(Character.char_idx == char_idx, Character.is_active == True)
-        .first()
-    )
-
-    follower_count = db.query(Friend).filter(Friend.char_idx == char_idx, Friend.is_active == True).count()
-
-    if not character_data:
-        raise HTTPException(status_code=404, detail="해당 캐릭터를 찾을 수 없습니다.")
-    
-    character, prompt, image_path, field_category = character_data
+    headers, cached = etag.not_modified(request, db, etag.character_counter(char_idx))
+    if cached:
+        return cached
 
-    # 이미지 URL 생성
     base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
-    image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
-
-    # JSON으로 저장된 호칭을 파싱
-    nicknames = json.loads(character.nicknames) if character.nicknames else {}
+    profile = load_character_profiles(db, [char_idx], base_url).get(char_idx)
+    if not profile:
+        raise HTTPException(status_code=404, detail="해당 캐릭터를 찾을 수 없습니다.")
 
-    return {
-        "char_idx": character.char_idx,
-        "char_name": character.char_name,
-        "char_description": character.char_description,
-        "created_at": character.created_at.isoformat(),
-        "character_appearance": prompt.character_appearance,
-        "character_personality": prompt.character_personality,
-        "character_background": prompt.character_background,
-        "character_speech_style": prompt.character_speech_style,
-        "example_dialogues": prompt.example_dialogues,
-        "tags": [
-            {"tag_name": tag.tag_name, "tag_description": tag.tag_description}
-            for tag in db.query(Tag).filter(Tag.char_idx == character.char_idx, Tag.is_deleted == False).all()
-        ],
-        "character_image": image_url,
-        "field_idx": character.field_idx,  # 필드 카테고리 추가
-        "nicknames": nicknames,  # 호칭 정보 추가
-        "follower_count": follower_count
-    }
+    return FastJSONResponse(profile, headers=headers)
 
 # 특정 캐릭터 수정
 # -------------- user_idx 확인해야 함 --------------------------
@@ -1267,10 +1685,14 @@ async def update_character(
     char_idx: int,
     character_image: Optional[UploadFile] = None,
     character_data: str = Form(...),
+    image_key: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
     try:
         print(f"Received character data for update: {character_data}")  # 로깅 추가
+        # 새 이미지 (파일 또는 직접 업로드한 키) 는 트랜잭션 밖에서 저장
+        file_path = await store_image("characters", character_image, image_key)
+
         with db.begin():
             character_dict = json.loads(character_data)
             print(f"Parsed character dict: {character_dict}")  # 로깅 추가
@@ -1299,23 +1721,24 @@ async def update_character(
             existing_character.char_description = character.char_description
             existing_character.nicknames = json.dumps(character.nicknames)
 
-            # 새로운 프롬프트 생성
-            new_prompt = CharacterPrompt(
-                char_idx=char_idx,
-                character_appearance=character.character_appearance,
-                character_personality=character.character_personality,
-                character_background=character.character_background,
-                character_speech_style=character.character_speech_style,
+            # 캐릭터 프롬프트 저장 (내용이 같은 기존 프롬프트가 있으면 재사용)
+            new_prompt = save_character_prompt(
+                db,
+                char_idx,
+                character.character_appearance,
+                character.character_personality,
+                character.character_background,
+                character.character_speech_style,
                 example_dialogues=(
                     [json.dumps(dialogue, ensure_ascii=False) for dialogue in character.example_dialogues]
                     if character.example_dialogues else None
                 ),
             )
-            db.add(new_prompt)
-            print("Added new prompt")  # 로깅 추가
+            print(f"Saved prompt: {new_prompt.char_prompt_id}")  # 로깅 추가
 
             # 이미지 업데이트 로직
-            if character_image:
+            replaced_images = []
+            if file_path:
                 print("Updating character image...")  # 로깅 추가
 
                 # 기존 이미지 매핑 및 이미지 가져오기
@@ -1331,31 +1754,13 @@ async def update_character(
                     ).first()
 
                     if existing_image:
-                        # 새 이미지 파일 저장
-                        file_extension = character_image.filename.split(".")[-1]
-                        timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-                        unique_filename = f"{timestamp}_{uuid.uuid4().hex}.{file_extension}"
-                        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-                        # 파일 저장
-                        with open(file_path, "wb") as f:
-                            f.write(await character_image.read())
-
-                        # 기존 이미지 경로 교체
+                        # 기존 이미지 경로 교체 (커밋 후 이미지 경로 캐시 무효화)
+                        replaced_images.append((existing_image.img_idx, existing_image.file_path))
                         existing_image.file_path = file_path
                         print("Image file path updated successfully.")  # 로깅 추가
 
                 else:
                     # 기존 이미지가 없는 경우 새 이미지 레코드를 생성
-                    file_extension = character_image.filename.split(".")[-1]
-                    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
-                    unique_filename = f"{timestamp}_{uuid.uuid4().hex}.{file_extension}"
-                    file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-                    # 파일 저장
-                    with open(file_path, "wb") as f:
-                        f.write(await character_image.read())
-
                     new_image = Image(file_path=file_path)
                     db.add(new_image)
                     db.flush()
@@ -1369,6 +1774,7 @@ async def update_character(
                     db.add(new_mapping)
 
             # 태그 업데이트
+            tag_ids = None
             if character.tags:
                 print("Updating tags")  # 로깅 추가
 
@@ -1385,11 +1791,30 @@ async def update_character(
                         tag_description=tag["tag_description"]
                     )
                     db.add(new_tag)
+                tag_ids = set_character_tags(db, char_idx, [tag["tag_name"] for tag in character.tags])
                 print("Successfully updated tags")  # 로깅 추가
 
+            # 제작자 대시보드의 캐릭터 이름/이미지, 필드/태그 분포 갱신
+            db.flush()
+            refresh_creator_catalog(db, existing_character.character_owner)
+
+            # 조회 API ETag 버전 증가
+            changed = [etag.CATALOG, etag.character_counter(char_idx)]
+            if character.tags:
+                changed.append(etag.TAGS)
+            etag.bump(db, *changed)
+
         db.commit()
+        if tag_ids is not None:
+            tag_index.set_character(char_idx, tag_ids)
+        for img_idx, old_path in replaced_images:
+            invalidate_image(img_idx, old_path)
+        facet_index.set_character(char_idx, character.field_idx)
         return {"message": "캐릭터가 성공적으로 업데이트되었습니다."}
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         print(f"Detailed error in update_character: {str(e)}")  # 상세 에러 로깅
         print(f"Error type: {type(e)}")  # 에러 타입 출력
@@ -1419,44 +1844,23 @@ def delete_chat_room(room_id: str, db: Session = Depends(get_db)):
 @app.get("/api/characters/top3/{user_idx}")
 def get_top3_characters(user_idx: int, db: Session = Depends(get_db), request: Request = None):
     try:
-        # 기본 쿼리 설정
-        query = (
-            db.query(
-                Character.char_idx,
-                Character.char_name,
-                func.count(ChatLog.session_id).label("log_count"),
-                Image.file_path
-            )
-            .join(ChatRoom, ChatRoom.char_prompt_id == Character.char_idx)
-            .join(ChatLog, ChatLog.chat_id == ChatRoom.chat_id)
-            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
-            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
-            .filter(Character.character_owner == user_idx)
-            .group_by(Character.char_idx, Character.char_name, Image.file_path)
-            .order_by(func.count(ChatLog.session_id).desc())
-            .limit(3)
-        )
-
-        # 쿼리 결과 가져오기
-        results = query.all()
-
-        if not results:
-            return {"message": "사용 기록이 있는 캐릭터가 없습니다."}
-
         # 요청 URL에서 base URL 생성
         base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
 
-        # 결과 처리
-        top_characters = []
-        for char_idx, char_name, log_count, image_path in results:
-            # 이미지 경로 처리
-            image_url = f"{base_url}/static/{os.path.basename(image_path)}" if image_path else None
-            top_characters.append({
-                "char_idx": char_idx,
-                "char_name": char_name,
-                "log_count": log_count,
-                "character_image": image_url,
-            })
+        # 제작자 대시보드 집계에서 대화 세션 수 상위 3개 캐릭터
+        dashboard = load_creator_dashboard(db, user_idx, base_url)
+        top_characters = [
+            {
+                "char_idx": item["char_idx"],
+                "char_name": item["char_name"],
+                "log_count": item["log_count"],
+                "character_image": item["character_image"],
+            }
+            for item in dashboard["characters"] if item["log_count"] > 0
+        ][:3]
+
+        if not top_characters:
+            return {"message": "사용 기록이 있는 캐릭터가 없습니다."}
 
         return top_characters
 
@@ -1470,33 +1874,13 @@ def get_top3_fields(user_idx: int, db: Session = Depends(get_db)):
     특정 사용자가 생성한 캐릭터들이 속한 필드 TOP 3를 반환하는 API.
     """
     try:
-        # 필드별 캐릭터 수 집계 쿼리
-        query = (
-            db.query(
-                DBField.field_idx,
-                DBField.field_category,
-                func.count(Character.char_idx).label("char_count")
-            )
-            .join(Character, Character.field_idx == DBField.field_idx)
-            .filter(Character.character_owner == user_idx)
-            .group_by(DBField.field_idx, DBField.field_category)
-            .order_by(func.count(Character.char_idx).desc())
-            .limit(3)
-        )
-
-        # 쿼리 실행
-        results = query.all()
+        # 제작자 대시보드 집계의 필드 분포 (캐릭터 수 내림차순)
+        top_fields = load_creator_dashboard(db, user_idx)["fields"][:3]
 
         # 결과가 없을 때 메시지 처리
-        if not results:
+        if not top_fields:
             return {"message": "사용자가 생성한 캐릭터가 속한 필드가 없습니다."}
 
-        # 결과 리스트 생성
-        top_fields = [
-            {"field_idx": field_idx, "field_category": field_category, "char_count": char_count}
-            for field_idx, field_category, char_count in results
-        ]
-
         return {"top_fields": top_fields}
 
     except Exception as e:
@@ -1509,29 +1893,13 @@ def get_top3_tags(user_idx: int, db: Session = Depends(get_db)):
     특정 사용자가 생성한 캐릭터들의 태그 TOP 3를 반환하는 API.
     """
     try:
-        # 태그별 사용 횟수 집계 쿼리
-        query = (
-            db.query(
-                Tag.tag_name,
-                func.count(Tag.tag_idx).label("tag_count")
-            )
-            .join(Character, Character.char_idx == Tag.char_idx)
-            .filter(Character.character_owner == user_idx, Tag.is_deleted == False)
-            .group_by(Tag.tag_name)
-            .order_by(func.count(Tag.tag_idx).desc())
-            .limit(3)
-        )
-
-        # 쿼리 실행
-        results = query.all()
+        # 제작자 대시보드 집계의 태그 분포 (사용 횟수 내림차순)
+        top_tags = load_creator_dashboard(db, user_idx)["tags"][:3]
 
         # 결과가 없을 때 메시지 처리
-        if not results:
+        if not top_tags:
             return {"message": "사용자가 생성한 캐릭터에 연결된 태그가 없습니다."}
 
-        # 결과 리스트 생성
-        top_tags = [{"tag_name": tag_name, "tag_count": tag_count} for tag_name, tag_count in results]
-
         return {"top_tags": top_tags}
 
     except Exception as e:
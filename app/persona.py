@@ -0,0 +1,37 @@
+import json
+import re
+
+# 호칭 정보가 없을 때 사용하는 기본값
+DEFAULT_NICKNAMES = {'30': '', '70': '', '100': ''}
+
+
+def clean_json_string(json_string):
+    if not json_string:
+        return json_string
+    return re.sub(r'[\x00-\x1F\x7F]', '', json_string)
+
+
+def build_persona_payload(chat, prompt, character) -> dict:
+    """
+    채팅방, 캐릭터 프롬프트, 캐릭터 정보로 LangChain 서버에 보낼 페르소나 데이터를 생성.
+    턴마다 바뀌는 user_message, favorability, chat_history는 포함하지 않음.
+    """
+    if prompt:
+        example_dialogues = [json.loads(clean_json_string(dialogue)) if dialogue else {} for dialogue in prompt.example_dialogues] if prompt.example_dialogues else []
+        nicknames = json.loads(character.nicknames) if character.nicknames else dict(DEFAULT_NICKNAMES)
+    else:
+        # 기본값 설정
+        example_dialogues = []
+        nicknames = dict(DEFAULT_NICKNAMES)
+
+    return {
+        "character_name": character.char_name, # 캐릭터 이름
+        "nickname": nicknames, # 호감도에 따른 호칭 명
+        "user_unique_name": chat.user_unique_name, # 캐릭터가 사용자에게 부르는 이름 (nickname보다 우선순위)
+        "user_introduction": chat.user_introduction, # 캐릭터한테 사용자를 소개하는 글
+        "character_appearance": prompt.character_appearance if prompt else "", # 캐릭터 외형
+        "character_personality": prompt.character_personality if prompt else "", # 캐릭터 성격
+        "character_background": prompt.character_background if prompt else "", # 캐릭터 배경
+        "character_speech_style": prompt.character_speech_style if prompt else "", # 캐릭터 말투
+        "example_dialogues": example_dialogues, # 예시 대화
+    }
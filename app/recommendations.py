@@ -0,0 +1,359 @@
+"""
+비슷한 캐릭터 추천.
+
+캐릭터 설명, 최신 프롬프트의 페르소나 필드, 태그를 이어 붙인 문서를 문자 n-gram TF-IDF 벡터로 만들고
+(형태소 분석 없이 한국어에도 동작) 코사인 유사도 top-K 를 character_similarities 에 저장합니다.
+- rebuild_similarities : 전체 재계산. 유사도 행렬은 블록 단위 희소 행렬 곱으로 계산해 메모리를 제한
+                         API 워커마다 돌지 않도록 cron 등에서 `python recommendations.py rebuild` 로 실행하고
+                         (RECOMMENDATION_REBUILD_INTERVAL 을 설정하면 API 프로세스에서도 주기 실행),
+                         동시에 실행되면 advisory lock 을 얻은 하나만 계산
+- add_character        : 새 캐릭터 하나만 기존 모델로 벡터화해 이웃을 계산하고, 새 캐릭터가 더 가까운 기존 캐릭터의 목록도 갱신
+/api/characters/{char_idx}/similar 는 PK 조회 한 번과 카드 조회 한 번으로 응답합니다.
+
+학습된 벡터라이저와 벡터 행렬은 RECOMMENDATION_MODEL_PATH 에 저장해 다른 서버 프로세스와 재시작 후에도 증분 갱신에 사용합니다.
+(첫 재계산 전에는 모델이 없어 add_character 는 아무것도 하지 않음)
+
+사용법 (app 디렉토리에서 실행):
+    python recommendations.py rebuild
+"""
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime
+from dotenv import load_dotenv
+import argparse
+import threading
+import pickle
+import time
+import os
+
+from database import (
+    SessionLocal, Character, CharacterPrompt, CharacterTag, TagVocab, CharacterSimilarity, Image, ImageMapping
+)
+from storage import media_url
+
+try:
+    import numpy as np
+    from scipy import sparse
+    from sklearn.feature_extraction.text import TfidfVectorizer
+except ImportError:  # 미설치 시 저장된 추천 결과 조회만 동작
+    np = sparse = TfidfVectorizer = None
+
+# .env 파일 로드
+load_dotenv()
+
+REBUILD_INTERVAL = float(os.getenv("RECOMMENDATION_REBUILD_INTERVAL", "0"))  # 초, 0 이면 API 프로세스에서 실행하지 않음
+REBUILD_LOCK_KEY = 4702001  # pg_try_advisory_xact_lock 키 (전체 재계산은 한 번에 하나만)
+MODEL_PATH = os.getenv("RECOMMENDATION_MODEL_PATH", "recommendation_model.pkl")
+TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+NGRAM_RANGE = (2, 3)
+MAX_FEATURES = 200000
+BLOCK_CELLS = 20_000_000  # 유사도 블록 하나의 최대 원소 수 (float32 기준 약 80MB)
+MAX_PAGE_SIZE = 50
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ====== 문서 ======
+
+def load_documents(db: Session, char_ids=None) -> dict:
+    """
+    활성 캐릭터별 문서 (char_idx -> 텍스트). char_ids 가 주어지면 해당 캐릭터만.
+    """
+    latest = (
+        db.query(CharacterPrompt.char_idx, func.max(CharacterPrompt.created_at).label("latest_created_at"))
+        .group_by(CharacterPrompt.char_idx)
+    )
+    if char_ids is not None:
+        latest = latest.filter(CharacterPrompt.char_idx.in_(char_ids))
+    latest = latest.subquery()
+
+    query = (
+        db.query(
+            Character.char_idx,
+            Character.char_description,
+            CharacterPrompt.character_appearance,
+            CharacterPrompt.character_personality,
+            CharacterPrompt.character_background,
+            CharacterPrompt.character_speech_style,
+        )
+        .outerjoin(latest, latest.c.char_idx == Character.char_idx)
+        .outerjoin(
+            CharacterPrompt,
+            (CharacterPrompt.char_idx == latest.c.char_idx) &
+            (CharacterPrompt.created_at == latest.c.latest_created_at)
+        )
+        .filter(Character.is_active == True)
+        .order_by(Character.char_idx)
+    )
+    tag_query = db.query(CharacterTag.char_idx, TagVocab.tag_name).join(TagVocab, TagVocab.tag_id == CharacterTag.tag_id)
+    if char_ids is not None:
+        query = query.filter(Character.char_idx.in_(char_ids))
+        tag_query = tag_query.filter(CharacterTag.char_idx.in_(char_ids))
+
+    tags = defaultdict(list)
+    for char_idx, tag_name in tag_query.all():
+        tags[char_idx].append(tag_name)
+
+    documents = {}
+    for char_idx, *parts in query.all():
+        documents[char_idx] = "\n".join(part for part in [*parts, " ".join(tags.get(char_idx, []))] if part)
+    return documents
+
+
+# ====== 모델 ======
+
+class SimilarityModel:
+    """
+    학습된 벡터라이저와 캐릭터 벡터(행 = char_ids 순서, L2 정규화된 희소 행렬).
+    """
+
+    def __init__(self, vectorizer, matrix, char_ids):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.char_ids = list(char_ids)
+
+    def save(self, path: str = MODEL_PATH):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump((self.vectorizer, self.matrix, self.char_ids), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)  # 다른 프로세스가 쓰다 만 파일을 읽지 않도록 교체
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH):
+        with open(path, "rb") as f:
+            return cls(*pickle.load(f))
+
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """
+    메모리의 모델. 파일이 더 최근에 저장되었으면 (다른 프로세스의 재계산) 다시 읽음. 없으면 None.
+    """
+    global _model, _model_mtime
+    try:
+        mtime = os.path.getmtime(MODEL_PATH)
+    except OSError:
+        return _model
+    if _model is None or mtime != _model_mtime:
+        _model = SimilarityModel.load(MODEL_PATH)
+        _model_mtime = mtime
+    return _model
+
+
+def set_model(model: SimilarityModel):
+    global _model, _model_mtime
+    model.save(MODEL_PATH)
+    _model = model
+    _model_mtime = os.path.getmtime(MODEL_PATH)
+
+
+def top_k(scores, exclude: int, k: int = TOP_K):
+    """
+    유사도 벡터에서 exclude 위치를 뺀 상위 k 개의 (위치, 점수). 점수 0 이하는 제외.
+    """
+    scores = scores.copy()
+    if exclude is not None:
+        scores[exclude] = -1.0
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    candidates = candidates[np.argsort(-scores[candidates])]
+    return [(int(position), float(scores[position])) for position in candidates if scores[position] > 0]
+
+
+def neighbor_rows(char_ids, matrix):
+    """
+    행 블록별로 matrix @ matrix.T 를 계산해 (char_idx, [[이웃 char_idx, 점수], ...]) 를 반환.
+    """
+    total = matrix.shape[0]
+    block = max(1, BLOCK_CELLS // max(total, 1))
+    transposed = matrix.T.tocsc()
+    for start in range(0, total, block):
+        scores = (matrix[start:start + block] @ transposed).toarray().astype(np.float32)
+        for offset, row in enumerate(scores):
+            position = start + offset
+            yield char_ids[position], [
+                [char_ids[neighbor], round(score, 4)] for neighbor, score in top_k(row, position)
+            ]
+
+
+def save_neighbors(db: Session, rows):
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(CharacterSimilarity, [
+        {"char_idx": char_idx, "neighbors": neighbors, "updated_at": now} for char_idx, neighbors in rows
+    ])
+
+
+def rebuild_similarities(db: Session = None) -> int:
+    """
+    전체 활성 캐릭터의 유사도 top-K 를 다시 계산. 저장한 캐릭터 수를 반환.
+    """
+    if TfidfVectorizer is None:
+        print("scikit-learn / numpy / scipy 가 설치되지 않아 추천을 계산할 수 없습니다.")
+        return 0
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        # 다른 워커 / cron 이 재계산 중이면 건너뜀 (잠금은 트랜잭션이 끝날 때 풀림)
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REBUILD_LOCK_KEY}).scalar():
+            print("다른 프로세스에서 추천을 재계산하고 있어 건너뜁니다.")
+            return 0
+        started = time.perf_counter()
+        documents = load_documents(db)
+        if not documents:
+            return 0
+        char_ids = list(documents)
+        vectorizer = TfidfVectorizer(
+            analyzer="char_wb", ngram_range=NGRAM_RANGE, sublinear_tf=True, max_features=MAX_FEATURES, dtype=np.float32
+        )
+        matrix = vectorizer.fit_transform([documents[char_idx] for char_idx in char_ids]).tocsr()
+
+        # 읽는 쪽은 커밋 전까지 이전 결과를 봄
+        db.query(CharacterSimilarity).delete(synchronize_session=False)
+        batch = []
+        for row in neighbor_rows(char_ids, matrix):
+            batch.append(row)
+            if len(batch) >= 1000:
+                save_neighbors(db, batch)
+                batch.clear()
+        save_neighbors(db, batch)
+        db.commit()
+
+        with _model_lock:
+            set_model(SimilarityModel(vectorizer, matrix, char_ids))
+        print(f"추천 재계산: 캐릭터 {len(char_ids)}개, {time.perf_counter() - started:.1f}초")
+        return len(char_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+def add_character(char_idx: int):
+    """
+    새 캐릭터의 이웃을 기존 모델로 계산 (전체 재계산 없음). 캐릭터 생성 후 BackgroundTasks 로 실행.
+    새 캐릭터가 기존 캐릭터의 top-K 에 들어가는 경우 해당 캐릭터의 목록도 갱신합니다.
+    모델이 아직 없거나 이미 포함된 캐릭터면 다음 재계산에 맡김.
+    """
+    if TfidfVectorizer is None:
+        return
+    db = SessionLocal()
+    try:
+        with _model_lock:
+            model = get_model()
+            if model is None or char_idx in model.char_ids:
+                return
+            documents = load_documents(db, [char_idx])
+            if char_idx not in documents:
+                return
+
+            vector = model.vectorizer.transform([documents[char_idx]]).tocsr()
+            scores = (model.matrix @ vector.T).toarray().ravel().astype(np.float32)
+            neighbors = [[model.char_ids[position], round(score, 4)] for position, score in top_k(scores, None)]
+
+            # 새 캐릭터와 가까운 기존 캐릭터 목록에 끼워 넣기
+            affected = {model.char_ids[position]: score for position, score in top_k(scores, None, TOP_K * 5)}
+            now = datetime.utcnow()
+            if affected:
+                rows = (
+                    db.query(CharacterSimilarity)
+                    .filter(CharacterSimilarity.char_idx.in_(list(affected)))
+                    .with_for_update()
+                    .all()
+                )
+                for row in rows:
+                    score = round(affected[row.char_idx], 4)
+                    current = [pair for pair in row.neighbors if pair[0] != char_idx]
+                    if len(current) >= TOP_K and current[-1][1] >= score:
+                        continue
+                    current.append([char_idx, score])
+                    current.sort(key=lambda pair: -pair[1])
+                    row.neighbors = current[:TOP_K]  # JSON 컬럼은 새 객체를 대입해야 변경으로 인식
+                    row.updated_at = now
+
+            db.merge(CharacterSimilarity(char_idx=char_idx, neighbors=neighbors, updated_at=now))
+            db.commit()
+
+            model.matrix = sparse.vstack([model.matrix, vector], format="csr")
+            model.char_ids.append(char_idx)
+            set_model(model)
+    except Exception as e:
+        db.rollback()
+        print(f"추천 증분 갱신 실패 (char_idx={char_idx}): {e}")
+    finally:
+        db.close()
+
+
+# ====== API ======
+
+@router.get("/api/characters/{char_idx}/similar", response_model=dict)
+def get_similar_characters(
+    char_idx: int,
+    limit: int = Query(default=10, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    비슷한 캐릭터 목록 (유사도 내림차순). 아직 계산되지 않은 캐릭터는 빈 목록.
+    """
+    neighbors = (
+        db.query(CharacterSimilarity.neighbors)
+        .filter(CharacterSimilarity.char_idx == char_idx)
+        .scalar()
+    ) or []
+    scores = dict((neighbor, score) for neighbor, score in neighbors)
+    # 삭제된 캐릭터를 건너뛰어도 limit 을 채우도록 여유 있게 조회
+    candidate_ids = [neighbor for neighbor, _ in neighbors[:limit * 2]]
+
+    rows = []
+    if candidate_ids:
+        rows = (
+            db.query(Character.char_idx, Character.char_name, Character.char_description, Character.field_idx, Image.file_path)
+            .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+            .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+            .filter(Character.char_idx.in_(candidate_ids), Character.is_active == True)
+            .all()
+        )
+    rows.sort(key=lambda row: -scores[row.char_idx])
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    items = [
+        {
+            "char_idx": similar_idx,
+            "char_name": char_name,
+            "char_description": char_description,
+            "field_idx": field_idx,
+            "character_image": media_url(base_url, image_path),
+            "score": scores[similar_idx],
+        }
+        for similar_idx, char_name, char_description, field_idx, image_path in rows[:limit]
+    ]
+    return {"char_idx": char_idx, "items": items}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="비슷한 캐릭터 추천")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+    rebuild_similarities()
@@ -0,0 +1,329 @@
+"""
+채팅방 시나리오.
+
+채팅방(chat_id)마다 활성 시나리오(scenario) 하나와 그 프롬프트(scenario_prompts, JSON)를 두고,
+LangChain 요청에 scenario_title / scenario_prompt 로 넣습니다.
+
+채팅 요청마다 조인과 JSON 변환을 하지 않도록 두 단계로 캐싱합니다.
+- chat_id -> (scenario_prompt_id, updated_at) : SCENARIO_CACHE_TTL 초 동안 유지, 이 서버의 시나리오 수정 API 는 바로 무효화
+- (scenario_prompt_id, updated_at) -> 변환된 요청 데이터 : 프롬프트가 수정되면 updated_at 이 바뀌어 키가 달라지므로 무효화가 필요 없음
+
+사용법 (app 디렉토리에서 실행):
+    python scenario.py migrate   # 활성 시나리오 / 프롬프트 조회용 인덱스 생성
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+from dotenv import load_dotenv
+import argparse
+import threading
+import time
+import json
+import os
+
+from database import SessionLocal, engine, Scenario, ScenarioPrompt, ChatRoom
+
+# .env 파일 로드
+load_dotenv()
+
+SCENARIO_CACHE_TTL = float(os.getenv("SCENARIO_CACHE_TTL", "30"))  # 초 (다른 서버 프로세스의 수정이 반영되는 최대 지연)
+SCENARIO_CACHE_SIZE = int(os.getenv("SCENARIO_CACHE_SIZE", "4096"))
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ====== Pydantic 스키마 ======
+
+class CreateScenarioSchema(BaseModel):
+    scenario_title: str
+    prompt_text: Any  # 문자열, 목록 또는 {항목: 내용} 형식의 JSON
+
+class UpdateScenarioSchema(BaseModel):
+    scenario_title: Optional[str] = None
+    prompt_text: Optional[Any] = None
+
+
+# ====== 시나리오 -> 요청 데이터 변환 ======
+
+def compile_prompt_text(prompt_text) -> str:
+    """
+    scenario_prompts.prompt_text(JSON) 를 LangChain 에 보낼 문자열로 변환.
+    dict 는 "항목: 내용" 줄, list 는 항목별 한 줄, 그 외는 문자열 그대로.
+    """
+    if prompt_text is None:
+        return ""
+    if isinstance(prompt_text, str):
+        return prompt_text.strip()
+    if isinstance(prompt_text, dict):
+        return "\n".join(
+            f"{key}: {compile_prompt_text(value)}" for key, value in prompt_text.items() if value not in (None, "")
+        )
+    if isinstance(prompt_text, list):
+        return "\n".join(compile_prompt_text(item) for item in prompt_text if item not in (None, ""))
+    return json.dumps(prompt_text, ensure_ascii=False)
+
+
+def compile_scenario(scenario_title: str, prompt_text) -> dict:
+    return {
+        "scenario_title": scenario_title,  # 시나리오 제목
+        "scenario_prompt": compile_prompt_text(prompt_text),  # 시나리오 상황 설명
+    }
+
+
+# ====== 캐시 ======
+
+class ScenarioCache:
+    """
+    채팅방별 활성 시나리오 버전과 버전별 변환 결과를 캐싱. 스레드풀과 이벤트 루프에서 함께 접근하므로 잠금 사용.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._versions = OrderedDict()  # chat_id -> (만료 시각, (scenario_prompt_id, updated_at) 또는 None)
+        self._compiled = OrderedDict()  # (scenario_prompt_id, updated_at) -> 요청 데이터
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _touch(entries: OrderedDict, key, value, max_entries: int):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+
+    def lookup(self, chat_id: str):
+        """
+        (찾았는지, 요청 데이터) 를 반환. 시나리오가 없는 채팅방은 (True, {}).
+        """
+        with self._lock:
+            entry = self._versions.get(chat_id)
+            if entry is None or entry[0] < time.monotonic():
+                return False, None
+            version = entry[1]
+            if version is None:
+                return True, {}
+            payload = self._compiled.get(version)
+            if payload is None:
+                return False, None
+            self._compiled.move_to_end(version)
+            return True, payload
+
+    def get_compiled(self, version):
+        with self._lock:
+            return self._compiled.get(version)
+
+    def put(self, chat_id: str, version, payload: Optional[dict] = None):
+        with self._lock:
+            self._touch(self._versions, chat_id, (time.monotonic() + self.ttl, version), self.max_entries)
+            if version is not None and payload is not None:
+                self._touch(self._compiled, version, payload, self.max_entries)
+
+    def invalidate(self, chat_id: str):
+        with self._lock:
+            self._versions.pop(chat_id, None)
+
+
+scenario_cache = ScenarioCache(SCENARIO_CACHE_TTL, SCENARIO_CACHE_SIZE)
+
+
+def resolve_active_version(db: Session, chat_id: str):
+    """
+    채팅방의 활성 시나리오 (scenario_prompt_id, updated_at, scenario_id). 없으면 None.
+    JSON 본문은 읽지 않음.
+    """
+    return (
+        db.query(ScenarioPrompt.scenario_prompt_id, ScenarioPrompt.updated_at, Scenario.scenario_id)
+        .join(Scenario, Scenario.scenario_id == ScenarioPrompt.scenario_id)
+        .filter(Scenario.chat_id == chat_id, Scenario.is_active == True)
+        .order_by(Scenario.created_at.desc(), ScenarioPrompt.updated_at.desc(), ScenarioPrompt.scenario_prompt_id.desc())
+        .first()
+    )
+
+
+def load_scenario_payload(chat_id: str, db: Session = None) -> dict:
+    """
+    채팅방의 시나리오 요청 데이터 ({} 이면 시나리오 없음). 캐시에 없을 때만 DB 를 조회.
+    """
+    found, payload = scenario_cache.lookup(chat_id)
+    if found:
+        return payload
+
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        active = resolve_active_version(db, chat_id)
+        if active is None:
+            scenario_cache.put(chat_id, None)
+            return {}
+
+        scenario_prompt_id, updated_at, scenario_id = active
+        version = (scenario_prompt_id, updated_at)
+        payload = scenario_cache.get_compiled(version)
+        if payload is None:
+            # 버전이 바뀐 경우에만 본문을 읽어 변환
+            scenario_title, prompt_text = (
+                db.query(Scenario.scenario_title, ScenarioPrompt.prompt_text)
+                .join(ScenarioPrompt, ScenarioPrompt.scenario_id == Scenario.scenario_id)
+                .filter(ScenarioPrompt.scenario_prompt_id == scenario_prompt_id)
+                .one()
+            )
+            payload = compile_scenario(scenario_title, prompt_text)
+        scenario_cache.put(chat_id, version, payload)
+        return payload
+    finally:
+        if own_session:
+            db.close()
+
+
+def cached_scenario_payload(chat_id: str) -> Optional[dict]:
+    """
+    캐시에 있으면 요청 데이터, 없으면 None (이벤트 루프에서 DB 조회 없이 확인할 때 사용).
+    """
+    found, payload = scenario_cache.lookup(chat_id)
+    return payload if found else None
+
+
+# ====== API ======
+
+def serialize_scenario(scenario: Scenario, prompt: ScenarioPrompt) -> dict:
+    return {
+        "scenario_id": scenario.scenario_id,
+        "chat_id": scenario.chat_id,
+        "scenario_title": scenario.scenario_title,
+        "scenario_prompt_id": prompt.scenario_prompt_id if prompt else None,
+        "prompt_text": prompt.prompt_text if prompt else None,
+        "updated_at": prompt.updated_at.isoformat() if prompt and prompt.updated_at else None,
+        "is_active": scenario.is_active,
+    }
+
+
+def get_scenario_with_prompt(db: Session, scenario_id: int):
+    scenario = db.query(Scenario).filter(Scenario.scenario_id == scenario_id).first()
+    if not scenario:
+        raise HTTPException(status_code=404, detail="시나리오를 찾을 수 없습니다.")
+    prompt = (
+        db.query(ScenarioPrompt)
+        .filter(ScenarioPrompt.scenario_id == scenario_id)
+        .order_by(ScenarioPrompt.updated_at.desc(), ScenarioPrompt.scenario_prompt_id.desc())
+        .first()
+    )
+    return scenario, prompt
+
+
+@router.post("/api/chat-room/{room_id}/scenario", response_model=dict)
+def create_scenario(room_id: str, scenario: CreateScenarioSchema, db: Session = Depends(get_db)):
+    """
+    채팅방에 새 시나리오를 만들고 활성화. 기존 활성 시나리오는 비활성화됩니다.
+    """
+    try:
+        if not db.query(ChatRoom.chat_id).filter(ChatRoom.chat_id == room_id, ChatRoom.is_active == True).first():
+            raise HTTPException(status_code=404, detail="해당 채팅방 정보를 찾을 수 없습니다.")
+
+        db.query(Scenario).filter(Scenario.chat_id == room_id, Scenario.is_active == True).update(
+            {Scenario.is_active: False}, synchronize_session=False
+        )
+        new_scenario = Scenario(chat_id=room_id, scenario_title=scenario.scenario_title)
+        db.add(new_scenario)
+        db.flush()
+        new_prompt = ScenarioPrompt(scenario_id=new_scenario.scenario_id, prompt_text=scenario.prompt_text)
+        db.add(new_prompt)
+        db.commit()
+        scenario_cache.invalidate(room_id)
+
+        db.refresh(new_scenario)
+        db.refresh(new_prompt)
+        return serialize_scenario(new_scenario, new_prompt)
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error in create_scenario: {e}")
+        raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
+
+
+@router.get("/api/chat-room/{room_id}/scenario", response_model=dict)
+def get_active_scenario(room_id: str, db: Session = Depends(get_db)):
+    active = resolve_active_version(db, room_id)
+    if active is None:
+        raise HTTPException(status_code=404, detail="활성 시나리오가 없습니다.")
+    return serialize_scenario(*get_scenario_with_prompt(db, active.scenario_id))
+
+
+@router.put("/api/scenario/{scenario_id}", response_model=dict)
+def update_scenario(scenario_id: int, update: UpdateScenarioSchema, db: Session = Depends(get_db)):
+    """
+    시나리오 제목/프롬프트 수정. 프롬프트의 updated_at 이 바뀌므로 캐시된 변환 결과는 자동으로 교체됩니다.
+    """
+    try:
+        scenario, prompt = get_scenario_with_prompt(db, scenario_id)
+        now = datetime.utcnow()
+        if update.scenario_title is not None:
+            scenario.scenario_title = update.scenario_title
+        if update.prompt_text is not None:
+            if prompt:
+                prompt.prompt_text = update.prompt_text
+            else:
+                prompt = ScenarioPrompt(scenario_id=scenario_id, prompt_text=update.prompt_text)
+                db.add(prompt)
+        if prompt is not None:
+            # 제목만 바뀐 경우에도 버전(updated_at)을 올려 캐시 키를 바꿈
+            prompt.updated_at = now
+        db.commit()
+        scenario_cache.invalidate(scenario.chat_id)
+        return serialize_scenario(scenario, prompt)
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        print(f"Error in update_scenario: {e}")
+        raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
+
+
+@router.delete("/api/scenario/{scenario_id}")
+def delete_scenario(scenario_id: int, db: Session = Depends(get_db)):
+    scenario = db.query(Scenario).filter(Scenario.scenario_id == scenario_id, Scenario.is_active == True).first()
+    if not scenario:
+        raise HTTPException(status_code=404, detail="시나리오를 찾을 수 없습니다.")
+    scenario.is_active = False
+    db.commit()
+    scenario_cache.invalidate(scenario.chat_id)
+    return {"message": "시나리오가 비활성화되었습니다."}
+
+
+# ====== 마이그레이션 ======
+
+MIGRATE_SQL = [
+    "CREATE INDEX IF NOT EXISTS ix_scenario_chat_active ON scenario (chat_id) WHERE is_active = true",
+    "CREATE INDEX IF NOT EXISTS ix_scenario_prompts_scenario_id ON scenario_prompts (scenario_id)",
+]
+
+
+def migrate():
+    with engine.begin() as conn:
+        for statement in MIGRATE_SQL:
+            conn.execute(text(statement))
+    print("scenario 인덱스 생성 완료")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="채팅방 시나리오")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    migrate()
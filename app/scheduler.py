@@ -0,0 +1,38 @@
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+
+# 실행 중인 주기 작업 목록
+_tasks = []
+
+
+async def _run_periodic(name: str, interval_seconds: float, func):
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            if asyncio.iscoroutinefunction(func):
+                await func()
+            else:
+                # 동기 DB 작업이므로 스레드풀에서 실행
+                await run_in_threadpool(func)
+        except Exception as e:
+            print(f"Error in periodic job {name}: {str(e)}")
+
+
+def start_periodic_job(name: str, interval_seconds: float, func):
+    """
+    앱 이벤트 루프에서 func 를 interval_seconds 마다 실행. interval_seconds 가 0 이하면 등록하지 않음.
+    func 가 코루틴 함수면 이벤트 루프에서, 아니면 스레드풀에서 실행합니다.
+    startup 이벤트 안에서 호출해야 합니다.
+    """
+    if interval_seconds <= 0:
+        return None
+    task = asyncio.get_running_loop().create_task(_run_periodic(name, interval_seconds, func))
+    _tasks.append(task)
+    return task
+
+
+async def stop_periodic_jobs():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,309 @@
+"""
+비밀 일기 배치 생성.
+
+대화 화면을 열 때 LLM 으로 일기를 만들면 조회가 느려지므로, 배치(run_diary_batch)가 미리 만들어 둡니다.
+API 워커마다 같은 세션을 LLM 에 보내지 않도록 cron 등에서 `python secret_diary.py run` 으로 실행하고
+(DIARY_BATCH_INTERVAL 을 설정하면 API 프로세스에서도 주기 실행), 동시에 실행되면 advisory lock 을 얻은 하나만 처리합니다.
+1. 마지막 처리 시각(job_watermarks) 이후 종료된 세션 중 일기가 없는 세션을 종료 시각 순으로 가져와 채팅방별로 묶음
+2. 채팅방별 페르소나와 세션 로그를 DIARY_SESSIONS_PER_REQUEST 개씩 묶어 LangChain 서버에 요청 (동시 요청 DIARY_CONCURRENCY 개)
+3. 결과를 secret_diary 에 한 번에 INSERT (session 이 같으면 무시하므로 재실행해도 중복되지 않음)
+
+LangChain 서버 응답 형식: {"diaries": [{"session_id": ..., "content": ...}, ...]}
+(세션 하나만 보낸 요청은 {"text": ...} 도 허용)
+
+/api/chat-room/{room_id}/diary 는 chat_id 인덱스 조회 한 번으로 응답합니다.
+
+사용법 (app 디렉토리에서 실행):
+    python secret_diary.py migrate   # chat_id 컬럼 추가/채우기, session 유니크 인덱스 생성
+    python secret_diary.py run       # 배치 한 번 실행
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import os
+
+from database import SessionLocal, engine, SecretDiary, ChatRoom, ChatLog, CharacterPrompt, Character
+from chat_log_codec import read_log
+from job_watermark import db_now, get_watermark, set_watermark, try_lock_job
+from langchain_client import DIARY_WS_PATH, request_langchain
+from persona import build_persona_payload
+
+# .env 파일 로드
+load_dotenv()
+
+BATCH_INTERVAL = float(os.getenv("DIARY_BATCH_INTERVAL", "0"))  # 초, 0 이면 API 프로세스에서 실행하지 않음
+DIARY_CONCURRENCY = int(os.getenv("DIARY_CONCURRENCY", "4"))  # LangChain 동시 요청 수
+DIARY_MAX_SESSIONS = int(os.getenv("DIARY_MAX_SESSIONS", "200"))  # 한 번 실행에서 처리할 최대 세션 수
+DIARY_SESSIONS_PER_REQUEST = int(os.getenv("DIARY_SESSIONS_PER_REQUEST", "5"))  # 요청 하나에 담을 세션 수
+INGEST_LAG = timedelta(seconds=60)  # 커밋이 늦게 보이는 세션을 놓치지 않도록 최근 1분은 다음 실행에서 처리
+JOB_NAME = "secret_diary"
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# ====== 배치 ======
+
+def collect_pending_sessions(db: Session = None) -> dict:
+    """
+    일기를 만들 세션을 채팅방별 요청 단위로 묶어 반환.
+
+        {"upper": 이번 실행의 상한 시각, "truncated": 최대 개수에 걸려 남은 세션이 있는지,
+         "last_end_time": 가져온 마지막 세션의 종료 시각,
+         "requests": [{"room_id", "persona", "sessions": [{"session_id", "chat_history", "end_time"}]}]}
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        upper = db_now(db) - INGEST_LAG
+        watermark = get_watermark(db, JOB_NAME)
+
+        filters = [ChatLog.end_time <= upper, SecretDiary.diary_idx.is_(None)]
+        if watermark is not None:
+            filters.append(ChatLog.end_time > watermark)
+
+        # 일기가 없는 세션만 (anti-join)
+        rows = (
+            db.query(ChatLog.session_id, ChatLog.chat_id, ChatLog.log, ChatLog.log_body, ChatLog.end_time)
+            .outerjoin(SecretDiary, SecretDiary.session == ChatLog.session_id)
+            .filter(*filters)
+            .order_by(ChatLog.end_time, ChatLog.session_id)
+            .limit(DIARY_MAX_SESSIONS)
+            .all()
+        )
+
+        result = {
+            "upper": upper,
+            "truncated": len(rows) >= DIARY_MAX_SESSIONS,
+            "last_end_time": rows[-1].end_time if rows else None,
+            "requests": [],
+        }
+        if not rows:
+            return result
+
+        sessions_by_room = defaultdict(list)
+        for session_id, chat_id, log, log_body, end_time in rows:
+            sessions_by_room[chat_id].append({
+                "session_id": session_id,
+                "chat_history": read_log(log, log_body, db),
+                "end_time": end_time,
+            })
+
+        # 채팅방별 페르소나를 한 번에 조회 (삭제된 채팅방의 세션은 건너뜀)
+        contexts = (
+            db.query(ChatRoom, CharacterPrompt, Character)
+            .join(CharacterPrompt, ChatRoom.char_prompt_id == CharacterPrompt.char_prompt_id)
+            .join(Character, CharacterPrompt.char_idx == Character.char_idx)
+            .filter(ChatRoom.chat_id.in_(list(sessions_by_room)), ChatRoom.is_active == True)
+            .all()
+        )
+        for chat, prompt, character in contexts:
+            persona = build_persona_payload(chat, prompt, character)
+            sessions = sessions_by_room[chat.chat_id]
+            for start in range(0, len(sessions), DIARY_SESSIONS_PER_REQUEST):
+                result["requests"].append({
+                    "room_id": chat.chat_id,
+                    "persona": persona,
+                    "sessions": sessions[start:start + DIARY_SESSIONS_PER_REQUEST],
+                })
+        return result
+    finally:
+        if own_session:
+            db.close()
+
+
+def parse_diaries(response_data: dict, sessions: list) -> list:
+    """
+    LangChain 응답을 [(session_id, content)] 로 변환. 요청하지 않은 세션이나 빈 일기는 버림.
+    """
+    requested = {session["session_id"] for session in sessions}
+    diaries = response_data.get("diaries")
+    if diaries is None and len(sessions) == 1 and response_data.get("text"):
+        diaries = [{"session_id": sessions[0]["session_id"], "content": response_data["text"]}]
+
+    results = []
+    for diary in diaries or []:
+        session_id = diary.get("session_id")
+        content = (diary.get("content") or "").strip()
+        if session_id in requested and content:
+            results.append((session_id, content))
+    return results
+
+
+async def generate_for_request(request: dict, semaphore: asyncio.Semaphore) -> list:
+    request_data = {
+        **request["persona"],
+        "sessions": [
+            {"session_id": session["session_id"], "chat_history": session["chat_history"]}
+            for session in request["sessions"]
+        ],
+    }
+    async with semaphore:
+        response_data = await request_langchain(DIARY_WS_PATH, request_data, request["room_id"])
+    return parse_diaries(response_data, request["sessions"])
+
+
+def save_diaries(rows: list, watermark: datetime, db: Session = None) -> int:
+    """
+    일기를 한 번에 INSERT 하고 처리 시각을 기록. 이미 일기가 있는 세션은 무시.
+    rows: [(session_id, chat_id, content)]
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        inserted = 0
+        if rows:
+            # created_at 은 DB 기본값(CURRENT_TIMESTAMP)
+            statement = insert(SecretDiary).values([
+                {"session": session_id, "chat_id": chat_id, "content": content}
+                for session_id, chat_id, content in rows
+            ]).on_conflict_do_nothing(index_elements=["session"])
+            inserted = db.execute(statement).rowcount
+        if watermark is not None:
+            set_watermark(db, JOB_NAME, watermark)
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+async def run_diary_batch() -> int:
+    """
+    새로 종료된 세션의 비밀 일기를 생성. 저장한 일기 수를 반환.
+    """
+    # 수집 ~ 저장 동안 잠금을 잡고 있는 별도 세션 (잠금은 이 세션의 트랜잭션이 끝날 때 풀림)
+    lock_db = SessionLocal()
+    try:
+        if not await run_in_threadpool(try_lock_job, lock_db, JOB_NAME):
+            print("다른 프로세스에서 비밀 일기를 생성하고 있어 건너뜁니다.")
+            return 0
+        return await generate_pending_diaries()
+    finally:
+        await run_in_threadpool(lock_db.close)
+
+
+async def generate_pending_diaries() -> int:
+    pending = await run_in_threadpool(collect_pending_sessions)
+    requests = pending["requests"]
+
+    semaphore = asyncio.Semaphore(DIARY_CONCURRENCY)
+    results = await asyncio.gather(
+        *(generate_for_request(request, semaphore) for request in requests),
+        return_exceptions=True,
+    )
+
+    rows = []
+    failed = 0
+    unanswered_end_times = []  # 실패했거나 응답에 빠진 세션의 종료 시각
+    for request, result in zip(requests, results):
+        if isinstance(result, BaseException):
+            print(f"비밀 일기 생성 실패 (room_id={request['room_id']}): {result}")
+            failed += 1
+            result = []
+        answered = {session_id for session_id, _ in result}
+        unanswered_end_times.extend(
+            session["end_time"] for session in request["sessions"] if session["session_id"] not in answered
+        )
+        rows.extend((session_id, request["room_id"], content) for session_id, content in result)
+
+    # 다음 실행의 시작 시각: 일기를 받지 못한 세션 / 최대 개수에 걸려 남은 세션 직전까지만 진행
+    # (같은 종료 시각의 세션이 남을 수 있으므로 1µs 앞으로, 이미 일기가 있는 세션은 anti-join 으로 제외됨)
+    candidates = [pending["upper"]]
+    if unanswered_end_times:
+        candidates.append(min(unanswered_end_times) - timedelta(microseconds=1))
+    if pending["truncated"]:
+        candidates.append(pending["last_end_time"] - timedelta(microseconds=1))
+    watermark = min(candidates)
+
+    inserted = await run_in_threadpool(save_diaries, rows, watermark)
+    if requests:
+        print(f"비밀 일기 {inserted}개 저장 (요청 {len(requests)}개, 실패 {failed}개, 미응답 세션 {len(unanswered_end_times)}개)")
+    return inserted
+
+
+# ====== 조회 ======
+
+@router.get("/api/chat-room/{room_id}/diary", response_model=list)
+def get_chat_room_diaries(room_id: str, db: Session = Depends(get_db)):
+    """
+    채팅방의 비밀 일기 목록 (최신순).
+    """
+    try:
+        diaries = (
+            db.query(SecretDiary.diary_idx, SecretDiary.session, SecretDiary.content, SecretDiary.created_at)
+            .filter(SecretDiary.chat_id == room_id)
+            .order_by(SecretDiary.created_at.desc(), SecretDiary.diary_idx.desc())
+            .all()
+        )
+        return [
+            {
+                "diary_idx": diary_idx,
+                "session_id": session_id,
+                "content": content,
+                "created_at": created_at.isoformat() if created_at else None,
+            }
+            for diary_idx, session_id, content, created_at in diaries
+        ]
+    except Exception as e:
+        print(f"Error in get_chat_room_diaries: {e}")
+        raise HTTPException(status_code=500, detail=f"서버 오류: {str(e)}")
+
+
+# ====== 마이그레이션 ======
+
+MIGRATE_SQL = [
+    # chat_logs 파티션 변환 전 DB 의 session FK 제거 (모델과 동일하게)
+    "ALTER TABLE secret_diary DROP CONSTRAINT IF EXISTS secret_diary_session_fkey",
+    "ALTER TABLE secret_diary ADD COLUMN IF NOT EXISTS chat_id VARCHAR(50) REFERENCES chat_rooms(chat_id)",
+    """
+    UPDATE secret_diary d SET chat_id = l.chat_id
+    FROM chat_logs l
+    WHERE d.session = l.session_id AND d.chat_id IS NULL
+    """,
+    # 세션당 일기 하나만 남기고 정리 (가장 먼저 만든 일기 유지)
+    """
+    DELETE FROM secret_diary d USING secret_diary other
+    WHERE d.session = other.session AND d.diary_idx > other.diary_idx
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_secret_diary_session ON secret_diary (session)",
+    "CREATE INDEX IF NOT EXISTS ix_secret_diary_chat_id ON secret_diary (chat_id)",
+]
+
+
+def migrate():
+    with engine.begin() as conn:
+        for statement in MIGRATE_SQL:
+            conn.execute(text(statement))
+    print("secret_diary 마이그레이션 완료")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="비밀 일기 배치")
+    parser.add_argument("command", choices=["migrate", "run"])
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate()
+    else:
+        asyncio.run(run_diary_batch())
@@ -0,0 +1,449 @@
+"""
+업로드 파일 저장소.
+
+STORAGE_BACKEND 로 저장 위치를 고릅니다.
+- local : 서버 로컬 디스크 (기존 경로 그대로 ./uploads/characters, uploads, media)
+- s3    : S3 호환 오브젝트 스토리지 (AWS S3, 로컬 테스트용 MinIO 는 S3_ENDPOINT_URL 지정)
+
+DB 에는 "참조"를 저장합니다. 로컬은 기존과 같은 파일 경로("./uploads/characters/xxx.png"),
+S3 는 "s3://버킷/키" 이므로 로컬 시절의 행과 S3 로 옮긴 뒤의 행이 함께 있어도 동작합니다.
+
+직접 업로드 (API 서버가 파일 바이트를 받지 않음):
+1. POST /api/storage/uploads {kind, filename, content_type} -> {key, upload: {url, fields}}
+2. 클라이언트가 upload.url 로 fields + file 을 multipart POST (S3 는 presigned POST, 로컬은 /api/storage/local-upload)
+3. 캐릭터 생성/수정(image_key), 프로필 사진(image_key), 이미지 업로드(image_key) API 에 key 만 전달
+다운로드는 S3_PUBLIC_BASE_URL(공개 버킷 / CDN)이 있으면 그 주소를, 없으면 /api/storage/files/{key} 를 응답에 넣습니다.
+이 주소는 바뀌지 않고 요청 때마다 presigned GET 으로 307 리다이렉트하므로, ETag 로 재검증한 응답 본문을
+오래 가지고 있어도 만료된 주소가 남지 않습니다.
+
+사용법 (app 디렉토리에서 실행):
+    python storage.py migrate   # 로컬 캐릭터 이미지를 S3 로 올리고 images.file_path 를 s3:// 참조로 변경
+"""
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from pydantic import BaseModel
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from jose import jwt, JWTError
+import argparse
+import mimetypes
+import threading
+import shutil
+import time
+import uuid
+import os
+
+from database import SessionLocal, Image
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # 미설치 시 local 저장소만 사용 가능
+    boto3 = BotoConfig = ClientError = None
+
+# .env 파일 로드
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local | s3
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # MinIO 예: http://localhost:9000
+S3_REGION = os.getenv("S3_REGION", "ap-northeast-2")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
+S3_PUBLIC_BASE_URL = os.getenv("S3_PUBLIC_BASE_URL")  # 공개 버킷 / CDN 주소 (없으면 presigned GET)
+UPLOAD_EXPIRES = int(os.getenv("STORAGE_UPLOAD_EXPIRES", "900"))  # presigned 업로드 유효 시간 (초)
+DOWNLOAD_EXPIRES = int(os.getenv("STORAGE_DOWNLOAD_EXPIRES", "3600"))  # presigned 다운로드 유효 시간 (초)
+MAX_UPLOAD_SIZE = int(os.getenv("STORAGE_MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))  # 바이트
+SECRET_KEY = os.getenv("SECRET_KEY", "default_key")
+ALGORITHM = "HS256"
+
+S3_SCHEME = "s3://"
+UPLOAD_TOKEN_PURPOSE = "storage-upload"
+DOWNLOAD_URL_CACHE_SIZE = 10000
+
+# 업로드 종류 -> 로컬 저장 디렉토리 (기존 경로)
+LOCAL_DIRECTORIES = {
+    "characters": "./uploads/characters/",  # main.UPLOAD_DIR
+    "profiles": "uploads",  # user.UPLOAD_DIR
+    "media": "media",  # wordcloud_router.UPLOAD_DIR
+}
+
+router = APIRouter()
+
+
+def new_key(kind: str, filename: str) -> str:
+    """
+    "종류/시각_uuid.확장자" 형식의 고유한 저장 키.
+    """
+    if kind not in LOCAL_DIRECTORIES:
+        raise ValueError(f"알 수 없는 업로드 종류: {kind}")
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()[:10] or "bin"
+    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    return f"{kind}/{timestamp}_{uuid.uuid4().hex}.{extension}"
+
+
+def split_key(key: str) -> tuple:
+    """
+    저장 키 -> (종류, 파일명). 형식이 맞지 않으면 ValueError.
+    """
+    kind, _, name = (key or "").partition("/")
+    if kind not in LOCAL_DIRECTORIES or not name or name != os.path.basename(name) or name.startswith("."):
+        raise ValueError(f"잘못된 저장 키: {key}")
+    return kind, name
+
+
+def is_remote(reference: str) -> bool:
+    return bool(reference) and reference.startswith(S3_SCHEME)
+
+
+class LocalStorage:
+    """
+    서버 로컬 디스크. 직접 업로드는 서명된 토큰을 받는 /api/storage/local-upload 로 처리합니다.
+    """
+
+    name = "local"
+
+    def path_for(self, key: str) -> str:
+        kind, name = split_key(key)
+        return os.path.join(LOCAL_DIRECTORIES[kind], name)
+
+    def reference(self, key: str) -> str:
+        return self.path_for(key)
+
+    def save(self, key: str, fileobj, content_type: str = None) -> str:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        return path
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path_for(key))
+
+    def delete(self, reference: str):
+        try:
+            os.remove(reference)
+        except OSError:
+            pass
+
+    def presign_upload(self, key: str, content_type: str, base_url: str) -> dict:
+        token = jwt.encode(
+            {
+                "purpose": UPLOAD_TOKEN_PURPOSE,
+                "key": key,
+                "content_type": content_type,
+                "exp": datetime.utcnow() + timedelta(seconds=UPLOAD_EXPIRES),
+            },
+            SECRET_KEY,
+            algorithm=ALGORITHM,
+        )
+        return {"url": f"{base_url}/api/storage/local-upload", "fields": {"token": token}}
+
+    def url(self, reference: str, base_url: str):
+        # 캐릭터 이미지만 /static 으로 제공 (파일명만 저장된 값은 캐릭터 이미지로 봄)
+        directory = os.path.dirname(reference)
+        if directory and os.path.normpath(directory) != os.path.normpath(LOCAL_DIRECTORIES["characters"]):
+            return None
+        return f"{base_url}/static/{os.path.basename(reference)}"
+
+
+class S3Storage:
+    """
+    S3 호환 스토리지. 업로드는 presigned POST (크기 / Content-Type 조건 포함), 다운로드는 공개 주소 또는 presigned GET.
+    """
+
+    name = "s3"
+
+    def __init__(self):
+        if boto3 is None:
+            raise RuntimeError("boto3 가 설치되지 않아 S3 저장소를 사용할 수 없습니다.")
+        if not S3_BUCKET:
+            raise RuntimeError("S3_BUCKET 이 설정되지 않았습니다.")
+        self.bucket = S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY,
+            aws_secret_access_key=S3_SECRET_KEY,
+            # MinIO 는 path-style 주소를 사용
+            config=BotoConfig(signature_version="s3v4", s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"}),
+        )
+        # 같은 참조에 매번 새 서명을 만들지 않도록 (리다이렉트 대상의 브라우저 캐시 유지) 유효 시간의 절반까지 재사용
+        self._download_urls = OrderedDict()  # 참조 -> (생성 시각, URL)
+        self._lock = threading.Lock()
+
+    def reference(self, key: str) -> str:
+        return f"{S3_SCHEME}{self.bucket}/{key}"
+
+    @staticmethod
+    def parse_reference(reference: str) -> tuple:
+        bucket, _, key = reference[len(S3_SCHEME):].partition("/")
+        return bucket, key
+
+    def save(self, key: str, fileobj, content_type: str = None) -> str:
+        extra_args = {"ContentType": content_type} if content_type else None
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args)
+        return self.reference(key)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def delete(self, reference: str):
+        bucket, key = self.parse_reference(reference)
+        self.client.delete_object(Bucket=bucket, Key=key)
+
+    def presign_upload(self, key: str, content_type: str, base_url: str) -> dict:
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                {"Content-Type": content_type},
+                ["content-length-range", 1, MAX_UPLOAD_SIZE],
+            ],
+            ExpiresIn=UPLOAD_EXPIRES,
+        )
+
+    def url(self, reference: str, base_url: str):
+        # 응답 본문에는 만료되지 않는 주소만 넣음 (presigned GET 은 /api/storage/files 에서 리다이렉트)
+        bucket, key = self.parse_reference(reference)
+        if S3_PUBLIC_BASE_URL or bucket != self.bucket:
+            return self.download_url(reference)
+        return f"{base_url}/api/storage/files/{key}"
+
+    def download_url(self, reference: str) -> str:
+        bucket, key = self.parse_reference(reference)
+        if S3_PUBLIC_BASE_URL:
+            return f"{S3_PUBLIC_BASE_URL.rstrip('/')}/{key}"
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._download_urls.get(reference)
+            if cached is not None and now - cached[0] < DOWNLOAD_EXPIRES / 2:
+                self._download_urls.move_to_end(reference)
+                return cached[1]
+
+        url = self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=DOWNLOAD_EXPIRES
+        )
+        with self._lock:
+            self._download_urls[reference] = (now, url)
+            self._download_urls.move_to_end(reference)
+            while len(self._download_urls) > DOWNLOAD_URL_CACHE_SIZE:
+                self._download_urls.popitem(last=False)
+        return url
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(name: str = None):
+    """
+    저장소 인스턴스 (프로세스당 하나). name 이 없으면 STORAGE_BACKEND.
+    """
+    name = name or STORAGE_BACKEND
+    with _storages_lock:
+        storage = _storages.get(name)
+        if storage is None:
+            if name == "s3":
+                storage = S3Storage()
+            elif name == "local":
+                storage = LocalStorage()
+            else:
+                raise RuntimeError(f"알 수 없는 STORAGE_BACKEND: {name}")
+            _storages[name] = storage
+    return storage
+
+
+def media_url(base_url: str, reference: str):
+    """
+    저장된 참조(파일 경로 또는 s3://) -> 클라이언트가 받을 수 있는 URL. 제공할 수 없으면 None.
+    설정된 저장소와 관계없이 참조 형식으로 판단하므로 로컬 / S3 행이 섞여 있어도 됩니다.
+    """
+    if not reference:
+        return None
+    return get_storage("s3" if is_remote(reference) else "local").url(reference, base_url)
+
+
+def download_url(reference: str) -> str:
+    """
+    s3:// 참조 -> 스토리지에서 직접 받는 URL (공개 주소 또는 presigned GET). 리다이렉트 대상으로만 사용.
+    """
+    return get_storage("s3").download_url(reference)
+
+
+def save_upload(kind: str, upload: UploadFile) -> str:
+    """
+    API 로 받은 파일을 저장하고 참조를 반환 (블로킹, 비동기 핸들러에서는 run_in_threadpool 로 호출).
+    """
+    storage = get_storage()
+    return storage.save(new_key(kind, upload.filename), upload.file, upload.content_type)
+
+
+def resolve_uploaded(kind: str, key: str) -> str:
+    """
+    직접 업로드가 끝난 저장 키를 확인하고 참조를 반환 (블로킹). 없거나 종류가 다르면 400.
+    """
+    try:
+        key_kind, _ = split_key(key)
+    except ValueError:
+        key_kind = None
+    if key_kind != kind:
+        raise HTTPException(status_code=400, detail="잘못된 업로드 키입니다.")
+    storage = get_storage()
+    if not storage.exists(key):
+        raise HTTPException(status_code=400, detail="업로드된 파일을 찾을 수 없습니다.")
+    return storage.reference(key)
+
+
+async def store_image(kind: str, upload: UploadFile = None, key: str = None):
+    """
+    파일(upload) 또는 직접 업로드한 키(key) 중 주어진 것으로 참조를 반환. 둘 다 없으면 None.
+    """
+    if key:
+        return await run_in_threadpool(resolve_uploaded, kind, key)
+    if upload is not None:
+        return await run_in_threadpool(save_upload, kind, upload)
+    return None
+
+
+# ====== API ======
+
+class UploadRequest(BaseModel):
+    kind: str  # characters | profiles | media
+    filename: str
+    content_type: str
+
+
+@router.post("/api/storage/uploads", response_model=dict)
+def create_upload(request_data: UploadRequest, request: Request):
+    """
+    직접 업로드용 키와 업로드 주소 발급. 클라이언트는 upload.url 로 upload.fields 와 file 을 multipart POST 합니다.
+    """
+    if request_data.kind not in LOCAL_DIRECTORIES:
+        raise HTTPException(status_code=400, detail="알 수 없는 업로드 종류입니다.")
+    if not request_data.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="이미지 파일만 업로드할 수 있습니다.")
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
+    storage = get_storage()
+    key = new_key(request_data.kind, request_data.filename)
+    try:
+        upload = storage.presign_upload(key, request_data.content_type, base_url)
+    except Exception as e:
+        print(f"업로드 주소 발급 실패: {e}")
+        raise HTTPException(status_code=500, detail="업로드 주소를 발급하지 못했습니다.")
+    return {
+        "key": key,
+        "upload": {"method": "POST", "url": upload["url"], "fields": upload["fields"]},
+        "max_size": MAX_UPLOAD_SIZE,
+        "expires_in": UPLOAD_EXPIRES,
+    }
+
+
+@router.api_route("/api/storage/files/{key:path}", methods=["GET", "HEAD"])
+def get_file(key: str):
+    """
+    S3 에 저장된 파일을 presigned GET 으로 리다이렉트 (응답 본문에 넣는 고정 주소).
+    """
+    try:
+        split_key(key)
+        storage = get_storage("s3")
+    except (ValueError, RuntimeError):
+        raise HTTPException(status_code=404, detail="파일을 찾을 수 없습니다.")
+    # 재사용하는 서명도 유효 시간이 절반 이상 남아 있으므로 리다이렉트는 그보다 짧게 캐싱
+    return RedirectResponse(
+        storage.download_url(storage.reference(key)),
+        status_code=307,
+        headers={"Cache-Control": f"private, max-age={DOWNLOAD_EXPIRES // 4}"},
+    )
+
+
+@router.post("/api/storage/local-upload", status_code=204)
+def local_upload(token: str = Form(...), file: UploadFile = File(...)):
+    """
+    local 저장소의 직접 업로드 (S3 presigned POST 와 같은 형식).
+    """
+    if get_storage().name != "local":
+        raise HTTPException(status_code=404, detail="로컬 저장소를 사용하지 않습니다.")
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=403, detail="업로드 토큰이 유효하지 않습니다.")
+    if claims.get("purpose") != UPLOAD_TOKEN_PURPOSE:
+        raise HTTPException(status_code=403, detail="업로드 토큰이 유효하지 않습니다.")
+    if file.content_type != claims.get("content_type"):
+        raise HTTPException(status_code=400, detail="Content-Type 이 발급 요청과 다릅니다.")
+
+    storage = get_storage()
+    path = storage.path_for(claims["key"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = file.file.read(64 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                break
+            f.write(chunk)
+    if size > MAX_UPLOAD_SIZE or size == 0:
+        storage.delete(path)
+        raise HTTPException(status_code=413 if size else 400, detail="파일 크기가 허용 범위를 벗어났습니다.")
+
+
+# ====== 마이그레이션 ======
+
+def migrate(batch_size: int = 100):
+    """
+    로컬 경로인 images.file_path 의 파일을 S3 로 올리고 참조를 s3:// 로 변경 (여러 번 실행해도 됨).
+    파일이 없는 행은 건너뜁니다.
+    """
+    storage = get_storage("s3")
+    db = SessionLocal()
+    try:
+        moved = missing = 0
+        last_idx = 0
+        while True:
+            images = (
+                db.query(Image)
+                .filter(Image.img_idx > last_idx, ~Image.file_path.startswith(S3_SCHEME))
+                .order_by(Image.img_idx)
+                .limit(batch_size)
+                .all()
+            )
+            if not images:
+                break
+            for image in images:
+                last_idx = image.img_idx
+                if not os.path.isfile(image.file_path):
+                    missing += 1
+                    continue
+                key = f"characters/{os.path.basename(image.file_path)}"
+                with open(image.file_path, "rb") as f:
+                    image.file_path = storage.save(key, f, mimetypes.guess_type(image.file_path)[0])
+                moved += 1
+            db.commit()
+        print(f"이미지 {moved}개 이동, 파일 없음 {missing}개")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="업로드 파일 저장소")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    migrate()
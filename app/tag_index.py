@@ -0,0 +1,307 @@
+"""
+태그 사전과 메모리 역색인.
+
+tags 테이블은 캐릭터마다 자유 입력 tag_name 을 저장하므로 (설명 포함, 기존 API 호환용으로 유지)
+정규화된 태그 이름 사전(tag_vocab)과 캐릭터-태그 매핑(character_tags)을 함께 기록합니다.
+- set_character_tags : 캐릭터 생성/수정 트랜잭션 안에서 매핑을 교체 (커밋은 호출한 쪽)
+- TagIndex           : 태그 이름 -> 정렬된 char_idx 배열. AND / OR 조회와 페이지 나누기를 메모리에서 처리
+                       이 서버의 쓰기 API 는 커밋 후 바로 반영하고, 다른 서버 프로세스의 변경은
+                       TAG_INDEX_REFRESH_INTERVAL 마다 전체를 다시 읽어 반영
+
+사용법 (app 디렉토리에서 실행):
+    python tag_index.py migrate   # 기존 tags 로 tag_vocab / character_tags 채우기
+"""
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from dotenv import load_dotenv
+import argparse
+import threading
+import os
+import re
+
+from database import SessionLocal, engine, Character, TagVocab, CharacterTag
+
+# .env 파일 로드
+load_dotenv()
+
+REFRESH_INTERVAL = float(os.getenv("TAG_INDEX_REFRESH_INTERVAL", "300"))  # 초
+MAX_QUERY_TAGS = 10
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_tag_name(tag_name: str) -> str:
+    """
+    태그 이름 정규화: 앞의 # 제거, 공백 정리, 영문 소문자. 빈 문자열이면 "".
+    """
+    if not tag_name:
+        return ""
+    name = _WHITESPACE.sub(" ", tag_name.strip().lstrip("#").strip())
+    return name.lower()[:50]
+
+
+def normalize_tag_names(tag_names) -> list:
+    # 순서를 유지하면서 중복 / 빈 값 제거
+    return list(dict.fromkeys(name for name in map(normalize_tag_name, tag_names or []) if name))
+
+
+def get_or_create_tag_ids(db: Session, tag_names: list) -> dict:
+    """
+    정규화된 태그 이름 -> tag_id. 사전에 없는 이름은 추가.
+    """
+    if not tag_names:
+        return {}
+    db.execute(
+        insert(TagVocab)
+        .values([{"tag_name": name} for name in tag_names])
+        .on_conflict_do_nothing(index_elements=["tag_name"])
+    )
+    return dict(
+        db.query(TagVocab.tag_name, TagVocab.tag_id).filter(TagVocab.tag_name.in_(tag_names)).all()
+    )
+
+
+def set_character_tags(db: Session, char_idx: int, tag_names) -> dict:
+    """
+    캐릭터의 태그 매핑을 tag_names 로 교체하고 {정규화된 이름: tag_id} 를 반환.
+    """
+    names = normalize_tag_names(tag_names)
+    tag_ids = get_or_create_tag_ids(db, names)
+    db.query(CharacterTag).filter(CharacterTag.char_idx == char_idx).delete(synchronize_session=False)
+    if tag_ids:
+        db.bulk_insert_mappings(CharacterTag, [
+            {"char_idx": char_idx, "tag_id": tag_id} for tag_id in tag_ids.values()
+        ])
+    return tag_ids
+
+
+def _intersect(smaller, larger) -> array:
+    # 작은 배열의 각 값을 큰 배열에서 이진 탐색
+    result = array("i")
+    size = len(larger)
+    start = 0
+    for value in smaller:
+        position = bisect_left(larger, value, start, size)
+        if position == size:
+            break
+        if larger[position] == value:
+            result.append(value)
+        start = position
+    return result
+
+
+class TagIndex:
+    """
+    태그 이름 -> 활성 캐릭터 char_idx 정렬 배열 역색인. 스레드풀에서도 접근하므로 잠금을 사용합니다.
+    """
+
+    def __init__(self):
+        self._postings = {}  # 태그 이름 -> array("i") (오름차순)
+        self._tag_ids = {}  # 태그 이름 -> tag_id
+        self._character_tags = {}  # char_idx -> 태그 이름 tuple
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.synced_etag = None  # 마지막으로 맞춘 /api/tags ETag (etag.TAGS 버전)
+
+    def sync(self, db: Session, tags_etag: str):
+        """
+        /api/tags 응답 전에 호출. 다른 서버 프로세스에서 태그 버전이 바뀌었으면 색인을 다시 읽어
+        새 ETag 에 이전 본문이 캐시되지 않게 함 (버전을 먼저 읽었으므로 본문은 같거나 더 최신).
+        """
+        if self.synced_etag != tags_etag:
+            self.reload(db)
+            self.synced_etag = tags_etag
+
+    def reload(self, db: Session = None):
+        """
+        활성 캐릭터의 태그 매핑으로 색인을 다시 만듦.
+        """
+        own_session = db is None
+        db = db or SessionLocal()
+        try:
+            rows = (
+                db.query(CharacterTag.char_idx, TagVocab.tag_id, TagVocab.tag_name)
+                .join(TagVocab, TagVocab.tag_id == CharacterTag.tag_id)
+                .join(Character, Character.char_idx == CharacterTag.char_idx)
+                .filter(Character.is_active == True)
+                .order_by(CharacterTag.char_idx)
+                .all()
+            )
+        finally:
+            if own_session:
+                db.close()
+
+        postings = defaultdict(lambda: array("i"))
+        tag_ids = {}
+        character_tags = defaultdict(list)
+        for char_idx, tag_id, tag_name in rows:
+            postings[tag_name].append(char_idx)  # char_idx 순으로 읽으므로 정렬 상태 유지
+            tag_ids[tag_name] = tag_id
+            character_tags[char_idx].append(tag_name)
+
+        with self._lock:
+            self._postings = dict(postings)
+            self._tag_ids = tag_ids
+            self._character_tags = {char_idx: tuple(names) for char_idx, names in character_tags.items()}
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.reload()
+
+    def _remove_locked(self, char_idx: int):
+        for tag_name in self._character_tags.pop(char_idx, ()):
+            posting = self._postings.get(tag_name)
+            if posting is None:
+                continue
+            position = bisect_left(posting, char_idx)
+            if position < len(posting) and posting[position] == char_idx:
+                # 조회 중인 배열을 바꾸지 않도록 복사본을 만들어 교체
+                updated = posting[:position] + posting[position + 1:]
+                if updated:
+                    self._postings[tag_name] = updated
+                else:
+                    del self._postings[tag_name]
+                    self._tag_ids.pop(tag_name, None)
+
+    def set_character(self, char_idx: int, tag_ids: dict):
+        """
+        커밋 후 호출. tag_ids 는 set_character_tags 의 반환값.
+        """
+        if not self.loaded:
+            return  # 처음 조회할 때 전체를 읽으므로 그때 반영됨
+        with self._lock:
+            self._remove_locked(char_idx)
+            for tag_name, tag_id in tag_ids.items():
+                posting = self._postings.get(tag_name, array("i"))
+                position = bisect_left(posting, char_idx)
+                self._postings[tag_name] = posting[:position] + array("i", [char_idx]) + posting[position:]
+                self._tag_ids[tag_name] = tag_id
+            if tag_ids:
+                self._character_tags[char_idx] = tuple(tag_ids)
+
+    def remove_character(self, char_idx: int):
+        if not self.loaded:
+            return
+        with self._lock:
+            self._remove_locked(char_idx)
+
+    def query(self, tag_names, match_all: bool = True, offset: int = 0, limit: int = 10) -> tuple:
+        """
+        (전체 개수, 해당 페이지의 char_idx 목록) 을 반환. 최근 생성(char_idx 큰) 순.
+        match_all 이 True 면 모든 태그를 가진 캐릭터(AND), False 면 하나라도 가진 캐릭터(OR).
+        """
+        self.ensure_loaded()
+        names = normalize_tag_names(tag_names)
+        with self._lock:
+            postings = [self._postings.get(name, array("i")) for name in names]
+
+        if not postings:
+            return 0, []
+        if match_all:
+            postings.sort(key=len)
+            matched = postings[0]
+            for posting in postings[1:]:
+                if not matched:
+                    break
+                matched = _intersect(matched, posting)
+        else:
+            matched = sorted(set().union(*postings))
+
+        total = len(matched)
+        # 뒤에서부터 잘라 최신순 페이지를 만듦
+        end = total - offset
+        if end <= 0:
+            return total, []
+        start = max(end - limit, 0)
+        return total, list(reversed(matched[start:end]))
+
+    def postings(self, tag_names) -> list:
+        """
+        정규화한 태그 이름별 char_idx 정렬 배열 (교체만 되고 제자리에서 바뀌지 않으므로 잠금 밖에서 읽어도 됨).
+        """
+        self.ensure_loaded()
+        names = normalize_tag_names(tag_names)
+        with self._lock:
+            return [self._postings.get(name, array("i")) for name in names]
+
+    def count_tags(self, char_ids) -> dict:
+        """
+        char_ids 의 캐릭터들이 가진 태그별 개수 {태그 이름: 개수}.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            character_tags = self._character_tags
+        # 키 조회만 하므로 다른 스레드가 항목을 바꾸는 중이어도 안전 (순회하지 않음)
+        counts = defaultdict(int)
+        for char_idx in char_ids:
+            for tag_name in character_tags.get(char_idx, ()):
+                counts[tag_name] += 1
+        return counts
+
+    def tags(self) -> list:
+        """
+        [{tag_idx, tag_name, character_count}] (사용 캐릭터 수 내림차순).
+        """
+        self.ensure_loaded()
+        with self._lock:
+            items = [
+                {"tag_idx": self._tag_ids.get(name), "tag_name": name, "character_count": len(posting)}
+                for name, posting in self._postings.items()
+            ]
+        items.sort(key=lambda item: (-item["character_count"], item["tag_name"]))
+        return items
+
+
+tag_index = TagIndex()
+
+
+def refresh_tag_index():
+    tag_index.reload()
+
+
+# ====== 마이그레이션 ======
+
+def migrate(batch_size: int = 1000):
+    """
+    삭제되지 않은 tags 행으로 tag_vocab / character_tags 를 채움 (여러 번 실행해도 됨).
+    """
+    db = SessionLocal()
+    try:
+        rows = db.execute(text(
+            "SELECT char_idx, tag_name FROM tags WHERE is_deleted = false ORDER BY char_idx"
+        )).fetchall()
+        names_by_char = defaultdict(list)
+        for char_idx, tag_name in rows:
+            names_by_char[char_idx].append(tag_name)
+
+        tag_ids = get_or_create_tag_ids(db, normalize_tag_names(tag_name for _, tag_name in rows))
+        mappings = [
+            {"char_idx": char_idx, "tag_id": tag_ids[name]}
+            for char_idx, names in names_by_char.items()
+            for name in normalize_tag_names(names)
+        ]
+        for start in range(0, len(mappings), batch_size):
+            db.execute(
+                insert(CharacterTag)
+                .values(mappings[start:start + batch_size])
+                .on_conflict_do_nothing(index_elements=["char_idx", "tag_id"])
+            )
+        db.commit()
+        print(f"태그 사전 {len(tag_ids)}개, 매핑 {len(mappings)}개 반영")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="태그 사전 / 역색인")
+    parser.add_argument("command", choices=["migrate"])
+    args = parser.parse_args()
+    migrate()
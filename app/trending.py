@@ -0,0 +1,183 @@
+"""
+인기(trending) 캐릭터 순위.
+
+score = FOLLOWER_WEIGHT * ln(1 + follower_count) + ACTIVITY_WEIGHT * activity_score
+activity_score 는 대화 세션(chat_logs)마다 1점을 주고 반감기 HALF_LIFE_HOURS 로 감쇠시킨 합으로,
+행마다 scored_at 시각 기준 값으로 저장하고 순위를 매길 때 경과 시간만큼 감쇠시켜 사용합니다.
+
+refresh_trending 은 마지막 처리 시각(job_watermarks) 이후 종료된 세션만 읽어 해당 캐릭터의 행만 누적하고
+(기준 시각을 이번 갱신 시각으로 옮김), character_rankings.rank 를 다시 매깁니다.
+여러 워커에서 동시에 실행되면 advisory lock 을 얻은 하나만 반영합니다.
+/api/characters/trending 은 rank 인덱스 범위 조회라 페이지 크기만큼만 읽습니다.
+"""
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+import os
+
+from database import SessionLocal, Character, CharacterRanking, Image, ImageMapping
+from job_watermark import db_now, get_watermark, set_watermark, try_lock_job
+from storage import media_url
+
+# .env 파일 로드
+load_dotenv()
+
+HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "72"))
+FOLLOWER_WEIGHT = float(os.getenv("TRENDING_FOLLOWER_WEIGHT", "1.0"))
+ACTIVITY_WEIGHT = float(os.getenv("TRENDING_ACTIVITY_WEIGHT", "1.0"))
+REFRESH_INTERVAL = float(os.getenv("TRENDING_REFRESH_INTERVAL", "300"))  # 초
+INGEST_LAG = timedelta(seconds=60)  # 커밋이 늦게 보이는 세션을 놓치지 않도록 최근 1분은 다음 갱신에서 처리
+JOB_NAME = "trending"
+MAX_PAGE_SIZE = 100
+MAX_HALF_LIVES = 1000  # 오래 갱신되지 않은 행의 감쇠 지수 상한 (float underflow 방지, 0.5^1000 은 사실상 0)
+
+router = APIRouter()
+
+# DB 세션 관리
+def get_db():
+    """
+    데이터베이스 세션을 생성하고 반환.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+REFRESH_SQL = [
+    # 1. 새로 종료된 세션 점수 누적 (세션이 있는 캐릭터의 행만 갱신, 기존 값은 upper 기준으로 옮겨 더함)
+    """
+    INSERT INTO character_rankings (char_idx, activity_score, score, scored_at)
+    SELECT p.char_idx,
+           sum(power(0.5, extract(epoch FROM (CAST(:upper AS timestamp) - l.end_time)) / :half_life)),
+           0,
+           CAST(:upper AS timestamp)
+    FROM chat_logs l
+    JOIN chat_rooms r ON r.chat_id = l.chat_id
+    JOIN char_prompts p ON p.char_prompt_id = r.char_prompt_id
+    JOIN characters c ON c.char_idx = p.char_idx AND c.is_active = true
+    WHERE l.end_time > :watermark AND l.end_time <= :upper
+    GROUP BY p.char_idx
+    ON CONFLICT (char_idx) DO UPDATE
+    SET activity_score = character_rankings.activity_score
+            * power(0.5, least(extract(epoch FROM (EXCLUDED.scored_at - character_rankings.scored_at)) / :half_life, :max_half_lives))
+            + EXCLUDED.activity_score,
+        scored_at = EXCLUDED.scored_at
+    """,
+    # 2. 대화 기록이 없는 활성 캐릭터도 팔로워 점수로 순위에 포함
+    """
+    INSERT INTO character_rankings (char_idx, activity_score, score, scored_at)
+    SELECT char_idx, 0, 0, CAST(:upper AS timestamp) FROM characters WHERE is_active = true
+    ON CONFLICT (char_idx) DO NOTHING
+    """,
+    # 3. 삭제(숨김)된 캐릭터 제외
+    """
+    DELETE FROM character_rankings r
+    USING characters c
+    WHERE c.char_idx = r.char_idx AND c.is_active = false
+    """,
+    # 4. 종합 점수 및 순위 갱신
+    """
+    UPDATE character_rankings r
+    SET score = s.score, rank = s.rank
+    FROM (
+        SELECT ranked.char_idx, ranked.score,
+               row_number() OVER (ORDER BY ranked.score DESC, ranked.char_idx) AS rank
+        FROM (
+            SELECT r2.char_idx,
+                   :follower_weight * ln(1 + c.follower_count)
+                   + :activity_weight * r2.activity_score
+                     * power(0.5, least(extract(epoch FROM (CAST(:upper AS timestamp) - r2.scored_at)) / :half_life, :max_half_lives)) AS score
+            FROM character_rankings r2
+            JOIN characters c ON c.char_idx = r2.char_idx
+        ) AS ranked
+    ) AS s
+    WHERE r.char_idx = s.char_idx
+      AND (r.rank IS DISTINCT FROM s.rank OR r.score <> s.score)
+    """,
+]
+
+
+def refresh_trending(db: Session = None):
+    """
+    마지막 갱신 이후 종료된 세션만 반영해 인기 순위를 갱신.
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        if not try_lock_job(db, JOB_NAME):
+            print("다른 프로세스에서 인기 순위를 갱신하고 있어 건너뜁니다.")
+            return
+        upper = db_now(db) - INGEST_LAG
+        # 첫 실행이면 반감기 10배 기간(점수 기여가 0.1% 미만이 되는 시점)까지만 읽음
+        watermark = get_watermark(db, JOB_NAME) or upper - timedelta(hours=HALF_LIFE_HOURS * 10)
+        if watermark >= upper:
+            return
+
+        params = {
+            "upper": upper,
+            "watermark": watermark,
+            "half_life": HALF_LIFE_HOURS * 3600,
+            "max_half_lives": MAX_HALF_LIVES,
+            "follower_weight": FOLLOWER_WEIGHT,
+            "activity_weight": ACTIVITY_WEIGHT,
+        }
+        for sql in REFRESH_SQL:
+            db.execute(text(sql), params)
+        set_watermark(db, JOB_NAME, upper)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+
+# 인기 캐릭터 목록 조회 API
+@router.get("/api/characters/trending", response_model=dict)
+def get_trending_characters(
+    page: int = Query(default=1, ge=1),
+    size: int = Query(default=20, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    request: Request = None
+):
+    """
+    인기 순위대로 캐릭터를 페이지 단위로 반환합니다.
+    """
+    first_rank = (page - 1) * size + 1
+    rows = (
+        db.query(CharacterRanking.rank, CharacterRanking.score, Character, Image.file_path)
+        .join(Character, Character.char_idx == CharacterRanking.char_idx)
+        .outerjoin(ImageMapping, ImageMapping.char_idx == Character.char_idx)
+        .outerjoin(Image, Image.img_idx == ImageMapping.img_idx)
+        .filter(
+            CharacterRanking.rank >= first_rank,
+            CharacterRanking.rank < first_rank + size,
+            Character.is_active == True
+        )
+        .order_by(CharacterRanking.rank)
+        .all()
+    )
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}" if request else ""
+    items = []
+    for rank, score, char, image_path in rows:
+        image_url = media_url(base_url, image_path)
+        items.append({
+            "rank": rank,
+            "score": score,
+            "char_idx": char.char_idx,
+            "char_name": char.char_name,
+            "char_description": char.char_description,
+            "created_at": char.created_at.isoformat(),
+            "field_idx": char.field_idx,
+            "character_owner": char.character_owner,
+            "follower_count": char.follower_count,
+            "character_image": image_url,
+        })
+
+    return {"page": page, "size": size, "items": items}
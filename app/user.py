@@ -3,7 +3,7 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import Optional, List
@@ -14,6 +14,7 @@ from fastapi.security import OAuth2PasswordBearer
 import os
 import shutil
 from database import SessionLocal, User
+import storage
 from dotenv import load_dotenv
 
 
@@ -218,23 +219,25 @@ def delete_user(user_id: str, db: Session = Depends(get_db)):
 @router.post("/upload-profile-img/{user_id}/", response_model=dict)
 def upload_profile_img(
     user_id: str,
-    file: UploadFile = File(...),
+    file: Optional[UploadFile] = File(None),
+    image_key: Optional[str] = Form(None),
     db: Session = Depends(get_db),
 ):
+    # 파일(file) 또는 /api/storage/uploads 로 직접 업로드한 키(image_key) 로 전달
+    if not file and not image_key:
+        raise HTTPException(status_code=400, detail="프로필 사진이 필요합니다.")
     try:
-        # 업로드 디렉토리 생성
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-        # 파일 저장 경로 설정
-        file_location = f"{UPLOAD_DIR}/{file.filename}"
-        with open(file_location, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-
         # 사용자 조회
         user = db.query(User).filter(User.user_id == user_id).first()
         if not user:
             raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다!")
 
+        # 파일 저장 (설정된 저장소: 로컬 디스크 또는 S3)
+        if image_key:
+            file_location = storage.resolve_uploaded("profiles", image_key)
+        else:
+            file_location = storage.save_upload("profiles", file)
+
         # 사용자 프로필 사진 업데이트
         user.profile_img = file_location
         db.commit()
@@ -242,6 +245,8 @@ def upload_profile_img(
 
         # 성공 메시지 반환
         return {"message": f"사용자의 프로필 사진이 저장되었습니다.", "profile_img": file_location}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"파일 업로드 중 오류: {e}")  # 디버깅용 로그
         raise HTTPException(status_code=500, detail=f"파일 업로드 실패: {str(e)}")
@@ -249,7 +254,7 @@ def upload_profile_img(
 
 
 @router.get("/get-profile-img/{user_id}/", response_model=dict)
-def get_profile_img(user_id: str, db: Session = Depends(get_db)):
+def get_profile_img(user_id: str, request: Request, db: Session = Depends(get_db)):
     try:
         # 사용자 조회
         user = db.query(User).filter(User.user_id == user_id).first()
@@ -264,6 +269,8 @@ def get_profile_img(user_id: str, db: Session = Depends(get_db)):
         return {
             "message": "사용자의 프로필 사진을 조회했습니다.",
             "profile_img": user.profile_img,
+            # S3 에 저장된 경우 다운로드 URL (공개 주소 또는 presigned GET)
+            "profile_img_url": storage.media_url(str(request.base_url).rstrip("/"), user.profile_img),
         }
     except Exception as e:
         print(f"프로필 사진 조회 중 오류: {e}")  # 디버깅용 로그